@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'discord_rewards.settings')
 
-application = get_asgi_application()
+# What get_asgi_application() does, with the handler from rewards.asgi,
+# which serves the dashboard's event streams without a thread each.
+django.setup(set_prefix=False)
+
+from rewards.asgi import ASGIHandler  # noqa: E402
+
+application = ASGIHandler()
@@ -4,7 +4,7 @@ Django settings for discord_rewards project.
 
 from pathlib import Path
 import os
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -35,8 +35,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'rewards.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'rewards.middleware.ReplicaPinMiddleware',
+    'rewards.middleware.SlidingSessionMiddleware',
+    'rewards.middleware.DiscordUserMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -67,14 +71,83 @@ WSGI_APPLICATION = 'discord_rewards.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
+# SQLite by default. Set DB_ENGINE=postgresql (plus DB_NAME, DB_USER, ...) in
+# production, which needs `pip install "psycopg[binary]"`.
+#
+# Under ASGI (discord_rewards.asgi, the way this app is served) Django 4.2
+# runs each request's database work on a thread of its own, and connections
+# belong to threads, so a persistent connection is never reused: it is left
+# open when its thread exits. Keep DB_CONN_MAX_AGE at 0 there and pool on
+# the server side (pgbouncer in transaction mode for PostgreSQL). Only a WSGI
+# deployment, with long-lived worker threads, benefits from a higher value.
+
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME', default='discord_rewards'),
+            'USER': config('DB_USER', default=''),
+            'PASSWORD': config('DB_PASSWORD', default=''),
+            'HOST': config('DB_HOST', default=''),
+            'PORT': config('DB_PORT', default=''),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+        }
+    }
 
-DATABASES = {
+DATABASES['default'].update({
+    'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=0, cast=int),  # seconds; 0 closes at the end of each request
+    'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+})
+
+# Read replicas (rewards.routers): catalog reads go to DB_REPLICAS, given as
+# comma-separated hosts for PostgreSQL or database files for SQLite (opened
+# read-only), reachable as the aliases replica_0, replica_1, ...
+DB_REPLICAS = config('DB_REPLICAS', default='', cast=Csv())
+for index, location in enumerate(DB_REPLICAS):
+    replica = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    if DB_ENGINE == 'postgresql':
+        replica['HOST'] = location
+    else:
+        replica.update(NAME=f'file:{location}?mode=ro', OPTIONS={'uri': True})
+    DATABASES[f'replica_{index}'] = replica
+DB_REPLICA_ALIASES = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['rewards.routers.ReplicaRouter']
+DB_REPLICA_PIN_SECONDS = config('DB_REPLICA_PIN_SECONDS', default=5, cast=int)  # primary-only reads after a write
+DB_REPLICA_RETRY_SECONDS = config('DB_REPLICA_RETRY_SECONDS', default=30, cast=int)  # before retrying a failed replica
+
+# SQLite only: WAL journal, busy_timeout and synchronous=NORMAL on every new
+# connection (rewards.db), so readers don't block the writer.
+SQLITE_TUNED = config('SQLITE_TUNED', default=True, cast=bool)
+SQLITE_BUSY_TIMEOUT = config('SQLITE_BUSY_TIMEOUT', default=5000, cast=int)  # milliseconds
+SQLITE_LOCK_RETRIES = config('SQLITE_LOCK_RETRIES', default=3, cast=int)  # redemptions re-run after a busy timeout
+
+
+# Cache
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at a shared
+# backend (e.g. django.core.cache.backends.redis.RedisCache and
+# redis://127.0.0.1:6379) when running several processes or servers.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='discord-rewards'),
     }
 }
 
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=3600, cast=int)  # seconds; edits invalidate immediately
+RANKINGS_CACHE_TIMEOUT = config('RANKINGS_CACHE_TIMEOUT', default=60, cast=int)  # seconds computed ranks may lag
+USER_CACHE_TIMEOUT = config('USER_CACHE_TIMEOUT', default=900, cast=int)  # seconds; saves invalidate immediately
+LEADERBOARD_CACHE_TIMEOUT = config('LEADERBOARD_CACHE_TIMEOUT', default=86400, cast=int)  # seconds; edits invalidate immediately
+REWARD_STOCK_CACHE_TIMEOUT = config('REWARD_STOCK_CACHE_TIMEOUT', default=5, cast=int)  # seconds displayed stock may lag
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -126,11 +199,27 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 DISCORD_CLIENT_ID = config('DISCORD_CLIENT_ID', default='')
 DISCORD_CLIENT_SECRET = config('DISCORD_CLIENT_SECRET', default='')
 DISCORD_REDIRECT_URI = config('DISCORD_REDIRECT_URI', default='http://localhost:8000/auth/discord/callback/')
-DISCORD_API_BASE_URL = 'https://discord.com/api'
+DISCORD_API_BASE_URL = config('DISCORD_API_BASE_URL', default='https://discord.com/api')
+
+# Discord HTTP client (rewards.discord_api)
+DISCORD_CONNECT_TIMEOUT = config('DISCORD_CONNECT_TIMEOUT', default=3.05, cast=float)  # seconds
+DISCORD_READ_TIMEOUT = config('DISCORD_READ_TIMEOUT', default=10.0, cast=float)  # seconds
+DISCORD_MAX_RETRIES = config('DISCORD_MAX_RETRIES', default=2, cast=int)
+DISCORD_RETRY_BACKOFF = config('DISCORD_RETRY_BACKOFF', default=0.5, cast=float)  # seconds, doubled per retry
+DISCORD_MAX_RATE_LIMIT_WAIT = config('DISCORD_MAX_RATE_LIMIT_WAIT', default=5.0, cast=float)  # fail rather than wait longer on a 429
+DISCORD_POOL_SIZE = config('DISCORD_POOL_SIZE', default=20, cast=int)  # keep-alive connections per process
 
 # Session settings
+# Signed cookies keep the session (user_id, discord_id) client-side, so reads
+# and writes never touch the database. Use
+# django.contrib.sessions.backends.cache for server-side sessions on a
+# shared cache; with a database backend run `manage.py clearsessions` daily.
+SESSION_ENGINE = config('SESSION_ENGINE', default='django.contrib.sessions.backends.signed_cookies')
 SESSION_COOKIE_AGE = 86400  # 24 hours
-SESSION_SAVE_EVERY_REQUEST = True
+# Sliding expiry is handled by rewards.middleware.SlidingSessionMiddleware,
+# which re-saves a session only once it is older than this fraction of its age.
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_REFRESH_FRACTION = config('SESSION_REFRESH_FRACTION', default=0.5, cast=float)
 
 # Email settings (for admin notifications on redemptions)
 ADMIN_EMAIL = config('ADMIN_EMAIL', default='')  # Admin email to receive redemption notifications
@@ -141,3 +230,109 @@ EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@discord-rewards.local')
+
+# Notification outbox (delivered by `python manage.py dispatch_notifications`)
+NOTIFICATION_BATCH_SIZE = config('NOTIFICATION_BATCH_SIZE', default=100, cast=int)
+NOTIFICATION_MAX_ATTEMPTS = config('NOTIFICATION_MAX_ATTEMPTS', default=8, cast=int)
+NOTIFICATION_RETRY_BACKOFF = config('NOTIFICATION_RETRY_BACKOFF', default=30, cast=int)  # seconds, doubled per attempt
+NOTIFICATION_LEASE_SECONDS = config('NOTIFICATION_LEASE_SECONDS', default=300, cast=int)
+
+# Redemption notification mode: 'immediate' sends one email per redemption,
+# 'digest' sends one summary per REDEMPTION_DIGEST_WINDOW seconds (or sooner
+# once REDEMPTION_DIGEST_MAX_REDEMPTIONS are pending; 0 disables that trigger).
+REDEMPTION_NOTIFICATION_MODE = config('REDEMPTION_NOTIFICATION_MODE', default='immediate')
+REDEMPTION_DIGEST_WINDOW = config('REDEMPTION_DIGEST_WINDOW', default=900, cast=int)
+REDEMPTION_DIGEST_MAX_REDEMPTIONS = config('REDEMPTION_DIGEST_MAX_REDEMPTIONS', default=0, cast=int)
+
+# Redeem API protection (rewards.ratelimit, rewards.coalesce). Token buckets
+# per user and per client IP: BURST redemptions at once, refilled at RATE per
+# second; a rate of 0 turns a bucket off. Buckets live in the cache, so use
+# a shared CACHE_BACKEND to limit across processes. With REDEEM_COALESCE,
+# identical redeem requests already in flight in a process share one result.
+REDEEM_RATE = config('REDEEM_RATE', default=1.0, cast=float)  # per second, per user
+REDEEM_BURST = config('REDEEM_BURST', default=5, cast=int)
+REDEEM_IP_RATE = config('REDEEM_IP_RATE', default=5.0, cast=float)  # per second, per IP (NATs share one)
+REDEEM_IP_BURST = config('REDEEM_IP_BURST', default=30, cast=int)
+REDEEM_COALESCE = config('REDEEM_COALESCE', default=True, cast=bool)
+
+# Scheduled drops (rewards.waitingroom; POST /api/drops/<id>/queue/). A reward
+# with available_from is redeemed through a waiting room: ADMISSION_BURST
+# members are admitted when it opens and ADMISSION_RATE per second after that
+# (0 admits everyone at once), each with a signed token that redeem requires.
+# The ticket counter lives in the cache, so use a shared CACHE_BACKEND with
+# several processes.
+DROP_ADMISSION_RATE = config('DROP_ADMISSION_RATE', default=50.0, cast=float)  # members per second
+DROP_ADMISSION_BURST = config('DROP_ADMISSION_BURST', default=50, cast=int)
+DROP_ADMISSION_TTL = config('DROP_ADMISSION_TTL', default=300, cast=int)  # seconds an admission token is valid
+DROP_POLL_SECONDS = config('DROP_POLL_SECONDS', default=5, cast=int)  # longest wait between queue polls
+DROP_QUEUE_TIMEOUT = config('DROP_QUEUE_TIMEOUT', default=86400, cast=int)  # seconds a queue ticket is kept
+
+# Live dashboard updates (rewards.events; GET /api/events/, served under
+# discord_rewards.asgi). LocalBroker only reaches the streams of its own
+# process; with several processes or nodes use rewards.events.CacheBroker
+# and a shared CACHE_BACKEND.
+EVENTS_BROKER = config('EVENTS_BROKER', default='rewards.events.LocalBroker')
+EVENTS_QUEUE_SIZE = config('EVENTS_QUEUE_SIZE', default=100, cast=int)  # events a stream may fall behind before it is closed
+EVENTS_KEEPALIVE_SECONDS = config('EVENTS_KEEPALIVE_SECONDS', default=30, cast=float)  # comment line sent on idle streams
+EVENTS_STREAM_SECONDS = config('EVENTS_STREAM_SECONDS', default=600, cast=float)  # streams close and the browser reconnects
+EVENTS_RETRY_MS = config('EVENTS_RETRY_MS', default=3000, cast=int)  # browser reconnect delay
+EVENTS_POLL_INTERVAL = config('EVENTS_POLL_INTERVAL', default=0.2, cast=float)  # seconds; CacheBroker only
+EVENTS_CACHE_TIMEOUT = config('EVENTS_CACHE_TIMEOUT', default=60, cast=int)  # seconds; CacheBroker only
+
+# Limited-stock rewards (rewards.stock): remaining units are split over this
+# many rows so concurrent redemptions don't all wait on one row lock.
+REWARD_STOCK_SHARDS = config('REWARD_STOCK_SHARDS', default=8, cast=int)
+
+# Reward code pools (rewards.codes; `manage.py import_codes` or the reward's
+# "Upload codes" admin page).
+CODE_IMPORT_CHUNK_SIZE = config('CODE_IMPORT_CHUNK_SIZE', default=5000, cast=int)  # codes per transaction
+
+# Bulk key grants (rewards.grants; `manage.py grant_keys` or POST /api/keys/grant/).
+# The HTTP endpoint is disabled unless KEY_GRANT_API_TOKEN is set.
+KEY_GRANT_CHUNK_SIZE = config('KEY_GRANT_CHUNK_SIZE', default=5000, cast=int)  # rows per transaction
+KEY_GRANT_API_TOKEN = config('KEY_GRANT_API_TOKEN', default='')
+
+# Activity ingestion (rewards.activity; POST /api/activity/ from a bot or webhook).
+# The endpoint is disabled unless ACTIVITY_API_TOKEN is set.
+ACTIVITY_API_TOKEN = config('ACTIVITY_API_TOKEN', default='')
+ACTIVITY_KEYS_PER_MESSAGE = config('ACTIVITY_KEYS_PER_MESSAGE', default=1, cast=int)
+ACTIVITY_KEYS_PER_VOICE_MINUTE = config('ACTIVITY_KEYS_PER_VOICE_MINUTE', default=1, cast=int)
+ACTIVITY_KEYS_PER_REACTION = config('ACTIVITY_KEYS_PER_REACTION', default=0, cast=int)
+ACTIVITY_FLUSH_INTERVAL = config('ACTIVITY_FLUSH_INTERVAL', default=10, cast=float)  # seconds per award window
+ACTIVITY_QUEUE_SIZE = config('ACTIVITY_QUEUE_SIZE', default=1000, cast=int)  # batches buffered before 503s
+
+# Signed award webhook for the bot (rewards.webhooks; POST /api/webhooks/awards/).
+# The endpoint is disabled unless AWARD_WEBHOOK_SECRET is set.
+AWARD_WEBHOOK_SECRET = config('AWARD_WEBHOOK_SECRET', default='')
+AWARD_WEBHOOK_TOLERANCE = config('AWARD_WEBHOOK_TOLERANCE', default=300, cast=int)  # seconds of clock skew accepted
+AWARD_WEBHOOK_DEDUPE_WINDOW = config('AWARD_WEBHOOK_DEDUPE_WINDOW', default=7 * 24 * 3600, cast=int)  # seconds event ids are remembered
+AWARD_WEBHOOK_MAX_EVENTS = config('AWARD_WEBHOOK_MAX_EVENTS', default=500, cast=int)  # per request
+
+# Request instrumentation (rewards.middleware.RequestMetricsMiddleware).
+# Every request is logged to the `rewards.requests` logger at INFO with its
+# query count, database time, cache hits and latency; set REQUEST_LOG_LEVEL
+# to INFO to see them. REQUEST_SERVER_TIMING adds a Server-Timing header,
+# which tells anyone watching how much work a URL costs, so it follows DEBUG.
+REQUEST_SERVER_TIMING = config('REQUEST_SERVER_TIMING', default=DEBUG, cast=bool)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'rewards.requests': {
+            'handlers': ['console'],
+            'level': config('REQUEST_LOG_LEVEL', default='WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
+# Prometheus metrics (rewards.metrics; GET /metrics). The endpoint is
+# disabled unless METRICS_API_TOKEN is set. Point METRICS_DIR at a directory
+# shared by every worker process (e.g. on tmpfs) so a scrape of any worker
+# reports them all, and empty it when the server is deployed.
+METRICS_API_TOKEN = config('METRICS_API_TOKEN', default='')
+METRICS_DIR = config('METRICS_DIR', default='')
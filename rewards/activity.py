@@ -0,0 +1,175 @@
+"""
+Activity ingestion: turn Discord activity events into key awards.
+
+A bot or webhook POSTs batches of events to /api/activity/. Events are
+priced as they are parsed (ACTIVITY_KEYS_PER_*) and the batch is handed to a
+single background thread that sums awards per user in memory. Every
+ACTIVITY_FLUSH_INTERVAL seconds the window is credited through
+``grants.credit``: a few set-based UPDATEs and one ledger INSERT for the
+whole window, however many events it held.
+
+The hand-off queue is bounded (ACTIVITY_QUEUE_SIZE batches). When the
+flusher falls behind, ``submit()`` refuses new batches and the endpoint
+answers 503 with Retry-After, so senders back off instead of the process
+growing without bound. Awards still in memory are lost if the process dies
+before the next flush; keep the interval short.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.utils import timezone
+
+from . import grants
+from .models import KeyTransaction
+
+logger = logging.getLogger(__name__)
+
+# Settings holding the keys earned per unit of each event type.
+EVENT_RATES = {
+    'message': 'ACTIVITY_KEYS_PER_MESSAGE',
+    'voice': 'ACTIVITY_KEYS_PER_VOICE_MINUTE',
+    'reaction': 'ACTIVITY_KEYS_PER_REACTION',
+}
+MAX_EVENTS_PER_BATCH = 10000
+# Flush early once a window holds this many users, to bound memory.
+MAX_PENDING_USERS = 50000
+
+
+class ActivityError(ValueError):
+    """A batch of activity events could not be parsed."""
+
+
+def parse_events(events):
+    """
+    Price a batch of ``{"discord_id", "type", "count"}`` events.
+
+    ``count`` defaults to 1 and means minutes for voice events. Returns
+    ``(discord_id, keys)`` pairs, leaving out events that earn nothing.
+    """
+    if not isinstance(events, list):
+        raise ActivityError('expected a list of events')
+    if len(events) > MAX_EVENTS_PER_BATCH:
+        raise ActivityError(f'at most {MAX_EVENTS_PER_BATCH} events per batch')
+    rates = {kind: getattr(settings, name) for kind, name in EVENT_RATES.items()}
+    awards = []
+    for index, event in enumerate(events):
+        try:
+            discord_id = str(event['discord_id']).strip()
+            rate = rates[event['type']]
+            count = int(event.get('count', 1))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise ActivityError(f'event {index}: expected discord_id, a type of {", ".join(EVENT_RATES)} and a count')
+        if not discord_id or len(discord_id) > 20 or count < 0:
+            raise ActivityError(f'event {index}: invalid discord_id or count')
+        if rate and count:
+            awards.append((discord_id, rate * count))
+    return awards
+
+
+class ActivityAggregator:
+    """
+    Sums awards per user in memory and credits them once per window.
+
+    One daemon thread does all the aggregation and database work; callers
+    only enqueue. Started lazily on the first ``submit()``.
+    """
+
+    def __init__(self, interval=None, queue_size=None, credit=grants.credit):
+        self.interval = interval if interval is not None else settings.ACTIVITY_FLUSH_INTERVAL
+        self.credit = credit
+        self._queue = queue.Queue(queue_size if queue_size is not None else settings.ACTIVITY_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.rejected_batches = 0
+        self.flushes = 0
+        self.keys_awarded = 0
+
+    def submit(self, awards):
+        """Queue ``(discord_id, keys)`` pairs; False means the queue is full and the caller should retry later."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(awards)
+        except queue.Full:
+            self.rejected_batches += 1
+            return False
+        return True
+
+    def flush(self, timeout=None):
+        """Credit everything queued so far and wait for it to commit."""
+        self._ensure_started()
+        done = threading.Event()
+        self._queue.put(done, timeout=timeout)
+        return done.wait(timeout)
+
+    def stop(self, timeout=None):
+        """Flush what is pending and stop the thread."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None, timeout=timeout)
+            self._thread.join(timeout)
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='activity-aggregator', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        pending = {}
+        deadline = time.monotonic() + self.interval
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    item = ()
+                if isinstance(item, list):
+                    for discord_id, keys in item:
+                        pending[discord_id] = pending.get(discord_id, 0) + keys
+                    if time.monotonic() < deadline and len(pending) < MAX_PENDING_USERS:
+                        continue
+
+                pending = self._flush(pending)
+                deadline = time.monotonic() + self.interval
+                if isinstance(item, threading.Event):
+                    item.set()
+                elif item is None:
+                    return
+        finally:
+            connections.close_all()
+
+    def _flush(self, pending):
+        """Credit a window; returns what is still pending (everything, if it failed)."""
+        if not pending:
+            return pending
+        close_old_connections()
+        try:
+            self.credit(pending, KeyTransaction.KIND_ACTIVITY, f'activity {timezone.now():%Y-%m-%d %H:%M:%S}')
+        except Exception:
+            # Keep the window and retry it with the next one.
+            logger.exception('Failed to credit activity awards for %d users', len(pending))
+            return pending
+        self.flushes += 1
+        self.keys_awarded += sum(pending.values())
+        return {}
+
+
+_aggregator = None
+_aggregator_lock = threading.Lock()
+
+
+def get_aggregator():
+    """The process-wide aggregator, created on first use (settings are read then)."""
+    global _aggregator
+    if _aggregator is None:
+        with _aggregator_lock:
+            if _aggregator is None:
+                _aggregator = ActivityAggregator()
+                atexit.register(_aggregator.stop, timeout=30)
+    return _aggregator
@@ -1,7 +1,22 @@
-from django.contrib import admin
+import codecs
+
+from django import forms
+from django.contrib import admin, messages
 from django.contrib.auth.models import Group
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html
 
-from .models import User, Category, Reward, LeaderboardEntry, RedemptionLog
+from . import codes, ledger, stock
+from .models import (
+    User, Category, Reward, RewardCode, LeaderboardEntry, RedemptionLog, NotificationOutbox,
+    RedemptionDigest, KeyGrantBatch, KeyTransaction,
+)
 
 # Hide Groups from admin (not needed for this app)
 admin.site.unregister(Group)
@@ -33,14 +48,129 @@ class UserAdmin(admin.ModelAdmin):
         }),
     )
 
+    def save_model(self, request, obj, form, change):
+        """Record balance edits in the key ledger as adjustments."""
+        if 'key_balance' not in form.changed_data:
+            return super().save_model(request, obj, form, change)
+        with transaction.atomic():
+            # Lock the row so a redemption can't slip between the read and the save.
+            current = (
+                User.objects.select_for_update().filter(pk=obj.pk).values_list('key_balance', flat=True).first()
+                if change else None
+            ) or 0
+            super().save_model(request, obj, form, change)
+            if obj.key_balance != current:
+                ledger.record(
+                    obj.pk, KeyTransaction.KIND_ADJUSTMENT, obj.key_balance - current,
+                    f'admin {request.user.get_username()}',
+                )
+
+
+class CodeUploadForm(forms.Form):
+    file = forms.FileField(help_text='A text file with one code per line (UTF-8).')
+
 
 @admin.register(Reward)
 class RewardAdmin(admin.ModelAdmin):
-    list_display = ['name', 'category', 'key_cost', 'is_active', 'created_at']
-    list_filter = ['category', 'is_active', 'created_at']
+    list_display = ['name', 'category', 'key_cost', 'stock_left', 'codes_left', 'available_from', 'is_active', 'created_at']
+    list_filter = ['category', 'is_active', 'delivers_codes', 'created_at']
     search_fields = ['name']
     list_editable = ['is_active']
     list_select_related = ['category']
+    readonly_fields = ['code_pool']
+
+    def get_queryset(self, request):
+        # A subquery rather than a second join, which would multiply the stock sum.
+        unassigned = (
+            RewardCode.objects.filter(reward=OuterRef('pk'), assigned_at__isnull=True)
+            .order_by().values('reward').annotate(count=Count('id')).values('count')
+        )
+        return super().get_queryset(request).annotate(
+            stock_remaining=Sum('stock_shards__remaining'),
+            codes_remaining=Subquery(unassigned),
+        )
+
+    def get_urls(self):
+        return [
+            path(
+                '<path:object_id>/codes/', self.admin_site.admin_view(self.upload_codes),
+                name='rewards_reward_upload_codes',
+            ),
+        ] + super().get_urls()
+
+    @admin.display(description='Codes')
+    def codes_left(self, obj):
+        if not obj.delivers_codes:
+            return '-'
+        return f'{obj.codes_remaining or 0} left'
+
+    @admin.display(description='Code pool')
+    def code_pool(self, obj):
+        if obj.pk is None:
+            return 'Save the reward first, then upload its codes.'
+        return format_html(
+            '{} unassigned codes. <a href="{}">Upload codes</a>',
+            codes.remaining(obj.pk), reverse('admin:rewards_reward_upload_codes', args=[obj.pk]),
+        )
+
+    def upload_codes(self, request, object_id):
+        """Stream an uploaded file of codes into the reward's pool."""
+        reward = get_object_or_404(Reward, pk=object_id)
+        if not self.has_change_permission(request, reward):
+            raise PermissionDenied
+        form = CodeUploadForm(request.POST or None, request.FILES or None)
+        if form.is_valid():
+            lines = codecs.iterdecode(form.cleaned_data['file'], 'utf-8')
+            try:
+                result = codes.import_codes(reward, codes.parse(lines))
+            except (codes.CodeFormatError, UnicodeDecodeError) as e:
+                self.message_user(
+                    request, f'Invalid code file, {e}. Earlier chunks may have been imported; fix the file and upload it '
+                    'again, codes already in the pool are skipped.',
+                    messages.ERROR,
+                )
+            else:
+                self.message_user(
+                    request,
+                    f'Imported {result.added} codes ({result.skipped} duplicates skipped) in {result.seconds:.1f}s.'
+                    + ('' if reward.delivers_codes else ' Tick "Delivers codes" to hand them out on redemption.'),
+                    messages.SUCCESS,
+                )
+                return redirect('admin:rewards_reward_change', reward.pk)
+        return TemplateResponse(request, 'admin/rewards/reward/upload_codes.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'original': reward,
+            'title': f'Upload codes for {reward.name}',
+            'form': form,
+            'remaining': codes.remaining(reward.pk),
+        })
+
+    @admin.display(description='Stock')
+    def stock_left(self, obj):
+        if obj.stock_limit is None:
+            return 'Unlimited'
+        return f'{obj.stock_remaining or 0} of {obj.stock_limit} left'
+
+    def save_model(self, request, obj, form, change):
+        """Re-split the stock when the limit changes."""
+        with transaction.atomic():
+            super().save_model(request, obj, form, change)
+            if 'stock_limit' in form.changed_data:
+                stock.restock(obj)
+
+
+@admin.register(RewardCode)
+class RewardCodeAdmin(admin.ModelAdmin):
+    """Codes are added through the reward's upload page and assigned by redemptions."""
+    list_display = ['code', 'reward', 'assigned_at', 'redemption']
+    list_filter = ['reward', ('assigned_at', admin.EmptyFieldListFilter)]
+    search_fields = ['code', 'redemption__user__username']
+    readonly_fields = ['reward', 'code', 'redemption', 'assigned_at', 'created_at']
+    list_select_related = ['reward', 'redemption__user', 'redemption__reward']
+
+    def has_add_permission(self, request):
+        return False
 
 
 @admin.register(LeaderboardEntry)
@@ -59,3 +189,53 @@ class RedemptionLogAdmin(admin.ModelAdmin):
     search_fields = ['user__username', 'reward__name']
     readonly_fields = ['user', 'reward', 'timestamp']
     date_hierarchy = 'timestamp'
+    list_select_related = ['user', 'reward']
+
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'recipient', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['subject', 'recipient']
+    readonly_fields = ['recipient', 'subject', 'body', 'attempts', 'last_error', 'created_at', 'sent_at']
+    actions = ['retry_now']
+
+    @admin.action(description='Retry selected notifications now')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status=NotificationOutbox.STATUS_SENT).update(
+            status=NotificationOutbox.STATUS_PENDING,
+            attempts=0,
+            next_attempt_at=timezone.now(),
+        )
+        self.message_user(request, f'{updated} notification(s) queued for retry.')
+
+
+@admin.register(RedemptionDigest)
+class RedemptionDigestAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'redemption_count', 'keys_spent', 'first_redemption_id', 'last_redemption_id']
+    readonly_fields = ['first_redemption_id', 'last_redemption_id', 'redemption_count', 'keys_spent', 'created_at']
+
+
+@admin.register(KeyGrantBatch)
+class KeyGrantBatchAdmin(admin.ModelAdmin):
+    list_display = ['batch_id', 'rows_applied', 'keys_granted', 'chunks_applied', 'created_at', 'completed_at']
+    search_fields = ['batch_id']
+    readonly_fields = ['batch_id', 'rows_applied', 'keys_granted', 'chunks_applied', 'created_at', 'completed_at']
+
+
+@admin.register(KeyTransaction)
+class KeyTransactionAdmin(admin.ModelAdmin):
+    """The ledger is append-only: rows can be viewed but not added, edited or deleted here."""
+    list_display = ['created_at', 'user', 'kind', 'amount', 'reference']
+    list_filter = ['kind', 'created_at']
+    search_fields = ['user__username', 'user__discord_id', 'reference']
+    list_select_related = ['user']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class RewardsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rewards'
+
+    def ready(self):
+        from . import db, instrumentation, signals  # noqa: F401  (registers the connection and cache invalidation handlers)
@@ -0,0 +1,72 @@
+"""
+ASGI handler with support for long-lived streaming responses.
+
+Django 4.2 serves every ASGI request in its own ``ThreadSensitiveContext``,
+which starts a thread for the request's sync work (signals, sessions, ORM
+calls) and keeps it until the response is finished. That is fine for
+requests that last milliseconds; for the dashboard's event stream it would
+mean an idle thread per open dashboard. ``ASGIHandler`` serves the views
+named in STREAMING_URL_NAMES without one, so their sync work shares asgiref's
+process-wide sync thread instead.
+
+Django 4.2 also stops reading from the connection once the request body is
+in, so a stream would never learn that its client went away (ASGI servers
+drop writes to closed connections silently). For streaming views,
+``client_disconnected(request)`` returns an asyncio.Event that is set when
+it does.
+"""
+
+import asyncio
+
+from django.core.handlers.asgi import ASGIHandler as DjangoASGIHandler
+from django.urls import Resolver404, resolve
+
+# Served without a per-request thread and with disconnect detection.
+STREAMING_URL_NAMES = {'event_stream'}
+DISCONNECT_SCOPE_KEY = 'rewards.disconnected'
+
+
+def _is_streaming(scope):
+    path = scope['path']
+    root_path = scope.get('root_path', '')
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    try:
+        return resolve(path).url_name in STREAMING_URL_NAMES
+    except Resolver404:
+        return False
+
+
+def client_disconnected(request):
+    """An asyncio.Event set when the client of a streaming request disconnects; None elsewhere."""
+    watch = getattr(request, 'scope', {}).get(DISCONNECT_SCOPE_KEY)
+    return watch() if watch else None
+
+
+class ASGIHandler(DjangoASGIHandler):
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not _is_streaming(scope):
+            return await super().__call__(scope, receive, send)
+
+        disconnected = asyncio.Event()
+        watcher = None
+
+        async def watch():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        def start_watching():
+            # Only once the view runs: Django has read the body by then and
+            # won't call receive() again.
+            nonlocal watcher
+            if watcher is None:
+                watcher = asyncio.ensure_future(watch())
+            return disconnected
+
+        try:
+            await self.handle({**scope, DISCONNECT_SCOPE_KEY: start_watching}, receive, send)
+        finally:
+            if watcher is not None:
+                watcher.cancel()
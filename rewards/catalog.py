@@ -0,0 +1,194 @@
+"""
+Cached reward catalog.
+
+The catalog (categories and active rewards) only changes when an admin edits
+it, so it is served from Django's cache framework. Every key embeds a catalog
+version number; ``bump_catalog_version()`` (called once a change commits,
+from the ``post_save`` and ``post_delete`` signals on Reward and Category)
+moves all readers to fresh keys and lets the old entries expire.
+
+Each lookup has a sync and an async (``a``-prefixed) form. The async forms
+read the cache on a worker thread (``off_loop``) and query the database,
+on a miss, through ``sync_to_async``.
+
+Rewards are listed a page at a time, in ``(key_cost, name, id)`` order. A
+page continues from the last reward of the previous one (keyset
+pagination) rather than from an offset, so every page is a range read of
+the ``reward_active_*`` indexes however deep it is, and a cursor stays
+valid across catalog edits: the next page starts after the same reward.
+"""
+
+import base64
+import hashlib
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from .instrumentation import cache_get, off_loop
+from .models import Category, Reward
+
+CATALOG_VERSION_KEY = 'rewards:catalog:version'
+PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+def get_catalog_version():
+    """Current catalog version, initialised from the clock if the cache lost it."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # A clock-based start can't collide with keys left over in a shared cache.
+        cache.add(CATALOG_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog entry."""
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        get_catalog_version()
+
+
+def _key(name):
+    return f'rewards:catalog:{get_catalog_version()}:{name}'
+
+
+def _load_categories():
+    return list(
+        Category.objects.filter(rewards__is_active=True).distinct().order_by('order', 'name')
+    )
+
+
+def _load_category_index():
+    index = {}
+    for category in Category.objects.all():
+        index[str(category.id)] = category
+        index[category.slug] = category
+    return index
+
+
+def encode_cursor(reward):
+    """Opaque cursor for the page after ``reward``."""
+    position = json.dumps([reward.key_cost, reward.name, reward.id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """``(key_cost, name, id)`` from a cursor; ValueError if it isn't one."""
+    try:
+        key_cost, name, reward_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError('Invalid cursor') from e
+    if not (type(key_cost) is int and isinstance(name, str) and type(reward_id) is int):
+        raise ValueError('Invalid cursor')
+    return key_cost, name, reward_id
+
+
+def _load_page(category_id, after, limit):
+    rewards = Reward.objects.filter(is_active=True).select_related('category').order_by('key_cost', 'name', 'id')
+    if category_id is not None:
+        rewards = rewards.filter(category_id=category_id)
+    if after is not None:
+        key_cost, name, reward_id = after
+        # (key_cost, name, id) > after; the redundant key_cost bound lets the index seek to it.
+        rewards = rewards.filter(
+            Q(key_cost__gt=key_cost) | Q(key_cost=key_cost, name__gt=name)
+            | Q(key_cost=key_cost, name=name, id__gt=reward_id),
+            key_cost__gte=key_cost,
+        )
+    # One extra row says whether there is a next page.
+    rewards = list(rewards[:limit + 1])
+    return rewards[:limit], encode_cursor(rewards[limit - 1]) if len(rewards) > limit else None
+
+
+def _load_limited():
+    return list(Reward.objects.filter(is_active=True, stock_limit__isnull=False).only('id', 'stock_limit'))
+
+
+def _load_drops():
+    return dict(
+        Reward.objects.filter(is_active=True, available_from__isnull=False).values_list('id', 'available_from')
+    )
+
+
+def _lookup(name):
+    key = _key(name)
+    return key, cache_get(key)
+
+
+def _cached(name, loader, *args):
+    key, value = _lookup(name)
+    if value is None:
+        value = loader(*args)
+        cache.set(key, value, settings.CATALOG_CACHE_TIMEOUT)
+    return value
+
+
+async def _acached(name, loader, *args):
+    key, value = await off_loop(_lookup)(name)
+    if value is None:
+        value = await sync_to_async(loader)(*args)
+        await off_loop(cache.set)(key, value, settings.CATALOG_CACHE_TIMEOUT)
+    return value
+
+
+def get_categories():
+    """Categories that have at least one active reward, in display order."""
+    return _cached('categories', _load_categories)
+
+
+def find_category(value):
+    """The Category with this id or slug, or None."""
+    return _cached('category-index', _load_category_index).get(value)
+
+
+def _page_args(category, cursor, limit):
+    category_id = category.id if category else None
+    after = decode_cursor(cursor) if cursor else None
+    # Cursors can be longer than a memcached key allows.
+    position = hashlib.md5(cursor.encode()).hexdigest() if cursor else 'first'
+    return f'page:{category_id or "all"}:{limit}:{position}', _load_page, category_id, after, limit
+
+
+def get_reward_page(category=None, cursor=None, limit=PAGE_SIZE):
+    """
+    ``(rewards, next_cursor)``: up to ``limit`` active rewards, optionally of
+    one category, after the one ``cursor`` points at. ``next_cursor`` is
+    None on the last page. Raises ValueError for a malformed cursor.
+    """
+    return _cached(*_page_args(category, cursor, limit))
+
+
+def get_limited():
+    """Active rewards with limited stock, with only ``id`` and ``stock_limit`` loaded."""
+    return _cached('limited', _load_limited)
+
+
+def get_drops():
+    """``{reward id: available_from}`` for active rewards that are scheduled drops."""
+    return _cached('drops', _load_drops)
+
+
+async def aget_categories():
+    return await _acached('categories', _load_categories)
+
+
+async def afind_category(value):
+    return (await _acached('category-index', _load_category_index)).get(value)
+
+
+async def aget_reward_page(category=None, cursor=None, limit=PAGE_SIZE):
+    return await _acached(*_page_args(category, cursor, limit))
+
+
+async def aget_limited():
+    return await _acached('limited', _load_limited)
+
+
+async def aget_drops():
+    return await _acached('drops', _load_drops)
@@ -0,0 +1,49 @@
+"""
+Collapse concurrent identical calls into one.
+
+``InFlight.run(key, ...)`` runs the call unless one with the same key is
+already running in this process, in which case it waits for that one and
+returns its result (or raises its exception). A ``concurrent.futures.Future``
+carries the outcome, so waiters on other threads or event loops (async
+views served by WSGI each get their own loop) can share it.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class InFlight:
+    def __init__(self, joined=None):
+        self._calls = {}
+        self._lock = threading.Lock()
+        # Optional counter incremented for every caller that shared a result.
+        self.joined = joined
+
+    async def run(self, key, func, *args):
+        """Await ``func(*args)``, sharing one execution with concurrent callers using ``key``."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            if self.joined is not None:
+                self.joined.inc()
+            return await asyncio.wrap_future(future)
+
+        try:
+            result = await func(*args)
+        except BaseException as e:
+            self._done(key)
+            future.set_exception(e)
+            raise
+        self._done(key)
+        future.set_result(result)
+        return result
+
+    def _done(self, key):
+        # Forget the call before publishing its outcome, so a caller arriving
+        # after it finished starts a fresh one.
+        with self._lock:
+            del self._calls[key]
@@ -0,0 +1,114 @@
+"""
+Fulfilment code pools: codes imported per reward, one handed out per redemption.
+
+``import_codes`` streams a file of one code per line into a reward's pool in
+chunks of CODE_IMPORT_CHUNK_SIZE, one transaction per chunk; codes already
+in the pool (or repeated in the file) are skipped by the (reward, code)
+unique constraint, so re-importing a file is safe. Memory stays bounded by
+the chunk size however large the file is.
+
+``claim`` runs inside the redemption transaction and assigns the oldest
+unassigned code to the redemption. On databases with ``SKIP LOCKED`` the code
+is locked with ``SELECT ... FOR UPDATE SKIP LOCKED``, so concurrent
+redeemers each take a different code instead of queueing on the first one.
+Elsewhere (SQLite, which runs one writer at a time anyway) a single
+``UPDATE ... WHERE id = (SELECT ... LIMIT 1)`` claims it atomically. Either
+way the lookup walks the partial index of unassigned codes, not the table.
+"""
+
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Subquery
+from django.utils import timezone
+
+from . import grants, stock
+from .models import RewardCode
+
+MAX_CODE_LENGTH = RewardCode._meta.get_field('code').max_length
+
+
+class CodeFormatError(grants.GrantFormatError):
+    """A line of the code file could not be imported."""
+
+
+@dataclass
+class ImportResult:
+    rows: int
+    added: int
+    seconds: float
+
+    @property
+    def skipped(self):
+        return self.rows - self.added
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def parse(lines):
+    """Yield the codes in ``lines``, one per line; blank lines are skipped."""
+    for line, text in enumerate(lines, start=1):
+        code = text.strip()
+        if not code:
+            continue
+        if len(code) > MAX_CODE_LENGTH:
+            raise CodeFormatError(line, f'code longer than {MAX_CODE_LENGTH} characters')
+        yield code
+
+
+def import_codes(reward, codes, chunk_size=None):
+    """
+    Add ``codes`` to the pool of ``reward``; returns an ImportResult.
+
+    A CodeFormatError stops the import after the chunks before the bad line
+    have been committed; fix the file and import it again.
+    """
+    chunk_size = chunk_size or settings.CODE_IMPORT_CHUNK_SIZE
+    start = time.perf_counter()
+    pool = RewardCode.objects.filter(reward=reward)
+    before = pool.count()
+    rows = 0
+    try:
+        for chunk in grants.chunks(codes, chunk_size):
+            with transaction.atomic():
+                RewardCode.objects.bulk_create(
+                    [RewardCode(reward=reward, code=code) for code in chunk], ignore_conflicts=True,
+                )
+            rows += len(chunk)
+    finally:
+        # A pool that ran dry can be redeemed again straight away.
+        stock.invalidate(reward.id)
+    return ImportResult(rows, pool.count() - before, time.perf_counter() - start)
+
+
+def claim(reward_id, redemption_id):
+    """
+    Assign the next unassigned code of ``reward_id`` to the redemption.
+
+    Call inside the redemption transaction, so the code goes back to the
+    pool if it rolls back. Returns the code, or None if the pool is empty.
+    """
+    unassigned = RewardCode.objects.filter(reward_id=reward_id, assigned_at__isnull=True).order_by('id')
+    now = timezone.now()
+    if connection.features.has_select_for_update_skip_locked:
+        code = unassigned.select_for_update(skip_locked=True).only('id', 'code').first()
+        if code is None:
+            return None
+        RewardCode.objects.filter(id=code.id).update(redemption_id=redemption_id, assigned_at=now)
+        return code.code
+
+    claimed = RewardCode.objects.filter(
+        id=Subquery(unassigned.values('id')[:1]), assigned_at__isnull=True,
+    ).update(redemption_id=redemption_id, assigned_at=now)
+    if not claimed:
+        return None
+    return RewardCode.objects.filter(redemption_id=redemption_id).values_list('code', flat=True).get()
+
+
+def remaining(reward_id):
+    """Unassigned codes left in the pool, counted from the partial index."""
+    return RewardCode.objects.filter(reward_id=reward_id, assigned_at__isnull=True).count()
@@ -0,0 +1,48 @@
+"""
+Per-connection database tuning.
+
+SQLite's defaults suit a single process: the rollback journal blocks readers
+while anyone writes, and a busy database fails at once. With SQLITE_TUNED,
+every new connection switches to WAL (readers and one writer run
+concurrently), waits up to SQLITE_BUSY_TIMEOUT ms for a lock, and syncs at
+commit checkpoints only (``synchronous=NORMAL``, which is durable in WAL
+mode except for a power loss on the last transactions).
+
+The busy timeout is not a queue: waiting writers poll for the lock, and
+under a steady stream of writers one can lose every poll until it times
+out. ``retry_when_locked()`` runs a whole transaction again when that
+happens, up to SQLITE_LOCK_RETRIES times.
+"""
+
+import itertools
+
+from django.conf import settings
+from django.db import OperationalError, connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite' or not settings.SQLITE_TUNED:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT)}')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+
+
+def retry_when_locked(func, *args):
+    """
+    ``func(*args)``, called again if SQLite gave up waiting for the write lock.
+
+    ``func`` must open and own its transaction: nothing is retried inside
+    an enclosing atomic block, which the failure has already broken.
+    """
+    for attempt in itertools.count():
+        try:
+            return func(*args)
+        except OperationalError as e:
+            locked = 'database is locked' in str(e)
+            if not locked or connection.in_atomic_block or attempt >= settings.SQLITE_LOCK_RETRIES:
+                raise
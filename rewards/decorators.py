@@ -0,0 +1,148 @@
+"""View decorators for the rewards app that work on both sync and async views."""
+
+import asyncio
+import datetime
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+
+from django.http import HttpResponseNotAllowed, JsonResponse
+from django.shortcuts import redirect
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from django.utils.log import log_response
+
+from .instrumentation import off_loop
+from .users import SESSION_USER_KEY, aget_request_user, get_request_user
+
+
+def require_http_methods(request_method_list):
+    """
+    Like ``django.views.decorators.http.require_http_methods``, but keeps
+    async views async (Django 4.2's version always returns a sync wrapper).
+    """
+    def not_allowed(request):
+        response = HttpResponseNotAllowed(request_method_list)
+        log_response(
+            'Method Not Allowed (%s): %s', request.method, request.path,
+            response=response, request=request,
+        )
+        return response
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def inner(request, *args, **kwargs):
+                if request.method not in request_method_list:
+                    return not_allowed(request)
+                return await func(request, *args, **kwargs)
+        else:
+            @wraps(func)
+            def inner(request, *args, **kwargs):
+                if request.method not in request_method_list:
+                    return not_allowed(request)
+                return func(request, *args, **kwargs)
+        return inner
+
+    return decorator
+
+
+require_POST = require_http_methods(['POST'])
+
+
+def csrf_exempt(view_func):
+    """
+    Like ``django.views.decorators.csrf.csrf_exempt``, but keeps async views
+    async. For machine-to-machine endpoints that authenticate with a token.
+    """
+    if asyncio.iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def wrapper(*args, **kwargs):
+            return await view_func(*args, **kwargs)
+    else:
+        @wraps(view_func)
+        def wrapper(*args, **kwargs):
+            return view_func(*args, **kwargs)
+    wrapper.csrf_exempt = True
+    return wrapper
+
+
+def condition(etag_func=None, last_modified_func=None):
+    """
+    Like ``django.views.decorators.http.condition``, but keeps async views
+    async. ``etag_func`` and ``last_modified_func`` are plain callables and
+    must not touch the database; either may return None to skip validation.
+    For async views they run on a worker thread, as they usually read a
+    version number from the cache.
+    """
+    def validators(request, *args, **kwargs):
+        etag = etag_func(request, *args, **kwargs) if etag_func else None
+        last_modified = last_modified_func(request, *args, **kwargs) if last_modified_func else None
+        if last_modified is not None:
+            if not timezone.is_aware(last_modified):
+                last_modified = timezone.make_aware(last_modified, datetime.timezone.utc)
+            last_modified = int(last_modified.timestamp())
+        return (quote_etag(etag) if etag is not None else None), last_modified
+
+    def add_headers(request, response, etag, last_modified):
+        if request.method in ('GET', 'HEAD'):
+            if last_modified and not response.has_header('Last-Modified'):
+                response.headers['Last-Modified'] = http_date(last_modified)
+            if etag:
+                response.headers.setdefault('ETag', etag)
+        return response
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def inner(request, *args, **kwargs):
+                etag, last_modified = await off_loop(validators)(request, *args, **kwargs)
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is None:
+                    response = await func(request, *args, **kwargs)
+                return add_headers(request, response, etag, last_modified)
+        else:
+            @wraps(func)
+            def inner(request, *args, **kwargs):
+                etag, last_modified = validators(request, *args, **kwargs)
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is None:
+                    response = func(request, *args, **kwargs)
+                return add_headers(request, response, etag, last_modified)
+        return inner
+
+    return decorator
+
+
+def discord_login_required(func):
+    """
+    Only let logged-in Discord users through.
+
+    Anonymous requests to ``/api/`` routes get a JSON 401; everything else is
+    redirected to the landing page. A session whose user no longer exists is
+    flushed. The view can then read the user from
+    ``request.discord_user`` (or ``await request.adiscord_user()``) for free.
+    """
+    def reject(request):
+        if request.path_info.startswith('/api/'):
+            return JsonResponse({'success': False, 'error': 'Not authenticated'}, status=401)
+        return redirect('landing')
+
+    if asyncio.iscoroutinefunction(func):
+        @wraps(func)
+        async def inner(request, *args, **kwargs):
+            if await aget_request_user(request) is None:
+                if request.session.get(SESSION_USER_KEY):
+                    await sync_to_async(request.session.flush)()
+                return reject(request)
+            return await func(request, *args, **kwargs)
+    else:
+        @wraps(func)
+        def inner(request, *args, **kwargs):
+            if get_request_user(request) is None:
+                if request.session.get(SESSION_USER_KEY):
+                    request.session.flush()
+                return reject(request)
+            return func(request, *args, **kwargs)
+    return inner
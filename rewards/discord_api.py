@@ -0,0 +1,338 @@
+"""
+Discord API clients with pooled connections, timeouts, retries and rate limiting.
+
+``get_client()`` returns a process-wide ``DiscordClient`` (requests) and
+``get_async_client()`` an ``AsyncDiscordClient`` (httpx) for the running
+event loop. Both reuse keep-alive connections to ``DISCORD_API_BASE_URL``,
+retry connection errors and 5xx responses with jittered backoff, and honour
+Discord's ``429``/``X-RateLimit-*`` headers, failing rather than waiting
+longer than ``DISCORD_MAX_RATE_LIMIT_WAIT``. The code exchange is not
+idempotent (an authorization code only works once), so it is only retried
+when it never reached Discord or was rate limited.
+"""
+
+import asyncio
+import itertools
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from urllib3.exceptions import MaxRetryError
+
+from . import metrics
+
+
+class DiscordAPIError(Exception):
+    """Discord could not be reached or returned an error response."""
+
+
+class RateLimiter:
+    """
+    Tracks Discord rate-limit buckets from response headers.
+
+    Routes are mapped to the bucket id Discord reports in
+    ``X-RateLimit-Bucket``; a request waits while its bucket has no
+    remaining calls, and everything waits during a global 429.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._route_buckets = {}
+        self._buckets = {}  # bucket id -> (remaining, reset monotonic time)
+        self._global_reset = 0.0
+
+    def delay(self, route):
+        """Seconds to wait before calling ``route`` (``None``: global limit only)."""
+        now = time.monotonic()
+        with self._lock:
+            wait = self._global_reset - now
+            bucket = self._route_buckets.get(route)
+            if bucket in self._buckets:
+                remaining, reset_at = self._buckets[bucket]
+                if remaining <= 0:
+                    wait = max(wait, reset_at - now)
+        return max(wait, 0.0)
+
+    def update(self, route, response):
+        """
+        Record the rate-limit headers of a response to ``route``.
+
+        Pass ``route=None`` for per-token requests: only a global 429 is kept.
+        """
+        headers = response.headers
+        now = time.monotonic()
+        with self._lock:
+            if response.status_code == 429 and headers.get('X-RateLimit-Global'):
+                self._global_reset = now + retry_after(response)
+            if route is None:
+                return
+            bucket = headers.get('X-RateLimit-Bucket')
+            if not bucket:
+                return
+            self._route_buckets[route] = bucket
+            try:
+                remaining = int(headers.get('X-RateLimit-Remaining', 1))
+                reset_after = float(headers.get('X-RateLimit-Reset-After', 0))
+            except ValueError:
+                return
+            self._buckets[bucket] = (remaining, now + reset_after)
+
+
+def retry_after(response):
+    """Seconds Discord asked us to wait, from a 429 response."""
+    value = response.headers.get('Retry-After')
+    if value is None:
+        try:
+            value = response.json().get('retry_after')
+        except ValueError:
+            value = None
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return 1.0
+
+
+def backoff(attempt):
+    """Full-jitter exponential backoff for retry ``attempt`` (0-based)."""
+    return random.uniform(0, settings.DISCORD_RETRY_BACKOFF * 2 ** attempt)
+
+
+class _DiscordClientBase:
+    """Request building and retry policy shared by the sync and async clients."""
+
+    def __init__(self, base_url=None, max_retries=None, rate_limiter=None):
+        self.base_url = (base_url or settings.DISCORD_API_BASE_URL).rstrip('/')
+        self.max_retries = settings.DISCORD_MAX_RETRIES if max_retries is None else max_retries
+        self.rate_limiter = rate_limiter or RateLimiter()
+
+    def _token_request(self, code):
+        return {
+            'method': 'POST',
+            'path': '/oauth2/token',
+            'data': {
+                'client_id': settings.DISCORD_CLIENT_ID,
+                'client_secret': settings.DISCORD_CLIENT_SECRET,
+                'grant_type': 'authorization_code',
+                'code': code,
+                'redirect_uri': settings.DISCORD_REDIRECT_URI,
+            },
+            'headers': {'Content-Type': 'application/x-www-form-urlencoded'},
+            'idempotent': False,
+        }
+
+    def _current_user_request(self, access_token):
+        return {
+            'method': 'GET',
+            'path': '/users/@me',
+            'headers': {'Authorization': f'Bearer {access_token}'},
+            # Limits on bearer requests are per user token, so don't share a bucket.
+            'shared_bucket': False,
+        }
+
+    def _rate_limit_wait(self, method, path, route):
+        """Seconds to wait for the rate limits before calling ``route``; raises if that is too long."""
+        wait = self.rate_limiter.delay(route)
+        if wait > settings.DISCORD_MAX_RATE_LIMIT_WAIT:
+            raise DiscordAPIError(f'{method} {path} is rate limited for another {wait:.0f}s')
+        return wait
+
+    def _next_wait(self, attempt, response=None, error=None, idempotent=True, sent=True):
+        """
+        Seconds to wait before retrying, or None if the failure is final.
+
+        A request that isn't ``idempotent`` is only retried if it was never
+        ``sent`` (a connection error) or was rate limited: after a timeout
+        or a 5xx Discord may have acted on it already.
+        """
+        if attempt >= self.max_retries:
+            return None
+        if error is not None:
+            return backoff(attempt) if idempotent or not sent else None
+        if response.status_code == 429:
+            wait = retry_after(response)
+            if wait > settings.DISCORD_MAX_RATE_LIMIT_WAIT:
+                return None
+            return wait
+        if response.status_code >= 500 and idempotent:
+            return backoff(attempt)
+        return None
+
+    @staticmethod
+    def _error(method, path, response=None, error=None):
+        if error is not None:
+            return DiscordAPIError(f'{method} {path} failed: {error}')
+        return DiscordAPIError(f'{method} {path} returned HTTP {response.status_code}')
+
+
+class DiscordClient(_DiscordClientBase):
+    """Blocking Discord client over a shared keep-alive ``requests.Session``."""
+
+    def __init__(self, base_url=None, timeout=None, max_retries=None, pool_size=None, rate_limiter=None):
+        super().__init__(base_url, max_retries, rate_limiter)
+        self.timeout = timeout or (settings.DISCORD_CONNECT_TIMEOUT, settings.DISCORD_READ_TIMEOUT)
+        pool_size = pool_size or settings.DISCORD_POOL_SIZE
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @staticmethod
+    def _not_sent(error):
+        # Connection failures come wrapped in MaxRetryError; errors after
+        # the request went out (timeouts, dropped connections) don't.
+        return isinstance(error, requests.ConnectTimeout) or (
+            isinstance(error, requests.ConnectionError) and bool(error.args)
+            and isinstance(error.args[0], MaxRetryError)
+        )
+
+    def request(self, method, path, shared_bucket=True, idempotent=True, **kwargs):
+        """Send a request, retrying as allowed, and return the decoded JSON body."""
+        route = f'{method} {path}'
+        bucket_route = route if shared_bucket else None
+        for attempt in itertools.count():
+            time.sleep(self._rate_limit_wait(method, path, bucket_route))
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            except requests.RequestException as e:
+                metrics.DISCORD_REQUEST_SECONDS.labels(route, 'error').observe(time.perf_counter() - start)
+                wait = self._next_wait(attempt, error=e, idempotent=idempotent, sent=not self._not_sent(e))
+                if wait is None:
+                    raise self._error(method, path, error=e)
+                time.sleep(wait)
+                continue
+
+            metrics.DISCORD_REQUEST_SECONDS.labels(route, response.status_code).observe(time.perf_counter() - start)
+            self.rate_limiter.update(bucket_route, response)
+            if response.ok:
+                try:
+                    return response.json()
+                except ValueError as e:
+                    raise self._error(method, path, error=e)
+            wait = self._next_wait(attempt, response=response, idempotent=idempotent)
+            if wait is None:
+                raise self._error(method, path, response=response)
+            time.sleep(wait)
+
+    def exchange_code(self, code):
+        """Exchange an OAuth2 authorization code for a token response."""
+        return self.request(**self._token_request(code))
+
+    def get_current_user(self, access_token):
+        """Return the ``/users/@me`` object for an OAuth2 access token."""
+        return self.request(**self._current_user_request(access_token))
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncDiscordClient(_DiscordClientBase):
+    """Non-blocking Discord client over a pooled ``httpx.AsyncClient``."""
+
+    def __init__(self, base_url=None, timeout=None, max_retries=None, pool_size=None, rate_limiter=None):
+        super().__init__(base_url, max_retries, rate_limiter)
+        timeout = timeout or httpx.Timeout(
+            settings.DISCORD_READ_TIMEOUT, connect=settings.DISCORD_CONNECT_TIMEOUT
+        )
+        pool_size = pool_size or settings.DISCORD_POOL_SIZE
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            # Like the requests adapter: extra connections are opened under
+            # load, only ``pool_size`` are kept alive.
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=pool_size),
+        )
+
+    async def request(self, method, path, shared_bucket=True, idempotent=True, **kwargs):
+        """Send a request, retrying as allowed, and return the decoded JSON body."""
+        route = f'{method} {path}'
+        bucket_route = route if shared_bucket else None
+        for attempt in itertools.count():
+            await asyncio.sleep(self._rate_limit_wait(method, path, bucket_route))
+            start = time.perf_counter()
+            try:
+                response = await self.client.request(method, self.base_url + path, **kwargs)
+            except httpx.HTTPError as e:
+                metrics.DISCORD_REQUEST_SECONDS.labels(route, 'error').observe(time.perf_counter() - start)
+                sent = not isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+                wait = self._next_wait(attempt, error=e, idempotent=idempotent, sent=sent)
+                if wait is None:
+                    raise self._error(method, path, error=e)
+                await asyncio.sleep(wait)
+                continue
+
+            metrics.DISCORD_REQUEST_SECONDS.labels(route, response.status_code).observe(time.perf_counter() - start)
+            self.rate_limiter.update(bucket_route, response)
+            if response.is_success:
+                try:
+                    return response.json()
+                except ValueError as e:
+                    raise self._error(method, path, error=e)
+            wait = self._next_wait(attempt, response=response, idempotent=idempotent)
+            if wait is None:
+                raise self._error(method, path, response=response)
+            await asyncio.sleep(wait)
+
+    async def exchange_code(self, code):
+        """Exchange an OAuth2 authorization code for a token response."""
+        return await self.request(**self._token_request(code))
+
+    async def get_current_user(self, access_token):
+        """Return the ``/users/@me`` object for an OAuth2 access token."""
+        return await self.request(**self._current_user_request(access_token))
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class ThreadedDiscordClient:
+    """
+    Awaitable facade over the shared blocking client.
+
+    For event loops that only live for one request (async views served by
+    WSGI), where a per-loop httpx pool would never be reused; calls run in a
+    worker thread so they don't hold the loop.
+    """
+
+    def __init__(self, client):
+        self.exchange_code = sync_to_async(client.exchange_code, thread_sensitive=False)
+        self.get_current_user = sync_to_async(client.get_current_user, thread_sensitive=False)
+
+
+_client = None
+_client_lock = threading.Lock()
+_shared_rate_limiter = RateLimiter()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    """Return the process-wide DiscordClient."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = DiscordClient(rate_limiter=_shared_rate_limiter)
+    return _client
+
+
+def get_async_client(native=True):
+    """
+    Return an awaitable Discord client for the running event loop.
+
+    httpx connections belong to the loop that opened them, so each loop gets
+    its own AsyncDiscordClient pool; all clients share one rate limiter.
+    Pass ``native=False`` when the loop is per-request (WSGI) to get a
+    ThreadedDiscordClient over the process-wide pool instead.
+    """
+    if not native:
+        return ThreadedDiscordClient(get_client())
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncDiscordClient(rate_limiter=_shared_rate_limiter)
+    return client
@@ -0,0 +1,355 @@
+"""
+Live dashboard updates over Server-Sent Events.
+
+Changes are published to channels: ``user:<id>`` for a member's balance and
+redemptions, ``catalog`` for reward edits and stock. The event stream view
+(GET /api/events/) subscribes an open dashboard to its member's channel and
+the catalog channel. A subscription is an asyncio.Queue on the server's
+event loop, so an idle stream costs a suspended coroutine and a few
+kilobytes, not a thread or a database connection; ``manage.py bench_events``
+holds ten thousand of them (see rewards.asgi for what that takes).
+
+Events are published when the current transaction commits, through the
+EVENTS_BROKER:
+
+- ``LocalBroker`` (the default) fans them out to the streams of this
+  process only.
+- ``CacheBroker`` writes them to the shared cache under a sequence number,
+  and one thread per process polls for new ones every EVENTS_POLL_INTERVAL
+  seconds. Use it, with a shared CACHE_BACKEND, when running several
+  processes or nodes.
+
+Any class with the same ``start()`` and ``publish(messages)`` methods can be
+plugged in.
+
+Balance events carry no amount: the stream reads the balance when the event
+arrives, so what it sends is always the committed balance however events
+and changes interleave. Streams woken together (a grant to everyone) share
+one query per BALANCE_BATCH_SIZE members instead of one each. A stream that
+falls EVENTS_QUEUE_SIZE events behind is closed, and every stream closes
+after EVENTS_STREAM_SECONDS. The browser reconnects on its own, and each
+(re)connected stream starts with the current balance.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import User
+from .users import aget_user
+
+logger = logging.getLogger(__name__)
+
+CATALOG = 'catalog'
+BALANCE_BATCH_SIZE = 500
+# Balance lookups made within this many seconds of each other share a query.
+BALANCE_BATCH_WINDOW = 0.01
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+class Subscription:
+    """One stream's queue of ``(event, data)`` pairs, on the loop it was opened on."""
+
+    def __init__(self, hub, channels, loop):
+        self.hub = hub
+        self.channels = channels
+        self.loop = loop
+        self.queue = asyncio.Queue(settings.EVENTS_QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, event, data):
+        try:
+            self.queue.put_nowait((event, data))
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class Hub:
+    """The subscriptions of this process, by channel."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._loops = {}
+
+    def subscribe(self, channels):
+        """Subscribe the running event loop to ``channels``; close the result when done."""
+        subscription = Subscription(self, channels, asyncio.get_running_loop())
+        with self._lock:
+            for channel in channels:
+                self._channels.setdefault(channel, set()).add(subscription)
+            self._loops[subscription.loop] = self._loops.get(subscription.loop, 0) + 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._channels.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._channels[channel]
+            if self._loops.get(subscription.loop, 0) > 1:
+                self._loops[subscription.loop] -= 1
+            else:
+                self._loops.pop(subscription.loop, None)
+
+    def count(self):
+        """Open subscriptions in this process."""
+        with self._lock:
+            return sum(self._loops.values())
+
+    def dispatch(self, messages):
+        """Hand ``(channel, event, data)`` messages to their subscribers; safe from any thread."""
+        with self._lock:
+            loops = list(self._loops)
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._deliver, loop, messages)
+            except RuntimeError:
+                # The loop closed since it subscribed.
+                pass
+
+    def _deliver(self, loop, messages):
+        for channel, event, data in messages:
+            with self._lock:
+                subscribers = [sub for sub in self._channels.get(channel, ()) if sub.loop is loop]
+            for subscription in subscribers:
+                subscription.put(event, data)
+
+
+class LocalBroker:
+    """Delivers events to the streams of this process."""
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def start(self):
+        pass
+
+    def publish(self, messages):
+        self.hub.dispatch(messages)
+
+
+class CacheBroker:
+    """
+    Carries events between processes through the shared cache.
+
+    Each publish stores its messages under the next number of a counter;
+    a polling thread in every process reads the entries it hasn't seen and
+    dispatches them locally. An entry still missing when the counter has
+    moved on (published but not written yet) is waited for one more poll.
+    """
+    counter_key = 'rewards:events:sequence'
+    # Messages per cache entry, to keep entries well under memcached's 1MB.
+    batch_size = 1000
+
+    def __init__(self, hub):
+        self.hub = hub
+        self._seen = 0
+
+    def _entry_key(self, sequence):
+        return f'rewards:events:{sequence}'
+
+    def _current(self):
+        cache.add(self.counter_key, 0, None)
+        return cache.get(self.counter_key) or 0
+
+    def start(self):
+        self._seen = self._current()
+        threading.Thread(target=self._run, name='events-broker', daemon=True).start()
+
+    def publish(self, messages):
+        cache.add(self.counter_key, 0, None)
+        for start in range(0, len(messages), self.batch_size):
+            sequence = cache.incr(self.counter_key)
+            cache.set(self._entry_key(sequence), messages[start:start + self.batch_size], settings.EVENTS_CACHE_TIMEOUT)
+
+    def _run(self):
+        waited = set()
+        while True:
+            time.sleep(settings.EVENTS_POLL_INTERVAL)
+            try:
+                self._poll(waited)
+            except Exception:
+                logger.exception('Polling the event cache failed')
+
+    def _poll(self, waited):
+        current = self._current()
+        if current < self._seen:
+            # The counter was lost and started again.
+            self._seen = 0
+        sequences = range(self._seen + 1, current + 1)
+        entries = cache.get_many([self._entry_key(sequence) for sequence in sequences])
+        for sequence in sequences:
+            messages = entries.get(self._entry_key(sequence))
+            if messages is None and sequence not in waited:
+                waited.add(sequence)
+                return
+            waited.discard(sequence)
+            self._seen = sequence
+            if messages:
+                self.hub.dispatch(messages)
+
+
+_hub = Hub()
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_hub():
+    return _hub
+
+
+def get_broker():
+    """The process-wide broker, created on first use (settings are read then)."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker = import_string(settings.EVENTS_BROKER)(_hub)
+                broker.start()
+                _broker = broker
+    return _broker
+
+
+def publish_many(messages):
+    """Publish ``(channel, event, data)`` messages once the current transaction commits."""
+    messages = list(messages)
+    if messages:
+        transaction.on_commit(lambda: get_broker().publish(messages))
+
+
+def publish(channel, event, data=None):
+    publish_many([(channel, event, data)])
+
+
+def balance_changed(user_ids):
+    """Tell the members' dashboards to show their balance again."""
+    publish_many((user_channel(user_id), 'balance', None) for user_id in user_ids)
+
+
+def redeemed(user_id, reward_id, code=None):
+    publish_many([
+        (user_channel(user_id), 'balance', None),
+        (user_channel(user_id), 'redeemed', {'reward_id': reward_id, 'code': code}),
+    ])
+
+
+def stock_changed(reward_id, remaining):
+    """
+    ``remaining`` is the units left, 0 when sold out, None when not counted (code pools).
+
+    Sent straight away, like the cached stock it mirrors: a reward is found
+    sold out inside a redemption that then rolls back.
+    """
+    get_broker().publish([(CATALOG, 'stock', {'reward_id': reward_id, 'remaining': remaining})])
+
+
+def catalog_changed():
+    publish(CATALOG, 'catalog')
+
+
+# Balance lookups waiting for the next batch, per event loop.
+_balance_batches = {}
+
+
+def _load_balances(user_ids):
+    balances = {}
+    for start in range(0, len(user_ids), BALANCE_BATCH_SIZE):
+        part = user_ids[start:start + BALANCE_BATCH_SIZE]
+        balances.update(User.objects.filter(id__in=part).values_list('id', 'key_balance'))
+    return balances
+
+
+async def _run_balance_batch(loop):
+    batch = _balance_batches.pop(loop)
+    try:
+        balances = await sync_to_async(_load_balances)(list(batch))
+    except Exception as e:
+        for future in batch.values():
+            future.set_exception(e)
+    else:
+        for user_id, future in batch.items():
+            future.set_result(balances.get(user_id))
+
+
+async def _current_balance(user_id):
+    """The committed balance of ``user_id``, or None if the user is gone."""
+    loop = asyncio.get_running_loop()
+    batch = _balance_batches.get(loop)
+    if batch is None:
+        batch = _balance_batches[loop] = {}
+        loop.call_later(BALANCE_BATCH_WINDOW, lambda: asyncio.ensure_future(_run_balance_batch(loop)))
+    if user_id not in batch:
+        batch[user_id] = loop.create_future()
+    return await asyncio.shield(batch[user_id])
+
+
+def _format(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+async def stream(user_id, disconnected=None):
+    """
+    The text/event-stream body for a member's dashboard.
+
+    Ends when the client goes (``disconnected`` is set), when it falls too
+    far behind, or after EVENTS_STREAM_SECONDS.
+    """
+    get_broker()
+    subscription = _hub.subscribe([user_channel(user_id), CATALOG])
+    disconnected = disconnected or asyncio.Event()
+    gone = asyncio.ensure_future(disconnected.wait())
+    deadline = time.monotonic() + settings.EVENTS_STREAM_SECONDS
+    try:
+        # Straight after the dashboard rendered, so usually from the user cache.
+        user = await aget_user(user_id)
+        if user is None:
+            return
+        yield f'retry: {settings.EVENTS_RETRY_MS}\n\n'
+        yield _format('balance', {'balance': user.key_balance})
+        pending = []
+        while not subscription.overflowed:
+            for event, data in pending:
+                if event == 'balance':
+                    balance = await _current_balance(user_id)
+                    if balance is None:
+                        return
+                    data = {'balance': balance}
+                yield _format(event, data)
+            timeout = min(settings.EVENTS_KEEPALIVE_SECONDS, deadline - time.monotonic())
+            if timeout <= 0:
+                return
+            next_event = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait([next_event, gone], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if next_event not in done:
+                next_event.cancel()
+                if gone in done:
+                    return
+                yield ': keepalive\n\n'
+                pending = []
+                continue
+            pending = [next_event.result()]
+            # Several balance events in a row need one lookup.
+            while not subscription.queue.empty():
+                item = subscription.queue.get_nowait()
+                if item != ('balance', None) or item not in pending:
+                    pending.append(item)
+    finally:
+        gone.cancel()
+        subscription.close()
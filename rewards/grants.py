@@ -0,0 +1,234 @@
+"""
+Bulk key grants: apply ``discord_id,amount`` rows from a CSV or JSON Lines stream.
+
+Rows are read lazily and applied in chunks of KEY_GRANT_CHUNK_SIZE, one
+transaction per chunk: duplicate ids in a chunk are summed, users missing
+from the database are created with one INSERT that ignores conflicts, and
+balances move with a handful of set-based UPDATEs (see ``credit``) next to
+one ledger row per user. Memory stays bounded by the chunk size however
+large the file is.
+
+Each batch is recorded in ``KeyGrantBatch``. Committing a chunk advances
+``rows_applied`` in the same transaction, so re-running a batch id skips
+what was already applied: a finished batch is a no-op and an interrupted one
+resumes at the first row it had not committed.
+"""
+
+import csv
+import json
+import time
+from dataclasses import dataclass
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from . import events, ledger
+from .models import KeyGrantBatch, KeyTransaction, User
+from .users import invalidate_user
+
+FORMATS = ('csv', 'jsonl')
+
+# Largest amount one row may grant: the most an IntegerField (key_balance,
+# KeyTransaction.amount) holds on every database backend.
+MAX_AMOUNT = 2**31 - 1
+
+
+class GrantFormatError(ValueError):
+    """A row of the grant file could not be parsed."""
+
+    def __init__(self, line, message):
+        super().__init__(f'line {line}: {message}')
+        self.line = line
+
+
+@dataclass
+class GrantResult:
+    batch: KeyGrantBatch
+    rows: int
+    keys: int
+    seconds: float
+    already_applied: bool = False
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def _row(line, discord_id, amount):
+    discord_id = str(discord_id).strip()
+    if not discord_id or len(discord_id) > 20:
+        raise GrantFormatError(line, 'invalid discord_id')
+    try:
+        amount = int(amount)
+    except (TypeError, ValueError, OverflowError):
+        raise GrantFormatError(line, f'invalid amount {amount!r}')
+    if amount <= 0:
+        raise GrantFormatError(line, 'amount must be positive')
+    if amount > MAX_AMOUNT:
+        raise GrantFormatError(line, f'amount must be at most {MAX_AMOUNT}')
+    return discord_id, amount
+
+
+def parse_csv(lines):
+    """Yield ``(discord_id, amount)`` from CSV lines; a header row is optional."""
+    for line, record in enumerate(csv.reader(lines), start=1):
+        if not record or not ''.join(record).strip():
+            continue
+        if line == 1 and record[0].strip().lower() == 'discord_id':
+            continue
+        if len(record) != 2:
+            raise GrantFormatError(line, 'expected discord_id,amount')
+        yield _row(line, *record)
+
+
+def parse_jsonl(lines):
+    """Yield ``(discord_id, amount)`` from ``{"discord_id": ..., "amount": ...}`` lines."""
+    for line, text in enumerate(lines, start=1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+            discord_id, amount = record['discord_id'], record['amount']
+        except (ValueError, TypeError, KeyError):
+            raise GrantFormatError(line, 'expected {"discord_id": ..., "amount": ...}')
+        yield _row(line, discord_id, amount)
+
+
+def parse(lines, fmt):
+    if fmt not in FORMATS:
+        raise ValueError(f'unknown grant format {fmt!r}')
+    return parse_csv(lines) if fmt == 'csv' else parse_jsonl(lines)
+
+
+def chunks(rows, size):
+    """Lists of up to ``size`` items from the iterable ``rows``, read lazily."""
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def _slices(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _resolve_ids(discord_ids, into, step):
+    for part in _slices(discord_ids, step):
+        into.update(User.objects.filter(discord_id__in=part).values_list('discord_id', 'id'))
+
+
+def _add_to_balances(totals, step):
+    """
+    Add ``totals`` (user id -> keys) to balances with set-based UPDATEs.
+
+    Grant files usually hand out a few distinct amounts, so ids are grouped
+    by amount into ``key_balance = key_balance + n WHERE id IN (...)``. When
+    most amounts differ, one ``CASE`` UPDATE per slice is fewer statements.
+    """
+    by_amount = {}
+    for user_id, amount in totals.items():
+        by_amount.setdefault(amount, []).append(user_id)
+    now = timezone.now()
+
+    if len(by_amount) <= len(totals) // 2:
+        for amount, user_ids in by_amount.items():
+            for part in _slices(user_ids, step):
+                User.objects.filter(id__in=part).update(key_balance=F('key_balance') + amount, updated_at=now)
+        return
+
+    # WHEN, THEN and IN take one parameter each per id.
+    for part in _slices(list(totals.items()), max(1, step // 3)):
+        User.objects.filter(id__in=[user_id for user_id, _ in part]).update(
+            key_balance=F('key_balance') + Case(
+                *[When(id=user_id, then=Value(amount)) for user_id, amount in part],
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+            updated_at=now,
+        )
+
+
+def credit(totals, kind, reference=''):
+    """
+    Credit ``totals`` (discord id -> keys) and write the matching ledger rows.
+
+    Users that don't exist yet are created. Runs in one transaction (or a
+    savepoint in the caller's) and invalidates the cached users on commit.
+    Used by bulk grants and by activity awards.
+    """
+    step = (connection.features.max_query_params or 30000) - 1
+    with transaction.atomic():
+        ids = {}
+        _resolve_ids(list(totals), ids, step)
+        missing = [discord_id for discord_id in totals if discord_id not in ids]
+        if missing:
+            # Created with a zero balance and credited below like everyone
+            # else, so a concurrent insert of the same user loses nothing.
+            User.objects.bulk_create(
+                [User(discord_id=discord_id, username=discord_id) for discord_id in missing],
+                ignore_conflicts=True,
+            )
+            _resolve_ids(missing, ids, step)
+
+        credits = {ids[discord_id]: amount for discord_id, amount in totals.items()}
+        _add_to_balances(credits, step)
+        ledger.record_many(credits.items(), kind, reference)
+        user_ids = list(ids.values())
+        transaction.on_commit(lambda: [invalidate_user(user_id) for user_id in user_ids])
+        events.balance_changed(user_ids)
+
+
+def _apply_chunk(batch, offset, chunk):
+    totals = {}
+    for discord_id, amount in chunk:
+        totals[discord_id] = totals.get(discord_id, 0) + amount
+    keys = sum(totals.values())
+
+    with transaction.atomic():
+        # Claim the chunk first: if another run of this batch got here
+        # already, nothing is updated and this run stops.
+        claimed = KeyGrantBatch.objects.filter(pk=batch.pk, rows_applied=offset).update(
+            chunks_applied=F('chunks_applied') + 1,
+            rows_applied=offset + len(chunk),
+            keys_granted=F('keys_granted') + keys,
+        )
+        if not claimed:
+            return None
+        credit(totals, KeyTransaction.KIND_GRANT, batch.batch_id)
+    return keys
+
+
+def apply_grants(rows, batch_id, chunk_size=None):
+    """
+    Apply ``(discord_id, amount)`` rows as batch ``batch_id``.
+
+    Returns a GrantResult with what this call applied. A GrantFormatError
+    stops the run after the chunks before the bad row have been committed;
+    fix the file and re-run with the same batch id to finish it.
+    """
+    chunk_size = chunk_size or settings.KEY_GRANT_CHUNK_SIZE
+    start = time.perf_counter()
+    batch, _ = KeyGrantBatch.objects.get_or_create(batch_id=batch_id)
+    if batch.completed_at:
+        return GrantResult(batch, 0, 0, 0.0, already_applied=True)
+
+    # Rows are still parsed (and validated) when skipped, just not applied.
+    offset = batch.rows_applied
+    rows = islice(rows, offset, None)
+    applied_rows = applied_keys = 0
+    for chunk in chunks(rows, chunk_size):
+        applied = _apply_chunk(batch, offset, chunk)
+        if applied is None:
+            # Another run of the same batch is ahead of us and will finish it.
+            batch.refresh_from_db()
+            return GrantResult(batch, applied_rows, applied_keys, time.perf_counter() - start)
+        applied_rows += len(chunk)
+        applied_keys += applied
+        offset += len(chunk)
+
+    KeyGrantBatch.objects.filter(pk=batch.pk, completed_at__isnull=True).update(completed_at=timezone.now())
+    batch.refresh_from_db()
+    return GrantResult(batch, applied_rows, applied_keys, time.perf_counter() - start)
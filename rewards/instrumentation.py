@@ -0,0 +1,113 @@
+"""
+Per-request instrumentation: query count, database time, cache hits, latency.
+
+``RequestMetricsMiddleware`` opens a ``RequestMetrics`` for every request in
+a context variable. Every database connection gets an execute wrapper when
+it is created (``instrument_connection``) that counts statements and their
+time against it, and the cached lookups in the catalog, rankings, users and
+leaderboard modules report hits and misses through ``cache_get()``.
+Context variables follow the request into ``sync_to_async`` threads, so
+async views are measured like sync ones; outside a request nothing is
+recorded.
+
+Async code never calls the cache on the event loop: with a shared backend
+every call is a network round trip. It goes through ``off_loop()``.
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'db_seconds', 'cache_hits', 'cache_misses', 'started', 'seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.started = time.perf_counter()
+        self.seconds = None
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+        return self
+
+    def as_dict(self):
+        return {
+            'queries': self.queries,
+            'db_ms': round(self.db_seconds * 1000, 2),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'duration_ms': round((self.seconds or 0) * 1000, 2),
+        }
+
+    def server_timing(self):
+        """The value of a ``Server-Timing`` header for these metrics."""
+        return (
+            f'db;dur={self.db_seconds * 1000:.2f};desc="{self.queries} queries", '
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses", '
+            f'total;dur={(self.seconds or 0) * 1000:.2f}'
+        )
+
+
+@contextmanager
+def measure():
+    """Collect metrics for the body; yields the RequestMetrics."""
+    metrics = RequestMetrics()
+    token = current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        current.reset(token)
+        metrics.finish()
+
+
+def _timed_execute(execute, sql, params, many, context):
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_seconds += time.perf_counter() - start
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Fired again when a connection object reconnects; wrap it once.
+    if _timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _timed_execute)
+
+
+def cache_get(key):
+    """``cache.get(key)``, counted as a hit or miss against the current request."""
+    value = cache.get(key)
+    metrics = current.get()
+    if metrics is not None:
+        if value is None:
+            metrics.cache_misses += 1
+        else:
+            metrics.cache_hits += 1
+    return value
+
+
+def off_loop(func):
+    """
+    ``func`` as a coroutine function that runs on a worker thread.
+
+    For cache access from async code. Not thread-sensitive, so it doesn't
+    queue behind the request's other sync work; anything that touches the
+    database needs plain ``sync_to_async`` instead.
+    """
+    return sync_to_async(func, thread_sensitive=False)
@@ -0,0 +1,72 @@
+"""
+Cached leaderboard.
+
+The active ``LeaderboardEntry`` rows are cached under a version that is
+bumped from the ``post_save``/``post_delete`` signals once the change
+commits. The version is the change time in milliseconds, so it also
+serves as the landing page's Last-Modified; the rendered
+``_leaderboard.html`` fragment is cached under the same version by the
+``{% cache %}`` tag.
+"""
+
+import time
+from datetime import datetime, timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .instrumentation import cache_get, off_loop
+from .models import LeaderboardEntry
+
+LEADERBOARD_VERSION_KEY = 'rewards:leaderboard:version'
+LEADERBOARD_SIZE = 10
+
+
+def get_leaderboard_version():
+    """Millisecond timestamp of the last leaderboard change (or cache reset)."""
+    version = cache.get(LEADERBOARD_VERSION_KEY)
+    if version is None:
+        cache.add(LEADERBOARD_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(LEADERBOARD_VERSION_KEY)
+    return version
+
+
+def bump_leaderboard_version():
+    """Invalidate the cached leaderboard and rendered fragment."""
+    current = cache.get(LEADERBOARD_VERSION_KEY) or 0
+    cache.set(LEADERBOARD_VERSION_KEY, max(int(time.time() * 1000), current + 1), None)
+
+
+def get_leaderboard_last_modified():
+    return datetime.fromtimestamp(get_leaderboard_version() / 1000, tz=timezone.utc)
+
+
+def _load_leaderboard():
+    return list(LeaderboardEntry.objects.filter(is_active=True)[:LEADERBOARD_SIZE])
+
+
+def _lookup():
+    key = f'rewards:leaderboard:{get_leaderboard_version()}'
+    return key, cache_get(key)
+
+
+def get_leaderboard():
+    """The active leaderboard entries, in display order."""
+    key, entries = _lookup()
+    if entries is None:
+        entries = _load_leaderboard()
+        cache.set(key, entries, settings.LEADERBOARD_CACHE_TIMEOUT)
+    return entries
+
+
+async def aget_leaderboard_version():
+    return await off_loop(get_leaderboard_version)()
+
+
+async def aget_leaderboard():
+    key, entries = await off_loop(_lookup)()
+    if entries is None:
+        entries = await sync_to_async(_load_leaderboard)()
+        await off_loop(cache.set)(key, entries, settings.LEADERBOARD_CACHE_TIMEOUT)
+    return entries
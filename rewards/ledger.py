@@ -0,0 +1,90 @@
+"""
+Key ledger: every change to a balance is a ``KeyTransaction`` row.
+
+``User.key_balance`` stays the balance callers read (one column, no
+aggregation); it is the materialized sum of the user's ledger rows and must
+be moved in the same transaction as the row is written. The redemption
+engine and bulk grants do their own set-based balance UPDATEs and call
+``record()``/``record_many()``; everything else uses ``adjust()``.
+
+``find_drift()`` recomputes every balance from the ledger in one GROUP BY
+and returns the users whose materialized balance disagrees.
+"""
+
+import logging
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+
+from . import events
+from .models import KeyTransaction, User
+from .users import invalidate_user
+
+logger = logging.getLogger(__name__)
+
+HISTORY_PAGE_SIZE = 50
+
+
+def record(user_id, kind, amount, reference=''):
+    """Write one ledger row; the caller moves the balance in the same transaction."""
+    return KeyTransaction.objects.create(user_id=user_id, kind=kind, amount=amount, reference=reference)
+
+
+def record_many(entries, kind, reference=''):
+    """Write a ledger row per ``(user_id, amount)`` pair with one INSERT per batch."""
+    KeyTransaction.objects.bulk_create(
+        [KeyTransaction(user_id=user_id, kind=kind, amount=amount, reference=reference) for user_id, amount in entries],
+    )
+
+
+def adjust(user_id, amount, reference='', kind=KeyTransaction.KIND_ADJUSTMENT):
+    """Move a balance by ``amount`` and record it; returns False if the user doesn't exist."""
+    with transaction.atomic():
+        if not User.objects.filter(id=user_id).update(key_balance=F('key_balance') + amount):
+            return False
+        record(user_id, kind, amount, reference)
+        # The UPDATE bypasses post_save, so drop the cached user explicitly.
+        transaction.on_commit(lambda: invalidate_user(user_id))
+        events.balance_changed([user_id])
+    return True
+
+
+def history(user_id, before=None, limit=HISTORY_PAGE_SIZE):
+    """
+    A page of a user's transactions, newest first.
+
+    Keyset pagination on the (user, id) index: pass the last id of a page as
+    ``before`` to get the next one, so every page is an index range scan.
+    """
+    queryset = KeyTransaction.objects.filter(user_id=user_id)
+    if before is not None:
+        queryset = queryset.filter(id__lt=before)
+    return queryset.order_by('-id')[:limit]
+
+
+def find_drift():
+    """``(user_id, key_balance, ledger_balance)`` for every user whose balance disagrees with the ledger."""
+    return list(
+        User.objects.order_by()
+        .annotate(ledger_balance=Coalesce(Sum('key_transactions__amount'), 0))
+        .exclude(key_balance=F('ledger_balance'))
+        .values_list('id', 'key_balance', 'ledger_balance')
+    )
+
+
+def reconcile(fix=False):
+    """
+    Log (and with ``fix``, repair) balances that drifted from the ledger.
+
+    The ledger is the source of truth: a repair resets the balance to the
+    ledger sum, but only if the balance hasn't moved since it was checked.
+    Returns the drift found.
+    """
+    drift = find_drift()
+    for user_id, balance, ledger_balance in drift:
+        logger.warning('Key balance drift for user %s: balance %s, ledger %s', user_id, balance, ledger_balance)
+        if fix and User.objects.filter(id=user_id, key_balance=balance).update(key_balance=ledger_balance):
+            transaction.on_commit(lambda user_id=user_id: invalidate_user(user_id))
+            events.balance_changed([user_id])
+    return drift
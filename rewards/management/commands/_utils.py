@@ -0,0 +1,186 @@
+"""Shared helpers for the benchmark and stress-test management commands."""
+
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+
+from rewards import services
+from rewards.models import KeyTransaction, User
+
+
+@contextmanager
+def temporary_database(alias='default', verbosity=0):
+    """
+    Run the body against a throwaway database with the current schema.
+
+    Uses the same machinery as the test runner, so the configured database
+    is never touched. SQLite gets an on-disk file instead of the in-memory
+    default so that worker threads really share one database.
+    """
+    connection = connections[alias]
+    old_name = connection.settings_dict['NAME']
+    tmp_dir = None
+    if connection.vendor == 'sqlite':
+        tmp_dir = tempfile.mkdtemp(prefix='rewards-bench-')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(tmp_dir, 'bench.sqlite3')
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def new_session(**data):
+    """Save a session holding ``data``; returns its key, the session cookie's value."""
+    store = import_module(settings.SESSION_ENGINE).SessionStore()
+    store.update(data)
+    store.save()
+    return store.session_key
+
+
+def run_parallel(func, jobs, threads):
+    """
+    Call ``func(*job)`` for every job on a thread pool.
+
+    Returns ``(results, elapsed_seconds)``. Each result is either the return
+    value or the exception raised, so callers can tally failures. Each job
+    ends like a request does, so connections are reused or closed according
+    to CONN_MAX_AGE.
+    """
+    def call(job):
+        try:
+            return func(*job)
+        except Exception as e:
+            return e
+        finally:
+            close_old_connections()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(call, jobs))
+        elapsed = time.perf_counter() - start
+        # One close per worker: the barrier makes every thread take one.
+        barrier = threading.Barrier(threads)
+        list(pool.map(lambda _: (barrier.wait(), connections.close_all()), range(threads)))
+    return results, elapsed
+
+
+def create_funded_users(count, balance, prefix):
+    """Create ``count`` users holding ``balance`` keys, with their opening ledger rows; returns their ids."""
+    with transaction.atomic():
+        users = User.objects.bulk_create(
+            User(discord_id=f'{prefix}-{i}', username=f'{prefix}-{i}', key_balance=balance) for i in range(count)
+        )
+        KeyTransaction.objects.bulk_create(
+            KeyTransaction(user=user, kind=KeyTransaction.KIND_OPENING, amount=user.key_balance) for user in users
+        )
+    return [user.id for user in users]
+
+
+def redeem_in_parallel(reward, user_ids, threads):
+    """
+    Redeem ``reward`` once for every user in ``user_ids`` from ``threads`` threads.
+
+    Returns ``(results, outcomes, elapsed_seconds)``: what ``services.redeem``
+    returned or raised for each user, and a Counter of the outcomes
+    (``redeemed``, a RedemptionError's outcome, or the repr of any other
+    exception).
+    """
+    results, elapsed = run_parallel(services.redeem, [(user_id, reward.id) for user_id in user_ids], threads)
+    outcomes = Counter(
+        'redeemed' if not isinstance(result, Exception) else getattr(result, 'outcome', repr(result))
+        for result in results
+    )
+    return results, outcomes, elapsed
+
+
+def format_outcomes(outcomes):
+    return ', '.join(f'{outcome}={count}' for outcome, count in sorted(outcomes.items()))
+
+
+class FakeDiscordHandler(BaseHTTPRequestHandler):
+    """
+    Answers the two OAuth calls the login flow makes, after ``server.latency``.
+
+    Each request first takes the next entry of ``server.faults``, if any: a
+    ``(status, headers)`` pair to answer with instead, or a number of seconds
+    to stall for before answering.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=()):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in dict(headers).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _reply(self, body):
+        self.server.calls.append(f'{self.command} {self.path}')
+        try:
+            fault = self.server.faults.pop(0)
+        except IndexError:
+            fault = None
+        if isinstance(fault, tuple):
+            status, headers = fault
+            return self._send(status, {'message': 'fake failure'}, headers)
+        time.sleep(self.server.latency + (fault or 0))
+        self._send(200, body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._reply({'access_token': f'fake-{next(self.server.tokens)}', 'token_type': 'Bearer'})
+
+    def do_GET(self):
+        token = self.headers.get('Authorization', '').rsplit('-', 1)[-1]
+        self._reply({'id': f'9000{token}', 'username': f'fake-user-{token}', 'avatar': None})
+
+
+@contextmanager
+def fake_discord_server(latency=0.0, faults=None, calls=None):
+    """
+    Serve a stand-in Discord API on localhost and yield its base URL.
+
+    Every login gets a fresh token and user, so logins create new users.
+    Fill the ``faults`` list to script failures (see FakeDiscordHandler);
+    every request received is appended to ``calls`` as ``'METHOD /path'``.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeDiscordHandler, bind_and_activate=False)
+    server.request_queue_size = 1024
+    server.daemon_threads = True
+    server.server_bind()
+    server.server_activate()
+    server.latency = latency
+    server.tokens = itertools.count(1)
+    server.faults = [] if faults is None else faults
+    server.calls = [] if calls is None else calls
+    # A stalled answer to a client that timed out finds the connection gone.
+    server.handle_error = lambda request, client_address: None
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_port}'
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,117 @@
+"""
+Replay activity events from a file through the ingestion pipeline.
+
+Reads JSON Lines events ({"discord_id", "type", "count"}) from --file, or
+generates --events of them for --users members, and feeds them in batches
+of --batch-size to a rewards.activity aggregator on a throwaway database,
+retrying when backpressure refuses a batch. Reports ingest throughput,
+flushes and the database cost, and compares against one UPDATE per event.
+Usage:
+    python manage.py bench_activity --events 1000000 --users 50000
+"""
+
+import json
+import os
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, Sum
+from django.test import override_settings
+
+from rewards import activity, ledger
+from rewards.models import User
+from ._utils import temporary_database
+
+EVENT_MIX = [('message', 1)] * 7 + [('reaction', 1)] * 2 + [('voice', 5)]
+
+
+class Command(BaseCommand):
+    help = 'Measure activity ingestion throughput by replaying events from a file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help='JSON Lines events to replay (default: generate)')
+        parser.add_argument('--events', type=int, default=1000000)
+        parser.add_argument('--users', type=int, default=50000)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=float, default=1.0, help='Flush window in seconds')
+        parser.add_argument('--queue-size', type=int, default=100)
+        parser.add_argument('--naive-events', type=int, default=5000, help='Events to time with one UPDATE each')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        path = options['file']
+        generated = path is None
+        if generated:
+            path = self.generate(options)
+        try:
+            # DEBUG keeps the last 9000 queries, which would skew the timings.
+            with temporary_database(), override_settings(DEBUG=False):
+                self.replay(path, options)
+        finally:
+            if generated:
+                os.remove(path)
+
+    def generate(self, options):
+        rng = random.Random(options['seed'])
+        fd, path = tempfile.mkstemp(suffix='.jsonl', prefix='rewards-activity-')
+        with os.fdopen(fd, 'w') as f:
+            for _ in range(options['events']):
+                kind, count = rng.choice(EVENT_MIX)
+                # A few members are far more active than the rest.
+                member = int(options['users'] * rng.random() ** 3)
+                f.write(json.dumps({'discord_id': str(10 ** 17 + member), 'type': kind, 'count': count}) + '\n')
+        return path
+
+    def replay(self, path, options):
+        aggregator = activity.ActivityAggregator(interval=options['interval'], queue_size=options['queue_size'])
+        events = waits = 0
+        start = time.perf_counter()
+        with open(path) as f:
+            batch = []
+            for line in f:
+                batch.append(json.loads(line))
+                if len(batch) == options['batch_size']:
+                    waits += self.submit(aggregator, batch)
+                    events += len(batch)
+                    batch = []
+            if batch:
+                waits += self.submit(aggregator, batch)
+                events += len(batch)
+            ingested = time.perf_counter() - start
+            aggregator.stop()
+        elapsed = time.perf_counter() - start
+
+        expected = aggregator.keys_awarded
+        total = User.objects.aggregate(total=Sum('key_balance'))['total'] or 0
+        assert total == expected, (total, expected)
+        assert not ledger.find_drift()
+        self.stdout.write(
+            f'{events} events in {elapsed:.2f}s ({events / ingested:.0f} events/s ingested, '
+            f'{events / elapsed:.0f} events/s end to end) | {aggregator.flushes} flushes, '
+            f'{User.objects.count()} users credited {total} keys, '
+            f'{waits} batch retries under backpressure'
+        )
+
+        sample = self.naive_sample(path, options['naive_events'])
+        start = time.perf_counter()
+        for discord_id, keys in sample:
+            User.objects.filter(discord_id=discord_id).update(key_balance=F('key_balance') + keys)
+        naive = time.perf_counter() - start
+        self.stdout.write(f'one UPDATE per event: {len(sample) / naive:.0f} events/s ({len(sample)} events)')
+
+    @staticmethod
+    def submit(aggregator, batch):
+        awards = activity.parse_events(batch)
+        waits = 0
+        while not aggregator.submit(awards):
+            waits += 1
+            time.sleep(0.005)
+        return waits
+
+    @staticmethod
+    def naive_sample(path, count):
+        with open(path) as f:
+            events = [json.loads(line) for _, line in zip(range(count), f)]
+        return activity.parse_events(events)
@@ -0,0 +1,122 @@
+"""
+Compare WSGI and ASGI concurrency for the login and redeem endpoints.
+
+Both stacks run in-process against a throwaway database and a fake Discord
+that answers after --latency seconds. WSGI is modelled as a fixed pool of
+--wsgi-workers sync workers; ASGI as one event loop with --concurrency
+requests in flight. Usage:
+    python manage.py bench_asgi --requests 400 --latency 0.2
+"""
+
+import asyncio
+import secrets
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from rewards.models import User, Reward
+from ._utils import fake_discord_server, new_session, temporary_database
+
+
+class Command(BaseCommand):
+    help = 'Benchmark login and redeem throughput under WSGI vs ASGI with a stubbed Discord'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=200, help='In-flight requests on the ASGI loop')
+        parser.add_argument('--wsgi-workers', type=int, default=8, help='Sync workers (processes x threads) for WSGI')
+        parser.add_argument('--latency', type=float, default=0.2, help='Fake Discord response time in seconds')
+
+    def handle(self, *args, **options):
+        with temporary_database(), fake_discord_server(options['latency']) as discord_url, override_settings(
+            DISCORD_API_BASE_URL=discord_url,
+            DISCORD_CLIENT_ID='bench',
+            ALLOWED_HOSTS=['*'],
+            # Every simulated user comes from 127.0.0.1.
+            REDEEM_IP_RATE=0,
+        ):
+            self.stdout.write(
+                f'{options["requests"]} requests, Discord latency {options["latency"] * 1000:.0f}ms, '
+                f'{options["wsgi_workers"]} WSGI workers, {options["concurrency"]} ASGI in flight'
+            )
+            for endpoint in ('login', 'redeem'):
+                for mode in ('wsgi', 'asgi'):
+                    jobs = getattr(self, f'prepare_{endpoint}')(options['requests'])
+                    runner = self.run_wsgi if mode == 'wsgi' else self.run_asgi
+                    latencies, elapsed, failures = runner(jobs, options)
+                    self.report(endpoint, mode, latencies, elapsed, failures)
+
+    def prepare_login(self, count):
+        """Sessions mid-OAuth, each with the state the callback expects."""
+        url = reverse('discord_callback')
+        jobs = []
+        for _ in range(count):
+            state = secrets.token_urlsafe(16)
+            jobs.append(('get', f'{url}?code=bench&state={state}', new_session(oauth_state=state), 302))
+        return jobs
+
+    def prepare_redeem(self, count):
+        """Logged-in sessions for distinct users redeeming one cheap reward."""
+        reward = Reward.objects.create(name=f'bench {secrets.token_hex(4)}', key_cost=1)
+        users = User.objects.bulk_create(
+            User(discord_id=f'bench-{secrets.token_hex(6)}', username='bench', key_balance=10)
+            for _ in range(count)
+        )
+        url = reverse('redeem_reward', args=[reward.id])
+        return [('post', url, new_session(user_id=user.id), 200) for user in users]
+
+    def run_wsgi(self, jobs, options):
+        def call(job):
+            method, url, session_key, expected = job
+            client = Client()
+            client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+            start = time.perf_counter()
+            try:
+                response = getattr(client, method)(url)
+            finally:
+                connections.close_all()
+            return time.perf_counter() - start, response.status_code == expected
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['wsgi_workers']) as pool:
+            results = list(pool.map(call, jobs))
+        return self.split(results, time.perf_counter() - start)
+
+    def run_asgi(self, jobs, options):
+        async def main():
+            limit = asyncio.Semaphore(options['concurrency'])
+
+            async def call(job):
+                method, url, session_key, expected = job
+                client = AsyncClient()
+                client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+                async with limit:
+                    start = time.perf_counter()
+                    response = await getattr(client, method)(url)
+                    return time.perf_counter() - start, response.status_code == expected
+
+            return await asyncio.gather(*(call(job) for job in jobs))
+
+        start = time.perf_counter()
+        results = asyncio.run(main())
+        return self.split(results, time.perf_counter() - start)
+
+    @staticmethod
+    def split(results, elapsed):
+        latencies = sorted(latency for latency, _ in results)
+        failures = sum(1 for _, ok in results if not ok)
+        return latencies, elapsed, failures
+
+    def report(self, endpoint, mode, latencies, elapsed, failures):
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        self.stdout.write(
+            f'{endpoint:>6} {mode}: {len(latencies) / elapsed:7.1f} req/s | '
+            f'p50 {statistics.median(latencies) * 1000:6.0f}ms p95 {p95 * 1000:6.0f}ms | '
+            f'failures {failures}'
+        )
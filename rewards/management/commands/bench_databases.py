@@ -0,0 +1,78 @@
+"""
+Compare concurrent redemption throughput across database modes.
+
+Each mode gets a fresh throwaway copy of the configured database and runs
+--users members redeeming --rewards rewards each from --threads threads,
+with the connection handling a real request would get. On SQLite the modes
+are the stock settings (rollback journal, a connection per request) and
+the tuned profile (WAL, busy_timeout, synchronous=NORMAL, persistent
+connections); on PostgreSQL, a connection per request against persistent
+connections with health checks. Persistent connections only pay off under
+WSGI (see DATABASES in settings). Usage:
+    python manage.py bench_databases --threads 16
+    DB_ENGINE=postgresql DB_NAME=... python manage.py bench_databases
+"""
+
+import itertools
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import override_settings
+
+from rewards import ledger, services
+from rewards.models import Reward, User
+from ._utils import run_parallel, temporary_database
+
+SQLITE_MODES = [
+    ('sqlite, stock', {'SQLITE_TUNED': False}, {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}),
+    ('sqlite, tuned', {'SQLITE_TUNED': True}, {'CONN_MAX_AGE': 60, 'CONN_HEALTH_CHECKS': True}),
+]
+POSTGRES_MODES = [
+    ('postgresql, connection per request', {}, {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}),
+    ('postgresql, persistent', {}, {'CONN_MAX_AGE': 60, 'CONN_HEALTH_CHECKS': True}),
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent redemptions for each database mode'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--rewards', type=int, default=10)
+
+    def handle(self, *args, **options):
+        db_settings = connections.settings['default']
+        modes = SQLITE_MODES if db_settings['ENGINE'].endswith('sqlite3') else POSTGRES_MODES
+        configured = {key: db_settings[key] for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+        for label, overrides, connection_options in modes:
+            db_settings.update(configured, **connection_options)
+            try:
+                with override_settings(**overrides), temporary_database():
+                    self.run_mode(label, options)
+            finally:
+                db_settings.update(configured)
+
+    def run_mode(self, label, options):
+        users = User.objects.bulk_create(
+            User(discord_id=f'bench-db-{i}', username=f'bench{i}') for i in range(options['users'])
+        )
+        for user in users:
+            ledger.adjust(user.id, options['rewards'] * 10, 'benchmark')
+        rewards = Reward.objects.bulk_create(
+            Reward(name=f'bench reward {i}', key_cost=10) for i in range(options['rewards'])
+        )
+        jobs = [(user.id, reward.id) for user, reward in itertools.product(users, rewards)]
+
+        results, elapsed = run_parallel(services.redeem, jobs, options['threads'])
+
+        errors = [r for r in results if isinstance(r, Exception)]
+        locked = sum(1 for e in errors if 'locked' in str(e))
+        drift = ledger.find_drift()
+        self.stdout.write(
+            f'{label:>36}: {len(jobs)} redemptions in {elapsed:.2f}s ({len(jobs) / elapsed:.0f}/s) | '
+            f'errors={len(errors)} (database locked={locked}) | '
+            f'CONN_MAX_AGE={connections.settings["default"]["CONN_MAX_AGE"]} '
+            f'SQLITE_TUNED={settings.SQLITE_TUNED} | ledger drift={len(drift)}'
+        )
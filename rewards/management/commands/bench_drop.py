@@ -0,0 +1,147 @@
+"""
+Simulate the burst of a scheduled drop, with and without the waiting room.
+
+--users members are all on the page when a drop opens. Each joins the drop's
+queue, polls it when told to, and redeems as soon as it is admitted. Members
+are coroutines on one event loop; redemptions run on a pool of --threads
+worker threads, like an ASGI server's, against a throwaway database. The
+members call the waiting room and redemption code the views call rather
+than going through the test client, whose own overhead would hide the
+database load. Without the waiting room (DROP_ADMISSION_RATE=0) everyone is
+admitted at the opening and redeems at once; with it they are admitted at
+--rate per second after a --burst. Reports the database queries per second
+over the run and the redeem latency. Usage:
+    python manage.py bench_drop --users 2000 --rate 100
+"""
+
+import asyncio
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+from django.utils import timezone
+
+from rewards import catalog, services, waitingroom
+from rewards.models import KeyTransaction, RedemptionLog, Reward, User
+from ._utils import temporary_database
+
+
+class Command(BaseCommand):
+    help = 'Measure database load during a drop burst, with and without the waiting room'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--rate', type=float, default=100.0, help='DROP_ADMISSION_RATE for the waiting room run')
+        parser.add_argument('--burst', type=int, default=20, help='DROP_ADMISSION_BURST for the waiting room run')
+        parser.add_argument('--lead', type=float, default=1.0, help='Seconds between everyone joining and the opening')
+
+    def handle(self, *args, **options):
+        modes = {
+            'no waiting room': {'DROP_ADMISSION_RATE': 0},
+            'waiting room': {'DROP_ADMISSION_RATE': options['rate'], 'DROP_ADMISSION_BURST': options['burst']},
+        }
+        for mode, overrides in modes.items():
+            with temporary_database(), override_settings(DEBUG=False, **overrides):
+                cache.clear()
+                users = User.objects.bulk_create(
+                    User(discord_id=str(10 ** 17 + i), username=f'member{i}', key_balance=100)
+                    for i in range(options['users'])
+                )
+                KeyTransaction.objects.bulk_create(
+                    KeyTransaction(user=user, kind=KeyTransaction.KIND_OPENING, amount=user.key_balance)
+                    for user in users
+                )
+                reward = Reward.objects.create(
+                    name='Drop', key_cost=10, available_from=timezone.now() + timedelta(seconds=options['lead']),
+                )
+                # Warm, as it would be from the page views before the drop.
+                catalog.get_drops()
+
+                queries = []
+
+                def count_queries(execute, sql, params, many, context):
+                    queries.append(time.perf_counter())
+                    return execute(sql, params, many, context)
+
+                def watch(sender, connection, **kwargs):
+                    connection.execute_wrappers.append(count_queries)
+
+                connection_created.connect(watch)
+                try:
+                    result = asyncio.run(self.burst(reward, [user.id for user in users], options['threads']))
+                finally:
+                    connection_created.disconnect(watch)
+
+                redeemed = RedemptionLog.objects.filter(reward=reward).count()
+                self.report(mode, result, queries, redeemed)
+                # Errors from the unqueued burst (SQLite's "database is locked") are the point of comparison.
+                if overrides['DROP_ADMISSION_RATE'] and redeemed != len(users):
+                    raise CommandError(f'{mode}: {redeemed} redemptions for {len(users)} members')
+
+    @staticmethod
+    async def burst(reward, user_ids, threads):
+        loop = asyncio.get_running_loop()
+        pool = ThreadPoolExecutor(max_workers=threads)
+        outcomes = Counter()
+        latencies = []
+        polls = 0
+
+        def redeem(user_id, token):
+            # What redeem_reward does once the rate limits let a request through.
+            try:
+                if reward.id in catalog.get_drops() and not waitingroom.check_token(token, user_id, reward.id):
+                    return 'not_admitted'
+                services.redeem(user_id, reward.id)
+                return 'redeemed'
+            except services.RedemptionError as e:
+                return e.outcome
+            except Exception as e:
+                return type(e).__name__
+            finally:
+                close_old_connections()
+
+        async def member(user_id):
+            nonlocal polls
+            ticket = None
+            while True:
+                # What drop_queue does; the drop schedule comes from the cache.
+                place = waitingroom.join(reward.id, catalog.get_drops()[reward.id], user_id, ticket)
+                ticket = place.ticket_token
+                polls += 1
+                if place.token:
+                    break
+                await asyncio.sleep(place.retry_after)
+            start = time.perf_counter()
+            outcomes[await loop.run_in_executor(pool, redeem, user_id, place.token)] += 1
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(member(user_id) for user_id in user_ids))
+        elapsed = time.perf_counter() - start
+        pool.shutdown()
+        connections.close_all()
+        return {'start': start, 'elapsed': elapsed, 'polls': polls, 'outcomes': outcomes, 'latencies': latencies}
+
+    def report(self, mode, result, queries, redeemed):
+        per_second = Counter(int(at - result['start']) for at in queries)
+        seconds = range(max(per_second) + 1) if per_second else range(0)
+        latencies = sorted(result['latencies'])
+        p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+        breakdown = ', '.join(f'{outcome}={count}' for outcome, count in sorted(result['outcomes'].items()))
+        self.stdout.write(
+            f'{mode:<16} {redeemed} redeemed in {result["elapsed"]:5.2f}s | {breakdown} | '
+            f'{result["polls"]} queue polls | redeem latency p50 {statistics.median(latencies) * 1000:.0f}ms '
+            f'p95 {p95 * 1000:.0f}ms'
+        )
+        self.stdout.write(
+            f'{"":<16} peak {max(per_second.values(), default=0)} queries/s; per second: '
+            + ' '.join(str(per_second[second]) for second in seconds)
+        )
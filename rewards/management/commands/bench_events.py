@@ -0,0 +1,211 @@
+"""
+Hold thousands of idle dashboard event streams and push updates through them.
+
+Serves discord_rewards.asgi under uvicorn in a child process, against a
+throwaway database, and opens --streams event streams to it from this
+process, each logged in as a different member. Then:
+
+1. reports the server's memory per open stream, and its CPU while the
+   streams sit idle for --idle seconds;
+2. grants every member keys through the grant API and times how long each
+   stream takes to show the new balance;
+3. closes the streams and checks that the server let go of every one.
+
+Usage:
+    python manage.py bench_events --streams 10000
+"""
+
+import asyncio
+import multiprocessing
+import os
+import resource
+import socket
+import statistics
+import threading
+import time
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import override_settings
+from django.urls import reverse
+
+from rewards.models import KeyTransaction, User
+from ._utils import new_session, temporary_database
+
+TOKEN = 'bench-token'
+BALANCE = 100
+GRANT = 5
+
+
+def serve(port, control):
+    """Child process: run the ASGI app, and answer the parent's questions about it."""
+    import uvicorn
+
+    from discord_rewards.asgi import application
+    from rewards import events
+
+    def answer():
+        while True:
+            control.recv()
+            control.send(events.get_hub().count())
+
+    threading.Thread(target=answer, daemon=True).start()
+    config = uvicorn.Config(
+        application, host='127.0.0.1', port=port, lifespan='off', log_level='warning', backlog=4096,
+    )
+    uvicorn.Server(config).run()
+
+
+def process_stats(pid):
+    """``(resident MB, CPU seconds)`` of a process, from /proc."""
+    with open(f'/proc/{pid}/status') as status:
+        rss = next(int(line.split()[1]) for line in status if line.startswith('VmRSS:')) / 1024
+    with open(f'/proc/{pid}/stat') as stat:
+        fields = stat.read().rsplit(')', 1)[1].split()
+    return rss, (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+class Command(BaseCommand):
+    help = 'Measure the cost of idle dashboard event streams and the latency of updates through them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--streams', type=int, default=10000)
+        parser.add_argument(
+            '--idle', type=float, default=60.0,
+            help='Seconds to leave the streams idle; make it span a few EVENTS_KEEPALIVE_SECONDS',
+        )
+        parser.add_argument('--connect-concurrency', type=int, default=100, help='Streams being opened at once')
+        parser.add_argument('--broker', default='rewards.events.LocalBroker')
+
+    def handle(self, *args, **options):
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard != resource.RLIM_INFINITY and hard < options['streams'] + 100:
+            raise CommandError(f'{options["streams"]} streams need more file descriptors than the limit of {hard}')
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+        with temporary_database(), override_settings(
+            DEBUG=False, ALLOWED_HOSTS=['*'], KEY_GRANT_API_TOKEN=TOKEN, EVENTS_BROKER=options['broker'],
+        ):
+            users = User.objects.bulk_create(
+                User(discord_id=str(10 ** 17 + i), username=f'member{i}', key_balance=BALANCE)
+                for i in range(options['streams'])
+            )
+            KeyTransaction.objects.bulk_create(
+                KeyTransaction(user=user, kind=KeyTransaction.KIND_OPENING, amount=user.key_balance)
+                for user in users
+            )
+            sessions = [new_session(user_id=user.id) for user in users]
+            grants = ''.join(f'{user.discord_id},{GRANT}\n' for user in users).encode()
+            connections.close_all()
+
+            with socket.socket() as probe:
+                probe.bind(('127.0.0.1', 0))
+                port = probe.getsockname()[1]
+            control, child_end = multiprocessing.Pipe()
+            server = multiprocessing.get_context('fork').Process(target=serve, args=(port, child_end), daemon=True)
+            server.start()
+            try:
+                asyncio.run(self.bench(port, server.pid, control, sessions, grants, options))
+            finally:
+                server.terminate()
+                server.join(10)
+                if server.is_alive():
+                    server.kill()
+
+    @staticmethod
+    def open_streams(control):
+        control.send('count')
+        return control.recv()
+
+    async def bench(self, port, pid, control, sessions, grants, options):
+        loop = asyncio.get_running_loop()
+        await self.wait_for_server(port)
+        rss_before, _ = process_stats(pid)
+
+        # 1. Open every stream and wait for its first balance.
+        request = 'GET {path} HTTP/1.1\r\nHost: localhost\r\nAccept: text/event-stream\r\nCookie: {cookie}={key}\r\n\r\n'
+        limit = asyncio.Semaphore(options['connect_concurrency'])
+
+        async def connect(session_key):
+            async with limit:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port, limit=2 ** 20)
+                writer.write(request.format(
+                    path=reverse('event_stream'), cookie=settings.SESSION_COOKIE_NAME, key=session_key,
+                ).encode())
+                status = await reader.readline()
+                if b' 200 ' not in status:
+                    raise CommandError(f'event stream answered {status.decode().strip()}')
+                await reader.readuntil(f'"balance":{BALANCE}}}'.encode())
+                return reader, writer
+
+        start = time.perf_counter()
+        streams = await asyncio.gather(*(connect(key) for key in sessions))
+        opened = time.perf_counter() - start
+        rss_open, cpu_start = process_stats(pid)
+        count = await loop.run_in_executor(None, self.open_streams, control)
+        self.stdout.write(
+            f'{len(streams)} streams open in {opened:.1f}s ({len(streams) / opened:.0f}/s), {count} subscribed | '
+            f'server RSS {rss_before:.0f}MB -> {rss_open:.0f}MB, '
+            f'{(rss_open - rss_before) * 1024 / len(streams):.1f}KB per stream'
+        )
+
+        # Idle: only keepalives flow.
+        await asyncio.sleep(options['idle'])
+        _, cpu_idle = process_stats(pid)
+        self.stdout.write(
+            f'idle {options["idle"]:.0f}s: server CPU {cpu_idle - cpu_start:.2f}s '
+            f'({(cpu_idle - cpu_start) / options["idle"] * 100:.1f}% of a core)'
+        )
+
+        # 2. Grant everyone keys and time each stream's new balance.
+        latencies = []
+
+        async def updated(reader):
+            await reader.readuntil(f'"balance":{BALANCE + GRANT}}}'.encode())
+            latencies.append(time.perf_counter() - start)
+
+        def grant():
+            post = urllib.request.Request(
+                f'http://127.0.0.1:{port}{reverse("grant_keys_api")}?batch_id=bench-events', data=grants,
+                headers={'Authorization': f'Bearer {TOKEN}', 'Content-Type': 'text/csv'},
+            )
+            with urllib.request.urlopen(post, timeout=300) as response:
+                response.read()
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        waiting = [asyncio.ensure_future(updated(reader)) for reader, _ in streams]
+        committed = await loop.run_in_executor(None, grant)
+        await asyncio.wait_for(asyncio.gather(*waiting), timeout=300)
+        latencies.sort()
+        self.stdout.write(
+            f'grant to all {len(streams)}: committed after {committed:.2f}s, every stream updated after '
+            f'{latencies[-1]:.2f}s | update latency p50 {statistics.median(latencies):.2f}s '
+            f'p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f}s'
+        )
+
+        # 3. Close the streams; the server should drop every subscription.
+        for _, writer in streams:
+            writer.close()
+        deadline = time.monotonic() + 15
+        while (left := await loop.run_in_executor(None, self.open_streams, control)) and time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+        self.stdout.write(f'closed: {left} subscriptions left on the server')
+        if left:
+            raise CommandError(f'{left} event streams outlived their connections')
+
+    @staticmethod
+    async def wait_for_server(port):
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                _, writer = await asyncio.open_connection('127.0.0.1', port)
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise CommandError('the ASGI server did not start')
+                await asyncio.sleep(0.2)
+                continue
+            writer.close()
+            return
@@ -0,0 +1,79 @@
+"""
+Benchmark bulk key grants on a synthetic file.
+
+Writes --rows grant rows (a --existing share of them for users already in
+the database, the rest new) to a temporary file, applies it to a throwaway
+database through rewards.grants, and reports throughput and peak memory.
+Usage:
+    python manage.py bench_grants --rows 1000000
+"""
+
+import os
+import random
+import resource
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.test import override_settings
+
+from rewards import grants, ledger
+from rewards.models import User
+from ._utils import temporary_database
+
+
+class Command(BaseCommand):
+    help = 'Measure bulk key grant throughput and memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--existing', type=int, default=100000, help='Users seeded before the grant')
+        parser.add_argument('--chunk-size', type=int)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        rows, existing = options['rows'], options['existing']
+        fd, path = tempfile.mkstemp(suffix='.csv', prefix='rewards-grants-')
+        try:
+            expected = 0
+            with os.fdopen(fd, 'w') as f:
+                f.write('discord_id,amount\n')
+                for i in range(rows):
+                    amount = rng.choice([5, 10, 25, 100])
+                    expected += amount
+                    # Ids repeat, so chunks also exercise duplicate folding.
+                    f.write(f'{10 ** 17 + rng.randrange(existing + rows // 2)},{amount}\n')
+
+            # DEBUG keeps the last 9000 queries, which would swamp the memory figure.
+            with temporary_database(), override_settings(DEBUG=False):
+                for offset in range(0, existing, 5000):
+                    with transaction.atomic():
+                        User.objects.bulk_create(
+                            User(discord_id=str(10 ** 17 + i), username=f'member{i}')
+                            for i in range(offset, min(offset + 5000, existing))
+                        )
+
+                rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                with open(path, newline='') as f:
+                    result = grants.apply_grants(grants.parse(f, 'csv'), 'bench', options['chunk_size'])
+                rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+                start = time.perf_counter()
+                with open(path, newline='') as f:
+                    again = grants.apply_grants(grants.parse(f, 'csv'), 'bench', options['chunk_size'])
+                rerun = time.perf_counter() - start
+
+                total = User.objects.aggregate(total=Sum('key_balance'))['total']
+                assert total == expected == result.keys, (total, expected, result.keys)
+                assert again.already_applied and again.rows == 0
+                assert not ledger.find_drift()
+                self.stdout.write(
+                    f'{result.rows} rows ({User.objects.count()} users) in {result.seconds:.1f}s: '
+                    f'{result.rows_per_second:.0f} rows/s, peak RSS +{(rss_after - rss_before) / 1024:.1f} MiB; '
+                    f're-run of the same batch {rerun * 1000:.1f}ms (no-op)'
+                )
+        finally:
+            os.remove(path)
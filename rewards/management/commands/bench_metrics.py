@@ -0,0 +1,91 @@
+"""
+Measure what the metrics cost on the hot path and check multi-process totals.
+
+Times counter increments and histogram observations in memory and in the
+memory-mapped METRICS_DIR mode, then forks --processes workers that each
+record --updates redemptions into a shared directory and checks that a
+render from the parent sums them exactly. Usage:
+    python manage.py bench_metrics --updates 200000 --processes 4
+"""
+
+import multiprocessing
+import re
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from rewards import metrics
+
+
+def record(updates):
+    for _ in range(updates):
+        metrics.REDEMPTIONS.labels('redeemed').inc()
+        metrics.REDEEM_SECONDS.observe(0.004)
+
+
+def sample(text, line):
+    match = re.search(rf'^{re.escape(line)} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+class Command(BaseCommand):
+    help = 'Benchmark metric updates and check cross-process aggregation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--updates', type=int, default=200000)
+        parser.add_argument('--processes', type=int, default=4)
+
+    def handle(self, *args, **options):
+        updates = options['updates']
+        with tempfile.TemporaryDirectory(prefix='rewards-metrics-') as directory:
+            for mode, metrics_dir in (('memory', ''), ('mmap', directory)):
+                with override_settings(METRICS_DIR=metrics_dir):
+                    metrics.reset()
+                    self.time_updates(mode, updates)
+
+            with override_settings(METRICS_DIR=directory):
+                metrics.reset()
+                before = metrics.render()
+                context = multiprocessing.get_context('fork')
+                workers = [context.Process(target=record, args=(updates,)) for _ in range(options['processes'])]
+                start = time.perf_counter()
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+                elapsed = time.perf_counter() - start
+
+                start = time.perf_counter()
+                text = metrics.render()
+                render_ms = (time.perf_counter() - start) * 1000
+                metrics.reset()
+
+        expected = options['processes'] * updates
+        redeemed = 'rewards_redemptions_total{outcome="redeemed"}'
+        counted = sample(text, redeemed) - sample(before, redeemed)
+        observed = sample(text, 'rewards_redeem_seconds_count') - sample(before, 'rewards_redeem_seconds_count')
+        self.stdout.write(
+            f'{options["processes"]} processes x {updates} updates in {elapsed:.2f}s; '
+            f'render over {options["processes"] + 1} files took {render_ms:.2f}ms'
+        )
+        if counted != expected or observed != expected:
+            raise CommandError(f'expected {expected}, rendered {counted:.0f} increments and {observed:.0f} observations')
+        self.stdout.write(self.style.SUCCESS(f'totals match: {expected} increments and observations'))
+
+    def time_updates(self, mode, updates):
+        counter = metrics.REDEMPTIONS.labels('redeemed')
+        histogram = metrics.REDEEM_SECONDS.labels()
+        timings = {
+            'counter inc': lambda: counter.inc(),
+            'labels().inc': lambda: metrics.REDEMPTIONS.labels('redeemed').inc(),
+            'histogram observe': lambda: histogram.observe(0.004),
+        }
+        for name, update in timings.items():
+            update()
+            start = time.perf_counter()
+            for _ in range(updates):
+                update()
+            per_update = (time.perf_counter() - start) / updates
+            self.stdout.write(f'{mode:<6} {name:<18} {per_update * 1e6:6.2f}us per update')
@@ -0,0 +1,98 @@
+"""
+Benchmark the computed leaderboard on a synthetic community.
+
+Seeds a throwaway database with --users members and compares a per-request
+ORDER BY/COUNT over the whole table with rewards.rankings (cold and warm).
+Usage:
+    python manage.py bench_rankings --users 300000
+"""
+
+import random
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from rewards import rankings
+from rewards.models import User, UserStats
+from ._utils import temporary_database
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+class Command(BaseCommand):
+    help = 'Benchmark top-N and my-rank queries on a synthetic dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=300000)
+        parser.add_argument('--lookups', type=int, default=200, help='Rank lookups to time')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with temporary_database():
+            start = time.perf_counter()
+            self.seed(options['users'], rng)
+            self.stdout.write(f'Seeded {options["users"]} users in {time.perf_counter() - start:.1f}s')
+
+            user_ids = rng.sample(range(1, options['users'] + 1), options['lookups'])
+            for metric, (model, field) in rankings.METRICS.items():
+                pk = 'id' if model is User else 'user_id'
+
+                def naive_top():
+                    return list(model.objects.order_by(f'-{field}', pk).values_list(pk, field)[:10])
+
+                def naive_ranks():
+                    for user_id in user_ids:
+                        score = model.objects.filter(**{pk: user_id}).values_list(field, flat=True).first() or 0
+                        model.objects.filter(**{f'{field}__gt': score}).count()
+
+                def ranks():
+                    for user_id in user_ids:
+                        rankings.rank_of(user_id, metric)
+
+                naive_top_ms, _ = timed(naive_top, 5)
+                naive_rank_ms, _ = timed(naive_ranks, 1)
+                cache.clear()
+                cold_top_ms, _ = timed(lambda: rankings.top(metric), 1)
+                warm_top_ms, _ = timed(lambda: rankings.top(metric), 100)
+                cache.clear()
+                cold_rank_ms, _ = timed(ranks, 1)
+                warm_rank_ms, _ = timed(ranks, 5)
+                lookups = len(user_ids)
+                self.stdout.write(
+                    f'{metric:>12}: top-10 naive {naive_top_ms:7.2f}ms cold {cold_top_ms:7.2f}ms '
+                    f'warm {warm_top_ms:6.3f}ms | my-rank naive {naive_rank_ms / lookups:7.2f}ms '
+                    f'cold {cold_rank_ms / lookups:6.3f}ms warm {warm_rank_ms / lookups:6.3f}ms per lookup'
+                )
+
+    def seed(self, count, rng):
+        batch = 5000
+        for offset in range(0, count, batch):
+            size = min(batch, count - offset)
+            with transaction.atomic():
+                users = User.objects.bulk_create(
+                    User(
+                        id=offset + i + 1,
+                        discord_id=str(10 ** 17 + offset + i),
+                        username=f'member{offset + i}',
+                        key_balance=int(rng.paretovariate(1.5) * 10) - 10,
+                    )
+                    for i in range(size)
+                )
+                UserStats.objects.bulk_create(
+                    UserStats(
+                        user_id=user.id,
+                        redemption_count=redemptions,
+                        keys_spent=redemptions * rng.choice([50, 100, 250, 500]),
+                    )
+                    for user in users
+                    for redemptions in [int(rng.expovariate(0.5))]
+                    if redemptions
+                )
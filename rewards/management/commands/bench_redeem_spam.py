@@ -0,0 +1,92 @@
+"""
+Spam the redeem API the way a drop does and count the transactions it costs.
+
+--users members each fire --clicks identical redeem requests for the same
+reward at once (a button mashed, or a script), all on one ASGI event loop
+against a throwaway database, then keep clicking for --seconds. Runs with
+the redeem protection off and on, and reports how many redemption
+transactions ran, the responses and the throughput. Usage:
+    python manage.py bench_redeem_spam --users 200 --clicks 10
+"""
+
+import asyncio
+import time
+from collections import Counter
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, override_settings
+from django.urls import reverse
+
+from rewards import services
+from rewards.models import RedemptionLog, Reward, User
+from ._utils import new_session, temporary_database
+
+MODES = {
+    'unprotected': {'REDEEM_RATE': 0, 'REDEEM_IP_RATE': 0, 'REDEEM_COALESCE': False},
+    'protected': {},
+}
+
+
+class Command(BaseCommand):
+    help = 'Measure redemption transactions under spammed redeem requests, with and without protection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--clicks', type=int, default=10, help='Identical requests per user fired at once')
+        parser.add_argument('--seconds', type=float, default=2.0, help='How long users keep clicking afterwards')
+
+    def handle(self, *args, **options):
+        for mode, overrides in MODES.items():
+            with temporary_database(), override_settings(DEBUG=False, **overrides):
+                cache.clear()
+                reward = Reward.objects.create(name='Drop', key_cost=10)
+                users = User.objects.bulk_create(
+                    User(discord_id=str(10 ** 17 + i), username=f'member{i}', key_balance=100)
+                    for i in range(options['users'])
+                )
+                sessions = [new_session(user_id=user.id) for user in users]
+                url = reverse('redeem_reward', args=[reward.id])
+
+                with mock.patch.object(services, 'redeem', wraps=services.redeem) as redeem:
+                    statuses, elapsed = asyncio.run(self.spam(url, sessions, options))
+                redeemed = RedemptionLog.objects.filter(reward=reward).count()
+                if redeemed != len(users):
+                    raise CommandError(f'{mode}: {redeemed} redemptions for {len(users)} users')
+
+                breakdown = ', '.join(f'{count} x {status}' for status, count in sorted(statuses.items()))
+                self.stdout.write(
+                    f'{mode:<12} {sum(statuses.values()):>6} requests in {elapsed:5.2f}s, '
+                    f'{redeem.call_count:>6} transactions | {breakdown}'
+                )
+
+    @staticmethod
+    async def spam(url, sessions, options):
+        statuses = Counter()
+
+        async def click(client):
+            response = await client.post(url)
+            statuses[response.status_code] += 1
+
+        clients = []
+        for i, session_key in enumerate(sessions):
+            client = AsyncClient(client=(f'10.0.{i // 256}.{i % 256}', 40000))
+            client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+            clients.append(client)
+
+        start = time.perf_counter()
+        # The burst: every user's clicks land together.
+        await asyncio.gather(*(click(client) for client in clients for _ in range(options['clicks'])))
+        # Then everyone keeps mashing the button.
+        deadline = time.perf_counter() + options['seconds']
+        while time.perf_counter() < deadline:
+            await asyncio.gather(*(click(client) for client in clients))
+        elapsed = time.perf_counter() - start
+        # The ORM ran on sync_to_async's thread, which outlives this loop;
+        # close its connection before the database is destroyed.
+        await sync_to_async(connections.close_all)()
+        return statuses, elapsed
@@ -0,0 +1,64 @@
+"""
+Count session database writes per request on read-only pages.
+
+Compares the old setup (database sessions saved on every request) with the
+session engines this project supports, for a logged-in user browsing the
+landing page and dashboard. Usage:
+    python manage.py bench_sessions --requests 200
+"""
+
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rewards.models import User
+from ._utils import temporary_database
+
+PROFILES = [
+    ('db, save every request (old)', 'django.contrib.sessions.backends.db', True),
+    ('db, sliding refresh', 'django.contrib.sessions.backends.db', False),
+    ('cache, sliding refresh', 'django.contrib.sessions.backends.cache', False),
+    ('signed cookies, sliding refresh', 'django.contrib.sessions.backends.signed_cookies', False),
+]
+
+WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class Command(BaseCommand):
+    help = 'Measure database writes per read-only request for each session engine'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, **options):
+        pages = [reverse('landing'), reverse('dashboard')]
+        with temporary_database():
+            user = User.objects.create(discord_id='bench-session', username='bench', key_balance=100)
+            for label, engine, save_every_request in PROFILES:
+                with override_settings(SESSION_ENGINE=engine, SESSION_SAVE_EVERY_REQUEST=save_every_request):
+                    store = import_module(engine).SessionStore()
+                    store.update({'user_id': user.id, 'discord_id': user.discord_id})
+                    store.save()
+                    client = Client()
+                    client.cookies[settings.SESSION_COOKIE_NAME] = store.session_key
+
+                    with CaptureQueriesContext(connection) as queries:
+                        start = time.perf_counter()
+                        for i in range(options['requests']):
+                            response = client.get(pages[i % len(pages)])
+                            assert response.status_code == 200, response.status_code
+                        elapsed = time.perf_counter() - start
+
+                writes = sum(1 for q in queries if q['sql'].lstrip().upper().startswith(WRITE_PREFIXES))
+                session_queries = sum(1 for q in queries if 'django_session' in q['sql'])
+                self.stdout.write(
+                    f'{label:>32}: {writes / options["requests"]:.3f} writes/request, '
+                    f'{session_queries / options["requests"]:.2f} session queries/request, '
+                    f'{options["requests"] / elapsed:.0f} req/s'
+                )
@@ -0,0 +1,94 @@
+"""
+Benchmark the signed award webhook at different batch sizes.
+
+Sends --awards signed award events through the full request stack (signature
+check, dedupe, set-based credit) on a throwaway database, once per batch
+size, then redelivers the last run to show duplicates being dropped.
+Usage:
+    python manage.py bench_webhook --awards 20000 --batch-sizes 1,10,100,500
+"""
+
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Sum
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from rewards import ledger, webhooks
+from rewards.models import User
+from ._utils import temporary_database
+
+SECRET = 'bench-secret'
+
+
+class Command(BaseCommand):
+    help = 'Measure award webhook throughput per batch size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--awards', type=int, default=20000)
+        parser.add_argument('--users', type=int, default=5000)
+        parser.add_argument('--batch-sizes', default='1,10,100,500')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        sizes = [int(size) for size in options['batch_sizes'].split(',')]
+        url = reverse('award_webhook')
+        client = Client()
+
+        with temporary_database(), override_settings(
+            DEBUG=False, AWARD_WEBHOOK_SECRET=SECRET, AWARD_WEBHOOK_MAX_EVENTS=max(sizes),
+        ):
+            expected = 0
+            for size in sizes:
+                events = [
+                    {'id': f'{size}-{i}', 'discord_id': str(10 ** 17 + rng.randrange(options['users'])),
+                     'amount': rng.choice([1, 5, 10])}
+                    for i in range(options['awards'])
+                ]
+                expected += sum(event['amount'] for event in events)
+                bodies = [
+                    json.dumps(events[start:start + size]).encode()
+                    for start in range(0, len(events), size)
+                ]
+                applied, elapsed, queries = self.send(client, url, bodies)
+                assert applied == len(events), (applied, len(events))
+                self.stdout.write(
+                    f'batch {size:>4}: {len(bodies):>6} requests in {elapsed:6.2f}s | '
+                    f'{len(events) / elapsed:7.0f} awards/s, {queries / len(bodies):5.1f} queries/request'
+                )
+
+            applied, elapsed, _ = self.send(client, url, bodies)
+            self.stdout.write(
+                f'redelivery of the last run: {applied} of {len(events)} applied in {elapsed:.2f}s'
+            )
+            total = User.objects.aggregate(total=Sum('key_balance'))['total']
+            assert applied == 0 and total == expected and not ledger.find_drift(), (applied, total, expected)
+
+    @staticmethod
+    def send(client, url, bodies):
+        applied = 0
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            start = time.perf_counter()
+            for body in bodies:
+                timestamp = str(int(time.time()))
+                response = client.post(
+                    url, body, content_type='application/json',
+                    HTTP_X_AWARD_TIMESTAMP=timestamp,
+                    HTTP_X_AWARD_SIGNATURE=webhooks.sign(SECRET, timestamp, body),
+                )
+                assert response.status_code == 200, response.content
+                applied += response.json()['applied']
+            elapsed = time.perf_counter() - start
+        return applied, elapsed, queries
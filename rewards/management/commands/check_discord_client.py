@@ -0,0 +1,123 @@
+"""
+Check the Discord clients' retry and rate-limit policy against a fake Discord.
+
+Runs the blocking and the async client against a local stand-in API that
+fails on cue, and checks that: a 5xx or a read timeout on the user lookup
+is retried; the same on the code exchange is not (the authorization code
+may already be spent); a short 429 is waited out, even for the code
+exchange; and a long global 429 fails at once, for that call and the ones
+after it, without reaching Discord again. Usage:
+    python manage.py check_discord_client
+"""
+
+import asyncio
+import time
+
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from rewards.discord_api import AsyncDiscordClient, DiscordAPIError, DiscordClient, RateLimiter
+from ._utils import fake_discord_server
+
+READ_TIMEOUT = 0.3
+STALL = 1.0
+
+
+class Command(BaseCommand):
+    help = 'Verify the Discord clients retry what is safe to retry and fail fast on long rate limits'
+
+    def handle(self, *args, **options):
+        self.failures = []
+        faults, calls = [], []
+        with fake_discord_server(faults=faults, calls=calls) as url, override_settings(
+            DISCORD_MAX_RETRIES=2, DISCORD_RETRY_BACKOFF=0.01, DISCORD_MAX_RATE_LIMIT_WAIT=5.0,
+        ):
+            clients = {
+                'sync': lambda: SyncCalls(DiscordClient(url, timeout=(1.0, READ_TIMEOUT), rate_limiter=RateLimiter())),
+                'async': lambda: AsyncCalls(AsyncDiscordClient(
+                    url, timeout=httpx.Timeout(READ_TIMEOUT, connect=1.0), rate_limiter=RateLimiter(),
+                )),
+            }
+            for name, make_client in clients.items():
+                self.check_client(name, make_client, faults, calls)
+
+        if self.failures:
+            raise CommandError(f'{len(self.failures)} check(s) failed: {"; ".join(self.failures)}')
+        self.stdout.write(self.style.SUCCESS('Discord client OK'))
+
+    def check_client(self, name, make_client, faults, calls):
+        unavailable = (503, {})
+        short_limit = (429, {'Retry-After': '0.1'})
+        long_global_limit = (429, {'Retry-After': '60', 'X-RateLimit-Global': 'true'})
+        cases = [
+            ('a 5xx on the user lookup is retried', 'user', [unavailable], True, 2),
+            ('a read timeout on the user lookup is retried', 'user', [STALL], True, 2),
+            ('a 5xx on the code exchange is not retried', 'token', [unavailable], False, 1),
+            ('a read timeout on the code exchange is not retried', 'token', [STALL], False, 1),
+            ('a short 429 on the code exchange is waited out', 'token', [short_limit], True, 2),
+            ('a long global 429 fails at once', 'user', [long_global_limit], False, 1),
+        ]
+        for label, call, scripted, succeeds, requests in cases:
+            client = make_client()
+            faults[:] = scripted
+            calls.clear()
+            start = time.perf_counter()
+            ok = client.call(call)
+            elapsed = time.perf_counter() - start
+            self.verify(
+                f'{name}: {label} ({len(calls)} request(s), {elapsed:.2f}s)',
+                ok == succeeds and len(calls) == requests,
+            )
+            if call == 'user' and scripted == [long_global_limit]:
+                calls.clear()
+                self.verify(
+                    f'{name}: ... and so does the next call, without a request',
+                    not client.call('token') and not calls and time.perf_counter() - start < 1,
+                )
+            client.close()
+
+    def verify(self, label, ok):
+        self.stdout.write(f'{"ok  " if ok else "FAIL"} {label}')
+        if not ok:
+            self.failures.append(label)
+
+
+class SyncCalls:
+    def __init__(self, client):
+        self.client = client
+
+    def call(self, name):
+        try:
+            if name == 'token':
+                self.client.exchange_code('check')
+            else:
+                self.client.get_current_user('fake-1')
+        except DiscordAPIError:
+            return False
+        return True
+
+    def close(self):
+        self.client.close()
+
+
+class AsyncCalls:
+    def __init__(self, client):
+        self.client = client
+        self.loop = asyncio.new_event_loop()
+
+    def call(self, name):
+        async def run():
+            if name == 'token':
+                await self.client.exchange_code('check')
+            else:
+                await self.client.get_current_user('fake-1')
+        try:
+            self.loop.run_until_complete(run())
+        except DiscordAPIError:
+            return False
+        return True
+
+    def close(self):
+        self.loop.run_until_complete(self.client.aclose())
+        self.loop.close()
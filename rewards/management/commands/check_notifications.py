@@ -0,0 +1,104 @@
+"""
+Check the admin notification outbox against a throwaway database.
+
+Checks that a dispatcher only sends the rows its lease claimed when
+another dispatcher leases some of the same rows between its read and its
+update (what happens without SELECT ... SKIP LOCKED, e.g. on SQLite); and,
+in digest mode, that the first digest is queued without --force and that
+digests count the keys redemptions debited, whatever the price is now.
+Emails go to Django's in-memory backend. Usage:
+    python manage.py check_notifications
+"""
+
+from datetime import timedelta
+
+from django.core import mail
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+
+from rewards import services
+from rewards.models import NotificationOutbox, RedemptionDigest, RedemptionLog, Reward, User
+from rewards.utils import dispatch_notification_outbox, queue_redemption_digest
+from ._utils import temporary_database
+
+
+class Command(BaseCommand):
+    help = 'Verify that outbox dispatchers never send the same email twice'
+
+    def handle(self, *args, **options):
+        self.failures = []
+        with temporary_database(), override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', ADMIN_EMAIL='admin@example.com',
+        ):
+            self.check_competing_dispatchers()
+        with temporary_database(), override_settings(
+            ADMIN_EMAIL='admin@example.com', REDEMPTION_NOTIFICATION_MODE='digest',
+            REDEMPTION_DIGEST_WINDOW=900, REDEMPTION_DIGEST_MAX_REDEMPTIONS=0,
+        ):
+            self.check_digests()
+
+        if self.failures:
+            raise CommandError(f'{len(self.failures)} check(s) failed: {"; ".join(self.failures)}')
+        self.stdout.write(self.style.SUCCESS('Notifications OK'))
+
+    def check_competing_dispatchers(self):
+        rows = NotificationOutbox.objects.bulk_create(
+            NotificationOutbox(recipient='admin@example.com', subject=f'Email {i}', body='') for i in range(10)
+        )
+        taken = [row.id for row in rows[::2]]
+        raced = []
+
+        def other_dispatcher(execute, sql, params, many, context):
+            # Lease half the batch, as another dispatcher would, just before this one's lease.
+            if sql.startswith('UPDATE') and not raced:
+                raced.append(True)
+                NotificationOutbox.objects.filter(id__in=taken).update(
+                    next_attempt_at=timezone.now() + timedelta(minutes=5),
+                )
+            return execute(sql, params, many, context)
+
+        mail.outbox = []
+        with connection.execute_wrapper(other_dispatcher):
+            sent, failed = dispatch_notification_outbox()
+        subjects = sorted(message.subject for message in mail.outbox)
+        expected = sorted(row.subject for row in rows if row.id not in taken)
+        self.verify(f'a dispatcher sends only the rows it leased ({sent} sent, {failed} failed)', subjects == expected)
+        self.verify(
+            '... and leaves the other dispatcher\'s rows pending',
+            NotificationOutbox.objects.filter(id__in=taken, status=NotificationOutbox.STATUS_PENDING).count() == len(taken),
+        )
+
+    def check_digests(self):
+        user = User.objects.create(discord_id='digest-check', username='digest', key_balance=1000)
+        rewards = [Reward.objects.create(name=f'Reward {i}', key_cost=10) for i in range(7)]
+        ages = [1700, 850, 600, 300, 60]
+        now = timezone.now()
+        for reward, age in zip(rewards, ages):
+            services.redeem(user.id, reward.id)
+            RedemptionLog.objects.filter(reward=reward).update(timestamp=now - timedelta(seconds=age))
+
+        digest = queue_redemption_digest()
+        self.verify(
+            f'the first digest is queued without --force ({digest and digest.redemption_count} redemptions)',
+            digest is not None and digest.redemption_count == 4,
+        )
+        self.verify('... and has an outbox email', NotificationOutbox.objects.count() == 1)
+
+        for reward in rewards[5:]:
+            services.redeem(user.id, reward.id)
+        Reward.objects.filter(id__in=[reward.id for reward in rewards]).update(key_cost=99)
+        RedemptionLog.objects.filter(reward__in=rewards[5:]).update(timestamp=now - timedelta(seconds=1000))
+        digest = queue_redemption_digest()
+        self.verify(
+            f'a digest counts the keys debited, not today\'s prices ({digest and digest.keys_spent} keys)',
+            digest is not None and digest.redemption_count == 2 and digest.keys_spent == 20,
+        )
+        self.verify('... and then nothing is pending', queue_redemption_digest() is None)
+        self.verify('two digests in all', RedemptionDigest.objects.count() == 2)
+
+    def verify(self, label, ok):
+        self.stdout.write(f'{"ok  " if ok else "FAIL"} {label}')
+        if not ok:
+            self.failures.append(label)
@@ -0,0 +1,263 @@
+"""
+Fail if any view issues more queries than its pinned budget.
+
+Every URL in rewards/urls.py has at least one scenario below, and every
+scenario a budget in QUERY_BUDGETS: the most queries it may issue with a
+cold cache, and then again straight away with the cache warm. Counts come
+from ``RequestMetricsMiddleware``, so they are exactly what production
+requests log. Each scenario runs against a small throwaway database.
+
+Run it before pushing; a view that starts issuing an extra query fails
+here, and in ``rewards.tests`` (``python manage.py test``), which runs the
+same scenarios one subtest each. When a change needs more queries on
+purpose, raise the budget in the same commit. Usage:
+    python manage.py check_query_budgets
+"""
+
+import itertools
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rewards import activity, catalog, codes, stock, urls, waitingroom, webhooks
+from rewards.models import (
+    Category, KeyTransaction, LeaderboardEntry, RedemptionLog, Reward, User, UserStats,
+)
+from ._utils import fake_discord_server, temporary_database
+
+TOKEN = 'budget-token'
+
+# scenario -> (cold, warm) maximum queries. Transaction statements (SAVEPOINT,
+# RELEASE) count, as they are round trips too.
+QUERY_BUDGETS = {
+    'landing': (1, 0),
+    'landing, revalidated': (0, 0),
+    'discord_login': (0, 0),
+    'discord_callback': (3, 3),
+    'dashboard': (8, 1),
+    'dashboard, category filter': (9, 1),
+    'logout': (0, 0),
+    'drop_queue': (2, 0),
+    'event_stream': (1, 0),
+    'catalog_categories_api': (1, 0),
+    'catalog_rewards_api': (1, 0),
+    'catalog_rewards_api, next page': (2, 0),
+    'catalog_rewards_api, revalidated': (0, 0),
+    'redeem_reward': (10, 9),
+    'redeem_reward, limited stock': (11, 10),
+    'redeem_reward, code pool': (12, 11),
+    'redeem_reward, scheduled drop': (10, 9),
+    'redeem_reward, already redeemed': (6, 4),
+    'key_history_api': (2, 1),
+    'grant_keys_api': (14, 12),
+    'activity_api': (0, 0),
+    'award_webhook': (10, 8),
+    'award_webhook, redelivery': (2, 2),
+    'leaderboard_api': (4, 0),
+    'leaderboard_api, anonymous': (1, 0),
+    'metrics': (0, 0),
+}
+
+
+def budget_settings(discord_url):
+    """Settings every scenario runs under, with Discord faked at ``discord_url``."""
+    return dict(
+        DEBUG=False, DB_REPLICA_ALIASES=[], DISCORD_API_BASE_URL=discord_url, DISCORD_CLIENT_ID='budget',
+        KEY_GRANT_API_TOKEN=TOKEN, ACTIVITY_API_TOKEN=TOKEN, AWARD_WEBHOOK_SECRET=TOKEN, METRICS_API_TOKEN=TOKEN,
+    )
+
+
+def measure(scenarios):
+    """Make every request cold, then warm; yields ``(label, state, budget, response, expected status)``."""
+    for label, url_name, request, status in scenarios:
+        cache.clear()
+        for state, budget in zip(('cold', 'warm'), QUERY_BUDGETS.get(label, (0, 0))):
+            yield label, state, budget, request(), status
+
+
+def coverage_failures(scenarios):
+    """URLs with no scenario and scenarios with no budget."""
+    failures = []
+    covered = {url_name for _, url_name, _, _ in scenarios}
+    missing = [pattern.name for pattern in urls.urlpatterns if pattern.name not in covered]
+    unbudgeted = [label for label, _, _, _ in scenarios if label not in QUERY_BUDGETS]
+    if missing:
+        failures.append(f'no scenario for {", ".join(missing)}')
+    if unbudgeted:
+        failures.append(f'no budget for {", ".join(unbudgeted)}')
+    return failures
+
+
+def login(client, user):
+    session = client.session
+    session.update({'user_id': user.id, 'discord_id': user.discord_id})
+    session.save()
+    client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+    return client
+
+
+class Command(BaseCommand):
+    help = 'Check every view against its pinned query budget'
+
+    def handle(self, *args, **options):
+        with temporary_database(), fake_discord_server() as discord_url, override_settings(
+            **budget_settings(discord_url)
+        ):
+            scenarios = list(self.scenarios(self.seed()))
+            try:
+                failures = self.run(scenarios)
+            finally:
+                activity.get_aggregator().stop(timeout=10)
+
+        failures += coverage_failures(scenarios)
+        if failures:
+            raise CommandError('query budgets exceeded:\n  ' + '\n  '.join(failures))
+        self.stdout.write(self.style.SUCCESS(f'{len(scenarios)} scenarios within budget'))
+
+    def run(self, scenarios):
+        failures = []
+        for label, state, budget, response, status in measure(scenarios):
+            if response.status_code != status:
+                raise CommandError(f'{label} ({state}): expected {status}, got {response.status_code}')
+            metrics = response.wsgi_request.metrics
+            over = metrics.queries > budget
+            result = self.style.ERROR('OVER') if over else self.style.SUCCESS('ok')
+            self.stdout.write(
+                f'{label:<36} {state:<5} {metrics.queries:>3} queries (budget {budget:>2}) '
+                f'{metrics.db_seconds * 1000:7.2f}ms db  {metrics.cache_hits:>2} hits '
+                f'{metrics.cache_misses:>2} misses  {result}'
+            )
+            if over:
+                failures.append(f'{label} ({state}): {metrics.queries} queries, budget {budget}')
+        return failures
+
+    def seed(self):
+        categories = Category.objects.bulk_create(
+            Category(name=f'Category {i}', slug=f'category-{i}', order=i) for i in range(3)
+        )
+        Reward.objects.bulk_create(
+            Reward(name=f'Reward {i}', key_cost=10, category=categories[i % 3]) for i in range(30)
+        )
+        for i in range(2):
+            stock.restock(Reward.objects.create(name=f'Limited {i}', key_cost=10, category=categories[0], stock_limit=100))
+            codes.import_codes(
+                Reward.objects.create(name=f'Pooled {i}', key_cost=10, category=categories[1], delivers_codes=True),
+                (f'POOLED-{i}-{n}' for n in range(10)),
+            )
+            Reward.objects.create(
+                name=f'Drop {i}', key_cost=10, category=categories[2], available_from=timezone.now() - timedelta(minutes=1),
+            )
+        LeaderboardEntry.objects.bulk_create(
+            LeaderboardEntry(position=i + 1, username=f'winner{i}', order=i) for i in range(10)
+        )
+        users = User.objects.bulk_create(
+            User(discord_id=str(10 ** 17 + i), username=f'member{i}', key_balance=1000) for i in range(20)
+        )
+        KeyTransaction.objects.bulk_create(
+            KeyTransaction(user=user, kind=KeyTransaction.KIND_OPENING, amount=user.key_balance) for user in users
+        )
+        UserStats.objects.bulk_create(
+            UserStats(user=user, redemption_count=i, keys_spent=10 * i) for i, user in enumerate(users)
+        )
+        return users[0]
+
+    def scenarios(self, user):
+        """``(label, url name, request, expected status)``; each request is made twice."""
+        member = login(Client(), user)
+        category = Category.objects.order_by('id').first()
+        rewards = iter(Reward.objects.filter(
+            stock_limit__isnull=True, delivers_codes=False, available_from__isnull=True,
+        ).order_by('id'))
+        drops = iter(Reward.objects.filter(available_from__isnull=False).order_by('id'))
+        drop = Reward.objects.filter(available_from__isnull=False).order_by('id').last()
+        limited = iter(Reward.objects.filter(stock_limit__isnull=False).order_by('id'))
+        pooled = iter(Reward.objects.filter(delivers_codes=True).order_by('id'))
+        redeemed = next(rewards)
+        cursor = catalog.encode_cursor(Reward.objects.filter(category=category).order_by('key_cost', 'name', 'id')[4])
+        RedemptionLog.objects.create(user=user, reward=redeemed)
+        batches = itertools.count()
+        events = itertools.count()
+
+        def revalidate(url_name):
+            etag = Client().get(reverse(url_name))['ETag']
+            return Client().get(reverse(url_name), HTTP_IF_NONE_MATCH=etag)
+
+        def oauth_callback():
+            # The fake Discord hands out a new user per login.
+            client = Client()
+            client.get(reverse('discord_login'))
+            return client.get(reverse('discord_callback'), {'code': 'budget', 'state': client.session['oauth_state']})
+
+        def signed_award(ids):
+            body = json.dumps([
+                {'id': f'budget-{i}', 'discord_id': str(10 ** 17 + i % 20), 'amount': 5} for i in ids
+            ]).encode()
+            timestamp = str(int(time.time()))
+            return Client().post(
+                reverse('award_webhook'), body, content_type='application/json',
+                HTTP_X_AWARD_TIMESTAMP=timestamp, HTTP_X_AWARD_SIGNATURE=webhooks.sign(TOKEN, timestamp, body),
+            )
+
+        def admitted_redeem(reward):
+            return member.post(
+                reverse('redeem_reward', args=[reward.id]),
+                HTTP_X_ADMISSION_TOKEN=waitingroom.issue_token(user.id, reward.id),
+            )
+
+        bearer = {'HTTP_AUTHORIZATION': f'Bearer {TOKEN}'}
+        yield 'landing', 'landing', lambda: Client().get(reverse('landing')), 200
+        yield 'landing, revalidated', 'landing', lambda: revalidate('landing'), 304
+        yield 'discord_login', 'discord_login', lambda: Client().get(reverse('discord_login')), 302
+        yield 'discord_callback', 'discord_callback', oauth_callback, 302
+        yield 'dashboard', 'dashboard', lambda: member.get(reverse('dashboard')), 200
+        yield 'dashboard, category filter', 'dashboard', lambda: member.get(
+            reverse('dashboard'), {'category': category.slug}
+        ), 200
+        yield 'drop_queue', 'drop_queue', lambda: member.post(reverse('drop_queue', args=[drop.id])), 200
+        # The view only; what a stream reads while open is measured by bench_events.
+        yield 'event_stream', 'event_stream', lambda: member.get(reverse('event_stream')), 200
+        yield 'catalog_categories_api', 'catalog_categories_api', lambda: Client().get(
+            reverse('catalog_categories_api')
+        ), 200
+        yield 'catalog_rewards_api', 'catalog_rewards_api', lambda: Client().get(reverse('catalog_rewards_api')), 200
+        yield 'catalog_rewards_api, next page', 'catalog_rewards_api', lambda: Client().get(
+            reverse('catalog_rewards_api'), {'category': category.slug, 'fields': 'name,key_cost', 'limit': 5, 'cursor': cursor}
+        ), 200
+        yield 'catalog_rewards_api, revalidated', 'catalog_rewards_api', lambda: revalidate('catalog_rewards_api'), 304
+        yield 'logout', 'logout', lambda: login(Client(), user).get(reverse('logout')), 302
+        yield 'redeem_reward', 'redeem_reward', lambda: member.post(
+            reverse('redeem_reward', args=[next(rewards).id])
+        ), 200
+        yield 'redeem_reward, limited stock', 'redeem_reward', lambda: member.post(
+            reverse('redeem_reward', args=[next(limited).id])
+        ), 200
+        yield 'redeem_reward, code pool', 'redeem_reward', lambda: member.post(
+            reverse('redeem_reward', args=[next(pooled).id])
+        ), 200
+        yield 'redeem_reward, scheduled drop', 'redeem_reward', lambda: admitted_redeem(next(drops)), 200
+        yield 'redeem_reward, already redeemed', 'redeem_reward', lambda: member.post(
+            reverse('redeem_reward', args=[redeemed.id])
+        ), 400
+        yield 'key_history_api', 'key_history_api', lambda: member.get(reverse('key_history_api')), 200
+        yield 'grant_keys_api', 'grant_keys_api', lambda: Client().post(
+            f'{reverse("grant_keys_api")}?batch_id=budget-{next(batches)}',
+            ''.join(f'{10 ** 17 + i},5\n' for i in range(40)), content_type='text/csv', **bearer,
+        ), 200
+        yield 'activity_api', 'activity_api', lambda: Client().post(
+            reverse('activity_api'), json.dumps([{'discord_id': str(10 ** 17), 'type': 'message'}]),
+            content_type='application/json', **bearer,
+        ), 202
+        yield 'award_webhook', 'award_webhook', lambda: signed_award(
+            [next(events) for _ in range(20)]
+        ), 200
+        yield 'award_webhook, redelivery', 'award_webhook', lambda: signed_award(range(20)), 200
+        yield 'leaderboard_api', 'leaderboard_api', lambda: member.get(reverse('leaderboard_api')), 200
+        yield 'leaderboard_api, anonymous', 'leaderboard_api', lambda: Client().get(reverse('leaderboard_api')), 200
+        yield 'metrics', 'metrics', lambda: Client().get(reverse('metrics'), **bearer), 200
@@ -0,0 +1,127 @@
+"""
+Check read-replica routing against two local SQLite databases.
+
+Builds a throwaway primary, copies it to a file that stands in for a
+replica (then lags behind, since nothing replicates to it), and checks that:
+catalog reads go to the replica; reads stay on the primary right after a
+catalog write and for a visitor who just wrote; other models never leave
+the primary; and reads fall back to the primary when the replica is gone.
+Usage:
+    python manage.py check_replica_routing
+"""
+
+import os
+import sqlite3
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from rewards import routers
+from rewards.middleware import REPLICA_PIN_COOKIE
+from rewards.models import Category, Reward, User
+from ._utils import temporary_database
+
+REPLICA = 'replica_check'
+
+
+class Command(BaseCommand):
+    help = 'Verify that catalog reads use a replica, with pinning and fallback'
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('This check builds its replica from an SQLite primary')
+        self.failures = []
+        with temporary_database() as primary, ExitStack() as stack:
+            category = Category.objects.create(name='Games', slug='games')
+            Reward.objects.create(name='Replicated reward', key_cost=10, category=category)
+            user = User.objects.create(discord_id='replica-check', username='replica', key_balance=100)
+
+            replica_path = primary.settings_dict['NAME'] + '.replica'
+            primary.ensure_connection()
+            with sqlite3.connect(replica_path) as target:
+                primary.connection.backup(target)
+            target.close()
+            connections.settings[REPLICA] = {
+                **primary.settings_dict, 'NAME': f'file:{replica_path}?mode=ro', 'OPTIONS': {'uri': True},
+            }
+            stack.callback(self.drop_alias)
+            stack.enter_context(override_settings(DB_REPLICA_ALIASES=[REPLICA], DB_REPLICA_PIN_SECONDS=60))
+            cache.clear()
+
+            queries = Counter()
+            for alias in ('default', REPLICA):
+                stack.enter_context(connections[alias].execute_wrapper(self.counter(queries, alias)))
+
+            self.expect('catalog read goes to the replica', queries, REPLICA, lambda: Reward.objects.count())
+            self.expect('user read stays on the primary', queries, 'default', lambda: User.objects.count())
+
+            Reward.objects.create(name='Fresh reward', key_cost=5, category=category)
+            count = self.expect(
+                'catalog read right after a catalog write uses the primary', queries, 'default',
+                lambda: Reward.objects.count(),
+            )
+            self.verify('... and sees the write', count == 2)
+            cache.clear()
+            count = self.expect(
+                'once the pin expires it uses the replica again', queries, REPLICA, lambda: Reward.objects.count(),
+            )
+            self.verify('... which lags behind (1 reward, not 2)', count == 1)
+
+            client = Client()
+            session = client.session
+            session.update({'user_id': user.id, 'discord_id': user.discord_id})
+            session.save()
+            client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+            response = client.post(reverse('redeem_reward', args=[Reward.objects.using('default').get(name='Fresh reward').id]))
+            self.verify(f'a redemption succeeds ({response.status_code})', response.status_code == 200)
+            self.verify('... and sets the pin cookie', REPLICA_PIN_COOKIE in response.cookies)
+            cache.clear()
+            queries.clear()
+            client.get(reverse('dashboard'))
+            self.verify(f'the next page reads the catalog from the primary ({dict(queries)})', not queries[REPLICA])
+            del client.cookies[REPLICA_PIN_COOKIE]
+            cache.clear()
+            queries.clear()
+            client.get(reverse('dashboard'))
+            self.verify(f'without the cookie it reads from the replica ({dict(queries)})', queries[REPLICA] > 0)
+
+            connections[REPLICA].close()
+            os.remove(replica_path)
+            self.expect(
+                'with the replica gone, reads fall back to the primary', queries, 'default',
+                lambda: Reward.objects.count(),
+            )
+
+        if self.failures:
+            raise CommandError(f'{len(self.failures)} check(s) failed: {"; ".join(self.failures)}')
+        self.stdout.write(self.style.SUCCESS('Replica routing OK'))
+
+    @staticmethod
+    def counter(queries, alias):
+        def count(execute, sql, params, many, context):
+            queries[alias] += 1
+            return execute(sql, params, many, context)
+        return count
+
+    def expect(self, label, queries, alias, read):
+        queries.clear()
+        result = read()
+        self.verify(f'{label} ({dict(queries)})', queries[alias] > 0 and sum(queries.values()) == queries[alias])
+        return result
+
+    def verify(self, label, ok):
+        self.stdout.write(f'{"ok  " if ok else "FAIL"} {label}')
+        if not ok:
+            self.failures.append(label)
+
+    @staticmethod
+    def drop_alias():
+        connections[REPLICA].close()
+        del connections.settings[REPLICA]
+        routers._down_until.pop(REPLICA, None)
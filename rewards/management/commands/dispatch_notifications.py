@@ -0,0 +1,42 @@
+"""
+Deliver queued notification emails from the NotificationOutbox.
+
+Run it alongside the web server (e.g. under systemd or supervisor):
+    python manage.py dispatch_notifications
+or from cron with --once. In digest mode it also queues the redemption
+digest whenever one is due.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from rewards.utils import dispatch_notification_outbox, queue_redemption_digest
+
+
+class Command(BaseCommand):
+    help = 'Send pending notification emails in batches over one SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep when idle')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--max-attempts', type=int, default=None)
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            if settings.REDEMPTION_NOTIFICATION_MODE == 'digest':
+                queue_redemption_digest()
+            sent, failed = dispatch_notification_outbox(
+                batch_size=options['batch_size'],
+                max_attempts=options['max_attempts'],
+            )
+            if sent or failed:
+                self.stdout.write(f'Sent {sent}, failed {failed}')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,232 @@
+"""
+EXPLAIN every query the views run over a large synthetic dataset.
+
+Seeds a throwaway database, requests each page and API endpoint (plus the
+redemption log admin) with the caches cold, and runs EXPLAIN on every
+statement they issued. Fails if any statement scans a whole table rather
+than searching an index; scans of a covering index are reported but
+allowed, as are full reads of SMALL_TABLES and the whole-table lists in
+LISTS_EVERY_ROW. SQLite and PostgreSQL plans
+are understood. Usage:
+    python manage.py explain_queries --users 100000
+"""
+
+import random
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rewards import catalog, codes
+from rewards.models import (
+    Category, KeyTransaction, LeaderboardEntry, RedemptionLog, Reward, RewardCode, User, UserStats,
+)
+from ._utils import temporary_database
+
+# Admin-managed lookup tables that stay a few dozen rows; reading them whole is fine.
+SMALL_TABLES = {'rewards_category'}
+# Tables a request reads whole by design: the redemption log admin's reward
+# filter offers every reward.
+LISTS_EVERY_ROW = {
+    'admin redemption log': {'rewards_reward'},
+    'admin redemption log, one year': {'rewards_reward'},
+}
+SKIPPED_STATEMENTS = ('SAVEPOINT', 'RELEASE', 'ROLLBACK', 'BEGIN', 'COMMIT', 'PRAGMA', 'SET')
+
+SQLITE_SCAN = re.compile(r'^SCAN (\S+)(?: USING (COVERING )?INDEX (\S+))?')
+POSTGRES_SCAN = re.compile(r'Seq Scan on (\S+)')
+
+
+class Command(BaseCommand):
+    help = 'Fail if any view query does a full table scan on a large dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--rewards', type=int, default=2000)
+        parser.add_argument('--redemptions', type=int, default=200000)
+        parser.add_argument('--leaderboard', type=int, default=2000)
+        parser.add_argument('--codes', type=int, default=100000, help='Size of the code pool (at most --users), half of it assigned')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan, not only scans')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with temporary_database(), override_settings(DB_REPLICA_ALIASES=[]):
+            self.seed(options, rng)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            full_scans = 0
+            for label, request in self.requests(options):
+                statements = self.capture(request)
+                problems = []
+                for sql, params in statements:
+                    for kind, detail in self.scans(sql, params, SMALL_TABLES | LISTS_EVERY_ROW.get(label, set())):
+                        if kind == 'table':
+                            problems.append(detail)
+                        elif options['verbose_plans']:
+                            self.stdout.write(f'      {detail}')
+                full_scans += len(problems)
+                status = self.style.ERROR('FULL SCAN') if problems else self.style.SUCCESS('ok')
+                self.stdout.write(f'{label:<40} {len(statements):>3} queries  {status}')
+                for detail in problems:
+                    self.stdout.write(f'      {detail}')
+        if full_scans:
+            raise CommandError(f'{full_scans} full table scan(s) found')
+
+    def seed(self, options, rng):
+        now = timezone.now()
+        with transaction.atomic():
+            categories = Category.objects.bulk_create(
+                Category(name=f'Category {i}', slug=f'category-{i}', order=i) for i in range(options['categories'])
+            )
+            rewards = Reward.objects.bulk_create(
+                Reward(
+                    name=f'Reward {i}', key_cost=rng.choice([50, 100, 250, 500, 1000]),
+                    category=rng.choice(categories), is_active=rng.random() < 0.7,
+                )
+                for i in range(options['rewards'])
+            )
+            LeaderboardEntry.objects.bulk_create(
+                LeaderboardEntry(
+                    position=i % 10 + 1, username=f'winner{i}', order=i, is_active=i < 10 or rng.random() < 0.05,
+                )
+                for i in range(options['leaderboard'])
+            )
+        for offset in range(0, options['users'], 5000):
+            with transaction.atomic():
+                users = User.objects.bulk_create(
+                    User(discord_id=str(10 ** 17 + i), username=f'member{i}', key_balance=rng.randrange(2000))
+                    for i in range(offset, min(offset + 5000, options['users']))
+                )
+                KeyTransaction.objects.bulk_create(
+                    KeyTransaction(user=user, kind=KeyTransaction.KIND_OPENING, amount=user.key_balance)
+                    for user in users
+                )
+        user_ids = list(User.objects.values_list('id', flat=True))
+        pairs = set()
+        while len(pairs) < options['redemptions']:
+            pairs.add((rng.choice(user_ids), rng.choice(rewards).id))
+        pairs = sorted(pairs)
+        for offset in range(0, len(pairs), 5000):
+            with transaction.atomic():
+                logs = RedemptionLog.objects.bulk_create(
+                    RedemptionLog(user_id=user_id, reward_id=reward_id) for user_id, reward_id in pairs[offset:offset + 5000]
+                )
+                # Spread timestamps over a year for the date hierarchy.
+                for log in logs[::50]:
+                    RedemptionLog.objects.filter(id=log.id).update(timestamp=now - timedelta(days=rng.randrange(365)))
+        costs = dict(Reward.objects.values_list('id', 'key_cost'))
+        stats = {}
+        for user_id, reward_id in pairs:
+            count, spent = stats.get(user_id, (0, 0))
+            stats[user_id] = (count + 1, spent + costs[reward_id])
+        UserStats.objects.bulk_create(
+            (UserStats(user_id=user_id, redemption_count=count, keys_spent=spent) for user_id, (count, spent) in stats.items()),
+            batch_size=5000,
+        )
+        # Free, so the redemption reaches the code claim whatever the member's
+        # balance; the first users (not the member) already got a code.
+        drop = Reward.objects.create(name='Code drop', key_cost=0, delivers_codes=True)
+        size = min(options['codes'], options['users'])
+        handed_out = size // 2
+        with transaction.atomic():
+            logs = RedemptionLog.objects.bulk_create(
+                (RedemptionLog(user_id=user_id, reward=drop) for user_id in sorted(user_ids)[:handed_out]),
+                batch_size=5000,
+            )
+            RewardCode.objects.bulk_create(
+                (
+                    RewardCode(reward=drop, code=f'CODE-{i:08d}', redemption=log, assigned_at=now)
+                    for i, log in enumerate(logs)
+                ),
+                batch_size=5000,
+            )
+        codes.import_codes(drop, (f'CODE-{i:08d}' for i in range(handed_out, size)))
+
+    def requests(self, options):
+        """``(label, callable)`` for every view, each run with cold caches."""
+        user = User.objects.order_by('id')[options['users'] // 2]
+        member = Client()
+        session = member.session
+        session.update({'user_id': user.id, 'discord_id': user.discord_id})
+        session.save()
+        member.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        category = Category.objects.order_by('id').first()
+        redeemed = set(RedemptionLog.objects.filter(user=user).values_list('reward_id', flat=True))
+        reward = Reward.objects.filter(is_active=True, delivers_codes=False).exclude(id__in=redeemed).order_by('key_cost').first()
+        drop = Reward.objects.get(delivers_codes=True)
+        last_tx = KeyTransaction.objects.filter(user=user).order_by('-id').values_list('id', flat=True).first()
+
+        admin = get_user_model().objects.create_superuser('explain', 'explain@example.com', 'explain')
+        staff = Client()
+        staff.force_login(admin)
+
+        yield 'landing', lambda: Client().get(reverse('landing'))
+        yield 'dashboard', lambda: member.get(reverse('dashboard'))
+        yield 'dashboard, category filter', lambda: member.get(reverse('dashboard'), {'category': category.slug})
+        for metric in ('keys_spent', 'redemptions', 'balance'):
+            yield f'leaderboard api, {metric}', lambda metric=metric: member.get(
+                reverse('leaderboard_api'), {'metric': metric}
+            )
+        active = Reward.objects.filter(is_active=True).order_by('key_cost', 'name', 'id')
+        deep = active[active.count() // 2]
+        yield 'catalog api', lambda: Client().get(reverse('catalog_rewards_api'))
+        yield 'catalog api, deep page', lambda: Client().get(
+            reverse('catalog_rewards_api'), {'cursor': catalog.encode_cursor(deep)}
+        )
+        yield 'catalog api, category page', lambda: Client().get(
+            reverse('catalog_rewards_api'), {'category': category.slug, 'cursor': catalog.encode_cursor(deep)}
+        )
+        yield 'key history api', lambda: member.get(reverse('key_history_api'))
+        yield 'key history api, next page', lambda: member.get(reverse('key_history_api'), {'before': last_tx + 1})
+        yield 'redeem', lambda: member.post(reverse('redeem_reward', args=[reward.id]))
+        yield 'redeem, code pool', lambda: member.post(reverse('redeem_reward', args=[drop.id]))
+        yield 'admin redemption log', lambda: staff.get(reverse('admin:rewards_redemptionlog_changelist'))
+        yield 'admin redemption log, one year', lambda: staff.get(
+            reverse('admin:rewards_redemptionlog_changelist'), {'timestamp__year': timezone.now().year}
+        )
+
+    @staticmethod
+    def capture(request):
+        statements = []
+
+        def record(execute, sql, params, many, context):
+            if not many and not sql.lstrip().upper().startswith(SKIPPED_STATEMENTS):
+                statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        cache.clear()
+        with connection.execute_wrapper(record):
+            response = request()
+        assert response.status_code in (200, 302), response.status_code
+        return statements
+
+    @staticmethod
+    def scans(sql, params, whole_tables):
+        """``('table' | 'index', detail)`` for every scan in the statement's plan, bar reads of ``whole_tables``."""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                for row in cursor.fetchall():
+                    match = SQLITE_SCAN.match(row[-1])
+                    if match is None:
+                        continue
+                    table = match.group(1)
+                    if match.group(3):
+                        yield 'index', f'{row[-1]}  <- {sql[:120]}'
+                    elif table not in whole_tables:
+                        yield 'table', f'{row[-1]}  <- {sql[:120]}'
+            else:
+                cursor.execute('EXPLAIN ' + sql, params)
+                for (line,) in cursor.fetchall():
+                    match = POSTGRES_SCAN.search(line)
+                    if match and match.group(1) not in whole_tables:
+                        yield 'table', f'{line.strip()}  <- {sql[:120]}'
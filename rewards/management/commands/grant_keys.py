@@ -0,0 +1,48 @@
+"""
+Bulk-grant keys from a CSV (discord_id,amount) or JSON Lines file.
+
+The file is streamed and applied in chunked transactions; re-running with the
+same --batch-id is a no-op once the batch finished, and resumes an
+interrupted one. Use - to read from stdin. Usage:
+    python manage.py grant_keys event-2024-06.csv --batch-id event-2024-06
+"""
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rewards import grants
+
+
+class Command(BaseCommand):
+    help = 'Grant keys to many users from a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to read, or - for stdin')
+        parser.add_argument('--batch-id', required=True, help='Unique id that makes re-runs safe')
+        parser.add_argument('--format', choices=grants.FORMATS, help='Defaults to the file extension, else csv')
+        parser.add_argument('--chunk-size', type=int, help='Rows per transaction (default KEY_GRANT_CHUNK_SIZE)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            result = grants.apply_grants(grants.parse(stream, fmt), options['batch_id'], options['chunk_size'])
+        except grants.GrantFormatError as e:
+            raise CommandError(f'{e}; earlier rows were applied, re-run with the same --batch-id to resume')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        batch = result.batch
+        if result.already_applied:
+            self.stdout.write(
+                f'Batch {batch.batch_id} was already applied ({batch.rows_applied} rows, {batch.keys_granted} keys)'
+            )
+            return
+        self.stdout.write(
+            f'Applied {result.rows} rows ({result.keys} keys) in {result.seconds:.1f}s, '
+            f'{result.rows_per_second:.0f} rows/s; batch {batch.batch_id} totals '
+            f'{batch.rows_applied} rows, {batch.keys_granted} keys'
+        )
@@ -0,0 +1,48 @@
+"""
+Import fulfilment codes into a reward's code pool, one code per line.
+
+The file is streamed and imported in chunked transactions; codes already in
+the pool are skipped, so importing the same file twice is harmless. Use -
+to read from stdin. Usage:
+    python manage.py import_codes 42 steam-keys.txt
+"""
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rewards import codes
+from rewards.models import Reward
+
+
+class Command(BaseCommand):
+    help = "Import codes into a reward's code pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('reward_id', type=int)
+        parser.add_argument('path', help='File to read, or - for stdin')
+        parser.add_argument('--chunk-size', type=int, help='Codes per transaction (default CODE_IMPORT_CHUNK_SIZE)')
+
+    def handle(self, *args, **options):
+        try:
+            reward = Reward.objects.get(pk=options['reward_id'])
+        except Reward.DoesNotExist:
+            raise CommandError(f'No reward with id {options["reward_id"]}')
+
+        path = options['path']
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8')
+        try:
+            result = codes.import_codes(reward, codes.parse(stream), options['chunk_size'])
+        except codes.CodeFormatError as e:
+            raise CommandError(f'{e}; earlier chunks may have been imported, fix the file and import it again')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.stdout.write(
+            f'Imported {result.added} codes into {reward.name} ({result.skipped} duplicates skipped) '
+            f'in {result.seconds:.1f}s, {result.rows_per_second:.0f} codes/s; '
+            f'{codes.remaining(reward.pk)} unassigned'
+        )
+        if not reward.delivers_codes:
+            self.stdout.write(self.style.WARNING(f'{reward.name} does not deliver codes yet; enable it in the admin'))
@@ -0,0 +1,35 @@
+"""
+Check every key balance against the key ledger.
+
+Recomputes balances from KeyTransaction in one GROUP BY and reports users
+whose User.key_balance disagrees. Exits non-zero on drift so a scheduler
+can alert; --fix resets drifted balances to the ledger sum. Meant for cron:
+    0 * * * * python manage.py reconcile_ledger
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rewards import ledger
+
+
+class Command(BaseCommand):
+    help = 'Recompute key balances from the ledger and flag drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Reset drifted balances to the ledger sum')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        drift = ledger.reconcile(fix=options['fix'])
+        elapsed = time.perf_counter() - start
+
+        for user_id, balance, ledger_balance in drift:
+            self.stdout.write(f'user {user_id}: balance {balance}, ledger {ledger_balance} ({balance - ledger_balance:+d})')
+        if not drift:
+            self.stdout.write(f'All balances match the ledger ({elapsed:.2f}s)')
+        elif options['fix']:
+            self.stdout.write(f'Reset {len(drift)} balance(s) to the ledger sum ({elapsed:.2f}s)')
+        else:
+            raise CommandError(f'{len(drift)} balance(s) drifted from the ledger; re-run with --fix to repair')
@@ -0,0 +1,25 @@
+"""
+Queue the admin redemption digest if one is due.
+
+Meant for cron or another scheduler when REDEMPTION_NOTIFICATION_MODE is
+'digest' (dispatch_notifications also does this while it runs):
+    */5 * * * * python manage.py send_redemption_digest
+"""
+
+from django.core.management.base import BaseCommand
+
+from rewards.utils import queue_redemption_digest
+
+
+class Command(BaseCommand):
+    help = 'Queue a summary email of recent redemptions for the admin'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Queue a digest even if the window has not elapsed')
+
+    def handle(self, *args, **options):
+        digest = queue_redemption_digest(force=options['force'])
+        if digest:
+            self.stdout.write(f'Queued digest of {digest.redemption_count} redemptions ({digest.keys_spent} keys)')
+        else:
+            self.stdout.write('No digest due')
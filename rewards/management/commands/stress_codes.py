@@ -0,0 +1,70 @@
+"""
+Import large code pools and claim them from parallel redeemers.
+
+For each --pools size, streams that many codes into a new code-delivering
+reward's pool on a throwaway database, then redeems it for --redeemers
+funded users from --threads threads. Checks that every successful
+redemption got exactly one code, no code went to two redemptions, and once a
+pool ran dry the rest were refused as out of stock. Claims walk the index of
+unassigned codes, so redemptions/sec should not drop as pools grow. Usage:
+    python manage.py stress_codes --pools 100000,2000 --redeemers 5000 --threads 8
+"""
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from rewards import codes
+from rewards.models import RedemptionLog, Reward, RewardCode
+from ._utils import create_funded_users, format_outcomes, redeem_in_parallel, temporary_database
+
+
+class Command(BaseCommand):
+    help = 'Stress-test code pool imports and claims for double assignment and report throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pools', default='100000,2000', help='Comma-separated pool sizes, one reward each')
+        parser.add_argument('--redeemers', type=int, default=5000)
+        parser.add_argument('--threads', type=int, default=8)
+
+    def handle(self, *args, **options):
+        failures = []
+        with temporary_database(), override_settings(DEBUG=False):
+            self.users = create_funded_users(options['redeemers'], 1000, 'codes')
+            for size in (int(value) for value in options['pools'].split(',')):
+                if not self.run(size, options):
+                    failures.append(str(size))
+        if failures:
+            raise CommandError(f'Codes double-assigned or lost with pool size(s) {", ".join(failures)}')
+
+    def run(self, size, options):
+        cache.clear()
+        reward = Reward.objects.create(name=f'Codes ({size})', key_cost=1, delivers_codes=True)
+        imported = codes.import_codes(reward, (f'CODE-{reward.id}-{i:08d}' for i in range(size)))
+        self.stdout.write(
+            f'{size:>7} codes: imported in {imported.seconds:.2f}s ({imported.rows_per_second:.0f} codes/s)'
+        )
+
+        results, outcomes, elapsed = redeem_in_parallel(reward, self.users, options['threads'])
+        handed_out = [result[2] for result in results if not isinstance(result, Exception)]
+        expected = min(size, len(self.users))
+        logged = RedemptionLog.objects.filter(reward=reward).count()
+        assigned = RewardCode.objects.filter(reward=reward, assigned_at__isnull=False)
+        linked = assigned.filter(redemption__isnull=False).values('redemption').distinct().count()
+        consistent = (
+            outcomes['redeemed'] == logged == expected
+            and outcomes['out_of_stock'] == len(results) - expected
+            and len(set(handed_out)) == len(handed_out) == expected
+            and assigned.count() == linked == expected
+            and codes.remaining(reward.id) == size - expected
+        )
+
+        self.stdout.write(
+            f'{size:>7} codes: {len(results)} redemptions in {elapsed:.2f}s ({len(results) / elapsed:.0f}/s) | '
+            f'{format_outcomes(outcomes)} | assigned={assigned.count()} left={codes.remaining(reward.id)}'
+        )
+        if consistent:
+            self.stdout.write(self.style.SUCCESS(f'{size:>7} codes: every redemption got its own code'))
+        else:
+            self.stdout.write(self.style.ERROR(f'{size:>7} codes: codes, redemption log and results disagree'))
+        return consistent
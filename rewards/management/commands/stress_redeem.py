@@ -0,0 +1,110 @@
+"""
+Fire parallel redemptions against a single user and check for double-spends.
+
+Runs on a throwaway database. Usage:
+    python manage.py stress_redeem --threads 32 --rewards 200
+"""
+
+import itertools
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from django.db.models import Sum
+
+from rewards import ledger, services
+from rewards.models import User, Reward, RedemptionLog
+from ._utils import temporary_database, run_parallel
+
+
+def legacy_redeem(user_id, reward_id):
+    """The original read-check-write flow from ``redeem_reward``, for comparison."""
+    user = User.objects.get(id=user_id)
+    reward = Reward.objects.get(id=reward_id, is_active=True)
+    if RedemptionLog.objects.filter(user=user, reward=reward).exists():
+        raise services.AlreadyRedeemed()
+    if user.key_balance < reward.key_cost:
+        raise services.InsufficientKeys()
+    with transaction.atomic():
+        user.key_balance -= reward.key_cost
+        user.save()
+        RedemptionLog.objects.create(user=user, reward=reward)
+    return user, reward
+
+
+MODES = {
+    'legacy': legacy_redeem,
+    'atomic': services.redeem,
+}
+
+
+class Command(BaseCommand):
+    help = 'Stress-test concurrent redemptions for one user and report requests/sec'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--rewards', type=int, default=200, help='Distinct rewards to redeem')
+        parser.add_argument('--attempts', type=int, default=2, help='Concurrent attempts per reward')
+        parser.add_argument('--cost', type=int, default=10)
+        parser.add_argument('--balance', type=int, default=500)
+        parser.add_argument('--modes', default='legacy,atomic')
+
+    def handle(self, *args, **options):
+        modes = options['modes'].split(',')
+        for mode in modes:
+            if mode not in MODES:
+                raise CommandError(f'Unknown mode {mode!r}; choose from {", ".join(MODES)}')
+
+        failures = []
+        with temporary_database():
+            for mode in modes:
+                ok = self.run_mode(mode, options)
+                if not ok and mode != 'legacy':
+                    failures.append(mode)
+
+        if failures:
+            raise CommandError(f'Double-spend detected in: {", ".join(failures)}')
+
+    def run_mode(self, mode, options):
+        cost, balance = options['cost'], options['balance']
+        user = User.objects.create(discord_id=f'stress-{mode}', username=f'stress-{mode}')
+        ledger.adjust(user.id, balance, 'stress test')
+        rewards = Reward.objects.bulk_create(
+            Reward(name=f'{mode} reward {i}', key_cost=cost) for i in range(options['rewards'])
+        )
+        jobs = [
+            (user.id, reward.id)
+            for reward, _ in itertools.product(rewards, range(options['attempts']))
+        ]
+
+        results, elapsed = run_parallel(MODES[mode], jobs, options['threads'])
+
+        succeeded = sum(1 for r in results if not isinstance(r, Exception))
+        rejected = sum(1 for r in results if isinstance(r, services.RedemptionError))
+        errors = len(results) - succeeded - rejected
+
+        user.refresh_from_db()
+        logged = RedemptionLog.objects.filter(user=user).count()
+        spent = balance - user.key_balance
+        ledger_balance = user.key_transactions.aggregate(total=Sum('amount'))['total']
+        consistent = (
+            user.key_balance >= 0
+            and logged == succeeded
+            and spent == logged * cost
+            and logged <= balance // cost
+            and ledger_balance == user.key_balance
+        )
+
+        self.stdout.write(
+            f'{mode:>7}: {len(jobs)} requests in {elapsed:.2f}s '
+            f'({len(jobs) / elapsed:.0f} req/s) | ok={succeeded} rejected={rejected} errors={errors} | '
+            f'logged={logged} spent={spent} balance={user.key_balance} ledger={ledger_balance}'
+        )
+        if consistent:
+            self.stdout.write(self.style.SUCCESS(f'{mode:>7}: no double-spend'))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f'{mode:>7}: balance, redemption log and ledger disagree '
+                f'(expected spent={logged * cost}, max redemptions={balance // cost})'
+            ))
+        return consistent
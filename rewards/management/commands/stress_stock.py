@@ -0,0 +1,70 @@
+"""
+Hammer a limited-stock reward with parallel redeemers and check for oversell.
+
+Each run creates a --stock unit reward and --redeemers funded users on a
+throwaway database, redeems it for all of them from --threads threads, and
+checks that exactly --stock redemptions succeeded, the rest were refused as
+out of stock, and the shards, redemption log and ledger agree. Runs once
+per --shards value to compare shard counts. Usage:
+    python manage.py stress_stock --stock 500 --redeemers 5000 --threads 32
+"""
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+from django.test import override_settings
+
+from rewards import ledger, stock
+from rewards.models import KeyTransaction, RedemptionLog, Reward, RewardStockShard
+from ._utils import create_funded_users, format_outcomes, redeem_in_parallel, temporary_database
+
+
+class Command(BaseCommand):
+    help = 'Stress-test a limited-stock reward for oversell and report redemptions/sec'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stock', type=int, default=500)
+        parser.add_argument('--redeemers', type=int, default=5000)
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--cost', type=int, default=10)
+        parser.add_argument('--shards', default='1,8', help='Comma-separated REWARD_STOCK_SHARDS values to run')
+
+    def handle(self, *args, **options):
+        failures = []
+        with temporary_database(), override_settings(DEBUG=False):
+            self.users = create_funded_users(options['redeemers'], options['cost'] * 100, 'stock')
+            for shards in (int(value) for value in options['shards'].split(',')):
+                with override_settings(REWARD_STOCK_SHARDS=shards):
+                    if not self.run(shards, options):
+                        failures.append(str(shards))
+        if failures:
+            raise CommandError(f'Stock oversold or inconsistent with {", ".join(failures)} shard(s)')
+
+    def run(self, shards, options):
+        cache.clear()
+        reward = Reward.objects.create(name=f'Drop ({shards} shards)', key_cost=options['cost'], stock_limit=options['stock'])
+        stock.restock(reward)
+
+        results, outcomes, elapsed = redeem_in_parallel(reward, self.users, options['threads'])
+        logged = RedemptionLog.objects.filter(reward=reward).count()
+        remaining = RewardStockShard.objects.filter(reward=reward).aggregate(left=Sum('remaining'))['left'] or 0
+        spent = -(KeyTransaction.objects.filter(reference__in=[
+            f'redemption {log_id}' for log_id in RedemptionLog.objects.filter(reward=reward).values_list('id', flat=True)
+        ]).aggregate(total=Sum('amount'))['total'] or 0)
+        consistent = (
+            outcomes['redeemed'] == logged == options['stock']
+            and outcomes['out_of_stock'] == len(results) - options['stock']
+            and remaining == 0
+            and spent == logged * options['cost']
+            and not ledger.find_drift()
+        )
+
+        self.stdout.write(
+            f'{shards:>3} shard(s): {len(results)} redemptions in {elapsed:.2f}s ({len(results) / elapsed:.0f}/s) | '
+            f'{format_outcomes(outcomes)} | logged={logged} left={remaining}'
+        )
+        if consistent:
+            self.stdout.write(self.style.SUCCESS(f'{shards:>3} shard(s): exactly {options["stock"]} sold, no oversell'))
+        else:
+            self.stdout.write(self.style.ERROR(f'{shards:>3} shard(s): stock, redemption log and ledger disagree'))
+        return consistent
@@ -0,0 +1,191 @@
+"""Middleware for the rewards app."""
+
+import logging
+import time
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from .instrumentation import measure
+from .routers import request_state
+from .users import aget_request_user, get_request_user
+
+SESSION_REFRESHED_KEY = '_refreshed_at'
+REPLICA_PIN_COOKIE = 'pin_primary'
+
+request_logger = logging.getLogger('rewards.requests')
+
+
+class RequestMetricsMiddleware:
+    """
+    Measure every request: queries, database time, cache hits and latency.
+
+    Each request is logged to the ``rewards.requests`` logger as key=value
+    pairs, with the same fields in ``extra={'request_metrics': ...}`` for
+    structured handlers; with REQUEST_SERVER_TIMING the figures are also sent
+    in a ``Server-Timing`` header for the browser's network panel. The
+    metrics are left on ``request.metrics``. Put it first in MIDDLEWARE so
+    the total covers the other middleware too; streamed bodies are not
+    included.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with measure() as metrics:
+            request.metrics = metrics
+            response = self.get_response(request)
+        return self.report(request, metrics, response)
+
+    async def __acall__(self, request):
+        with measure() as metrics:
+            request.metrics = metrics
+            response = await self.get_response(request)
+        return self.report(request, metrics, response)
+
+    @staticmethod
+    def report(request, metrics, response):
+        fields = {'method': request.method, 'path': request.path, 'status': response.status_code, **metrics.as_dict()}
+        request_logger.info(' '.join(f'{key}={value}' for key, value in fields.items()), extra={'request_metrics': fields})
+        if settings.REQUEST_SERVER_TIMING:
+            response['Server-Timing'] = metrics.server_timing()
+        return response
+
+
+class DiscordUserMiddleware:
+    """
+    Attach the logged-in Discord user to the request, resolved lazily.
+
+    ``request.discord_user`` is a lazy object for sync code and templates
+    (falsy when nobody is logged in); async code awaits
+    ``request.adiscord_user()``. Either way the user is looked up once per
+    request, from the cache when possible. Must come after
+    ``SessionMiddleware``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        request.discord_user = SimpleLazyObject(partial(get_request_user, request))
+        request.adiscord_user = partial(aget_request_user, request)
+        return self.get_response(request)
+
+
+class SlidingSessionMiddleware:
+    """
+    Extend session expiry without writing the session on every request.
+
+    Replaces ``SESSION_SAVE_EVERY_REQUEST``: a session is only re-saved (and
+    its cookie re-issued) once it is older than ``SESSION_REFRESH_FRACTION``
+    of ``SESSION_COOKIE_AGE``. Only sessions the view already read are
+    considered, so pages that never touch the session cost nothing. Must come
+    after ``SessionMiddleware``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self.refresh(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        self.refresh(request)
+        return response
+
+    @staticmethod
+    def refresh(request):
+        session = getattr(request, 'session', None)
+        # accessed means the session is already loaded, so this never hits storage.
+        if session is None or not session.accessed or session.is_empty():
+            return
+        now = int(time.time())
+        refreshed_at = session.get(SESSION_REFRESHED_KEY, 0)
+        # A session being saved anyway is stamped for free.
+        if session.modified or now - refreshed_at > settings.SESSION_COOKIE_AGE * settings.SESSION_REFRESH_FRACTION:
+            session[SESSION_REFRESHED_KEY] = now
+
+
+class ReplicaPinMiddleware:
+    """
+    Read from the primary for a while after a visitor writes.
+
+    Any database write during a request sets a short-lived cookie
+    (DB_REPLICA_PIN_SECONDS); while it is present, ``rewards.routers``
+    keeps that visitor's reads off the replicas, so e.g. a redemption is
+    never followed by a page built from a lagging copy. Does nothing when no
+    replicas are configured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DB_REPLICA_ALIASES:
+            return self.get_response(request)
+        state, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_state.reset(token)
+        return self.finish(state, response)
+
+    async def __acall__(self, request):
+        if not settings.DB_REPLICA_ALIASES:
+            return await self.get_response(request)
+        state, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_state.reset(token)
+        return self.finish(state, response)
+
+    @staticmethod
+    def start(request):
+        try:
+            pinned = float(request.COOKIES.get(REPLICA_PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        # Requests that write also read from the primary.
+        pinned = pinned or request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+        # A dict, so writes recorded in sync_to_async threads are seen here.
+        state = {'pinned': pinned, 'wrote': False}
+        return state, request_state.set(state)
+
+    @staticmethod
+    def finish(state, response):
+        if state['wrote']:
+            seconds = settings.DB_REPLICA_PIN_SECONDS
+            response.set_cookie(
+                REPLICA_PIN_COOKIE, str(int(time.time()) + seconds), max_age=seconds,
+                secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rewards', '0006_add_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RedemptionDigest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_redemption_id', models.BigIntegerField(unique=True)),
+                ('last_redemption_id', models.BigIntegerField()),
+                ('redemption_count', models.PositiveIntegerField()),
+                ('keys_spent', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-last_redemption_id'],
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_user_stats(apps, schema_editor):
+    """Seed UserStats from existing redemptions (keys at today's reward prices)"""
+    RedemptionLog = apps.get_model('rewards', 'RedemptionLog')
+    UserStats = apps.get_model('rewards', 'UserStats')
+    
+    totals = (
+        RedemptionLog.objects.values('user_id')
+        .annotate(redemption_count=models.Count('id'), keys_spent=models.Sum('reward__key_cost'))
+        .order_by()
+    )
+    UserStats.objects.bulk_create(
+        (UserStats(**row) for row in totals.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rewards', '0007_add_redemption_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='rewards.user')),
+                ('redemption_count', models.PositiveIntegerField(default=0)),
+                ('keys_spent', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'User stats',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['-key_balance', 'id'], name='user_balance_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userstats',
+            index=models.Index(fields=['-keys_spent', 'user'], name='stats_keys_spent_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userstats',
+            index=models.Index(fields=['-redemption_count', 'user'], name='stats_redemptions_rank_idx'),
+        ),
+        migrations.RunPython(backfill_user_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rewards', '0008_add_user_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeyGrantBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_id', models.CharField(max_length=100, unique=True)),
+                ('chunks_applied', models.PositiveIntegerField(default=0)),
+                ('rows_applied', models.PositiveIntegerField(default=0)),
+                ('keys_granted', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def open_balances(apps, schema_editor):
+    """Start every non-zero balance with an opening row so the ledger sums to it"""
+    User = apps.get_model('rewards', 'User')
+    KeyTransaction = apps.get_model('rewards', 'KeyTransaction')
+    
+    balances = User.objects.exclude(key_balance=0).values_list('id', 'key_balance').order_by('id')
+    KeyTransaction.objects.bulk_create(
+        (
+            KeyTransaction(user_id=user_id, kind='opening', amount=balance, reference='ledger introduced')
+            for user_id, balance in balances.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rewards', '0009_add_key_grant_batch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeyTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('opening', 'Opening balance'), ('grant', 'Grant'), ('redemption', 'Redemption'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('amount', models.IntegerField(help_text='Signed change to the balance')),
+                ('reference', models.CharField(blank=True, help_text='Grant batch, redemption or admin user', max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='key_transactions', to='rewards.user')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'id'], name='keytx_user_history_idx')],
+            },
+        ),
+        migrations.RunPython(open_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rewards', '0010_add_key_transaction_ledger'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='keytransaction',
+            name='kind',
+            field=models.CharField(choices=[('opening', 'Opening balance'), ('grant', 'Grant'), ('redemption', 'Redemption'), ('adjustment', 'Adjustment'), ('activity', 'Activity')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='keytransaction',
+            name='reference',
+            field=models.CharField(blank=True, help_text='Grant batch, redemption, admin user or activity window', max_length=100),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:41
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rewards', '0011_add_activity_transactions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessedAwardEvent',
+            fields=[
+                ('id', models.BigIntegerField(help_text='64-bit hash of the event id', primary_key=True, serialize=False)),
+                ('received_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rewards', '0012_add_processed_award_event'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='redemptionlog',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='redemptions', to='rewards.user'),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['order', 'position', '-created_at'], name='leaderboard_active_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='redemptionlog',
+            index=models.Index(fields=['-timestamp', '-id'], name='redemption_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reward',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'key_cost', 'name'], name='reward_active_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reward',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['key_cost', 'name'], name='reward_active_cost_idx'),
+        ),
+    ]
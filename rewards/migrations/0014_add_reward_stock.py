@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rewards', '0013_add_query_shape_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reward',
+            name='stock_limit',
+            field=models.PositiveIntegerField(blank=True, help_text='Units available in total; empty for unlimited. Outside the admin, call rewards.stock.restock() after changing it.', null=True),
+        ),
+        migrations.CreateModel(
+            name='RewardStockShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('remaining', models.PositiveIntegerField()),
+                ('reward', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='stock_shards', to='rewards.reward')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='rewardstockshard',
+            constraint=models.UniqueConstraint(fields=('reward', 'shard'), name='unique_reward_stock_shard'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rewards', '0014_add_reward_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reward',
+            name='delivers_codes',
+            field=models.BooleanField(default=False, help_text="Hand each redeemer a code from this reward's code pool; it is out of stock once the pool is empty."),
+        ),
+        migrations.CreateModel(
+            name='RewardCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=255)),
+                ('assigned_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('redemption', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='code', to='rewards.redemptionlog')),
+                ('reward', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='codes', to='rewards.reward')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('assigned_at__isnull', True)), fields=['reward', 'id'], name='rewardcode_unassigned_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='rewardcode',
+            constraint=models.UniqueConstraint(fields=('reward', 'code'), name='unique_reward_code'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rewards', '0015_add_reward_codes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reward',
+            name='available_from',
+            field=models.DateTimeField(blank=True, help_text='Scheduled drop: redeemable from this time, through the waiting room. Empty for always.', null=True),
+        ),
+    ]
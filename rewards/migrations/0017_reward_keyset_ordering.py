@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rewards', '0016_add_reward_available_from'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='reward',
+            options={'ordering': ['key_cost', 'name', 'id']},
+        ),
+        migrations.RemoveIndex(
+            model_name='reward',
+            name='reward_active_category_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='reward',
+            name='reward_active_cost_idx',
+        ),
+        migrations.AddIndex(
+            model_name='reward',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'key_cost', 'name', 'id'], name='reward_active_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reward',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['key_cost', 'name', 'id'], name='reward_active_cost_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:59
+
+from django.db import migrations, models
+from django.db.models import CharField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Concat
+
+
+def record_costs(apps, schema_editor):
+    """Take each redemption's cost from its ledger row, or the reward's price before the ledger existed"""
+    RedemptionLog = apps.get_model('rewards', 'RedemptionLog')
+    KeyTransaction = apps.get_model('rewards', 'KeyTransaction')
+    Reward = apps.get_model('rewards', 'Reward')
+    
+    debited = KeyTransaction.objects.filter(
+        user_id=OuterRef('user_id'),
+        kind='redemption',
+        reference=Concat(Value('redemption '), Cast(OuterRef('id'), CharField())),
+    ).values('amount')[:1]
+    price = Reward.objects.filter(id=OuterRef('reward_id')).values('key_cost')[:1]
+    RedemptionLog.objects.update(key_cost=Coalesce(-Subquery(debited), Subquery(price)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rewards', '0017_reward_keyset_ordering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='redemptionlog',
+            name='key_cost',
+            field=models.IntegerField(default=0, help_text='Keys debited for this redemption'),
+        ),
+        migrations.RunPython(record_costs, migrations.RunPython.noop),
+    ]
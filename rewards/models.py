@@ -13,6 +13,9 @@ class User(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-key_balance', 'id'], name='user_balance_rank_idx'),
+        ]
 
     def __str__(self):
         return f"{self.username} ({self.discord_id})"
@@ -45,16 +48,97 @@ class Reward(models.Model):
     name = models.CharField(max_length=200)
     image = models.ImageField(upload_to='rewards/', blank=True, null=True)
     key_cost = models.IntegerField()
+    stock_limit = models.PositiveIntegerField(
+        null=True, blank=True,
+        help_text='Units available in total; empty for unlimited. Outside the admin, call rewards.stock.restock() after changing it.',
+    )
+    delivers_codes = models.BooleanField(
+        default=False,
+        help_text='Hand each redeemer a code from this reward\'s code pool; it is out of stock once the pool is empty.',
+    )
+    available_from = models.DateTimeField(
+        null=True, blank=True,
+        help_text='Scheduled drop: redeemable from this time, through the waiting room. Empty for always.',
+    )
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        ordering = ['key_cost', 'name']
+        # id breaks ties, so catalog pages can continue from the last row (rewards.catalog).
+        ordering = ['key_cost', 'name', 'id']
+        indexes = [
+            # The catalog only ever lists active rewards, per category or all.
+            models.Index(
+                fields=['category', 'key_cost', 'name', 'id'], condition=models.Q(is_active=True),
+                name='reward_active_category_idx',
+            ),
+            models.Index(
+                fields=['key_cost', 'name', 'id'], condition=models.Q(is_active=True),
+                name='reward_active_cost_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.key_cost} keys)"
 
 
+class RewardStockShard(models.Model):
+    """
+    A slice of a limited reward's remaining stock.
+
+    Stock is split over several rows so concurrent redemptions decrement
+    different rows instead of queueing on one; the remaining stock is their
+    sum. Maintained by ``rewards.stock``.
+    """
+    # Indexed by the (reward, shard) constraint.
+    reward = models.ForeignKey(Reward, on_delete=models.CASCADE, related_name='stock_shards', db_index=False)
+    shard = models.PositiveSmallIntegerField()
+    remaining = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['reward', 'shard'], name='unique_reward_stock_shard'),
+        ]
+
+    def __str__(self):
+        return f"{self.reward_id}/{self.shard}: {self.remaining} left"
+
+
+class RewardCode(models.Model):
+    """
+    A fulfilment code (Steam key, Nitro link, ...) in a reward's code pool.
+
+    Imported in bulk by ``rewards.codes`` and assigned to one redemption, in
+    its transaction, when ``assigned_at`` is set. ``redemption`` is cleared if
+    the log row is deleted, but the code stays assigned.
+    """
+    # Indexed by the (reward, code) constraint.
+    reward = models.ForeignKey(Reward, on_delete=models.CASCADE, related_name='codes', db_index=False)
+    code = models.CharField(max_length=255)
+    redemption = models.OneToOneField(
+        'RedemptionLog', on_delete=models.SET_NULL, null=True, blank=True, related_name='code',
+    )
+    assigned_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Re-importing a file skips the codes already in the pool.
+            models.UniqueConstraint(fields=['reward', 'code'], name='unique_reward_code'),
+        ]
+        indexes = [
+            # Only unassigned codes are indexed, so claiming the next one is a
+            # single index lookup however many were handed out before.
+            models.Index(
+                fields=['reward', 'id'], condition=models.Q(assigned_at__isnull=True),
+                name='rewardcode_unassigned_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.reward_id}: {self.code}"
+
+
 class LeaderboardEntry(models.Model):
     """Leaderboard winners - added by admin"""
     position = models.PositiveIntegerField(help_text='Rank/position (1=first, 2=second, etc.)')
@@ -68,6 +152,12 @@ class LeaderboardEntry(models.Model):
     class Meta:
         ordering = ['order', 'position', '-created_at']
         verbose_name_plural = 'Leaderboard entries'
+        indexes = [
+            models.Index(
+                fields=['order', 'position', '-created_at'], condition=models.Q(is_active=True),
+                name='leaderboard_active_order_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"#{self.position} - {self.username}"
@@ -75,13 +165,151 @@ class LeaderboardEntry(models.Model):
 
 class RedemptionLog(models.Model):
     """Log of reward redemptions"""
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='redemptions')
+    # The (user, reward) unique index also serves per-user lookups.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='redemptions', db_index=False)
     reward = models.ForeignKey(Reward, on_delete=models.CASCADE, related_name='redemptions')
+    key_cost = models.IntegerField(default=0, help_text='Keys debited for this redemption')
     timestamp = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-timestamp']
         unique_together = [['user', 'reward']]  # Prevent duplicate redemptions
+        indexes = [
+            # The admin orders by -timestamp, -pk; the id makes LIMIT a pure index walk.
+            models.Index(fields=['-timestamp', '-id'], name='redemption_timestamp_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} redeemed {self.reward.name} at {self.timestamp}"
+
+
+class NotificationOutbox(models.Model):
+    """Email queued for delivery by the dispatch_notifications command"""
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, help_text='Not retried before this time')
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = 'Notification outbox'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.recipient} ({self.status})"
+
+
+class RedemptionDigest(models.Model):
+    """A summary email covering a contiguous range of RedemptionLog rows"""
+    first_redemption_id = models.BigIntegerField(unique=True)
+    last_redemption_id = models.BigIntegerField()
+    redemption_count = models.PositiveIntegerField()
+    keys_spent = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-last_redemption_id']
+
+    def __str__(self):
+        return f"Digest of {self.redemption_count} redemptions ({self.created_at})"
+
+
+class UserStats(models.Model):
+    """Lifetime redemption counters per user, kept in step by the redemption engine"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    redemption_count = models.PositiveIntegerField(default=0)
+    keys_spent = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'User stats'
+        indexes = [
+            models.Index(fields=['-keys_spent', 'user'], name='stats_keys_spent_rank_idx'),
+            models.Index(fields=['-redemption_count', 'user'], name='stats_redemptions_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.redemption_count} redemptions, {self.keys_spent} keys"
+
+
+class KeyGrantBatch(models.Model):
+    """A bulk key grant, applied in chunks and idempotent per batch_id"""
+    batch_id = models.CharField(max_length=100, unique=True)
+    chunks_applied = models.PositiveIntegerField(default=0)
+    rows_applied = models.PositiveIntegerField(default=0)
+    keys_granted = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.batch_id} ({self.rows_applied} rows, {self.keys_granted} keys)"
+
+
+class KeyTransaction(models.Model):
+    """
+    Append-only ledger of key balance changes.
+
+    ``User.key_balance`` is the materialized sum of a user's rows and is
+    updated in the same transaction as each insert; reconcile_ledger checks
+    the two agree.
+    """
+    KIND_OPENING = 'opening'
+    KIND_GRANT = 'grant'
+    KIND_REDEMPTION = 'redemption'
+    KIND_ADJUSTMENT = 'adjustment'
+    KIND_ACTIVITY = 'activity'
+    KIND_CHOICES = [
+        (KIND_OPENING, 'Opening balance'),
+        (KIND_GRANT, 'Grant'),
+        (KIND_REDEMPTION, 'Redemption'),
+        (KIND_ADJUSTMENT, 'Adjustment'),
+        (KIND_ACTIVITY, 'Activity'),
+    ]
+
+    # Covered by the (user, id) history index, so no separate FK index.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='key_transactions', db_index=False)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    amount = models.IntegerField(help_text='Signed change to the balance')
+    reference = models.CharField(max_length=100, blank=True, help_text='Grant batch, redemption, admin user or activity window')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='keytx_user_history_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.amount:+d} ({self.kind})"
+
+
+class ProcessedAwardEvent(models.Model):
+    """
+    Recently applied webhook award events, kept to drop redeliveries.
+
+    Only a 64-bit hash of the sender's event id is stored, and rows older
+    than AWARD_WEBHOOK_DEDUPE_WINDOW are pruned, so the index stays small.
+    """
+    id = models.BigIntegerField(primary_key=True, help_text='64-bit hash of the event id')
+    received_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.id:016x} ({self.received_at})"
@@ -0,0 +1,108 @@
+"""
+Computed leaderboard: users ranked by keys spent, redemptions or balance.
+
+Scores come from the UserStats counters (updated in the redemption
+transaction) or ``User.key_balance``; each metric has a descending index,
+so "top N" is a short index walk and is cached for
+RANKINGS_CACHE_TIMEOUT seconds. "My rank" bisects a cached score histogram
+built with one GROUP BY per refresh, so it costs O(log n) however large the
+community is. Ties share a rank.
+"""
+
+from bisect import bisect_right
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .instrumentation import cache_get, off_loop
+from .models import User, UserStats
+
+METRICS = {
+    'keys_spent': (UserStats, 'keys_spent'),
+    'redemptions': (UserStats, 'redemption_count'),
+    'balance': (User, 'key_balance'),
+}
+DEFAULT_METRIC = 'keys_spent'
+
+
+def _scored(metric):
+    model, field = METRICS[metric]
+    return model.objects.filter(**{f'{field}__gt': 0}), field
+
+
+def _load_top(metric, limit):
+    queryset, field = _scored(metric)
+    if queryset.model is User:
+        rows = queryset.order_by(f'-{field}', 'id').values_list('id', 'username', 'avatar', field)
+    else:
+        rows = queryset.order_by(f'-{field}', 'user_id').values_list(
+            'user_id', 'user__username', 'user__avatar', field
+        )
+    top = []
+    for position, (user_id, username, avatar, score) in enumerate(rows[:limit], start=1):
+        rank = top[-1]['rank'] if top and top[-1]['score'] == score else position
+        top.append({'rank': rank, 'user_id': user_id, 'username': username, 'avatar': avatar, 'score': score})
+    return top
+
+
+def _load_histogram(metric):
+    """
+    Ascending distinct scores, and for each position the number of users
+    scoring higher than the score at that position.
+    """
+    queryset, field = _scored(metric)
+    counts = list(queryset.values_list(field).annotate(users=Count('pk')).order_by(field))
+    scores = [score for score, _ in counts]
+    higher = [0] * (len(counts) + 1)
+    for i in range(len(counts) - 1, -1, -1):
+        higher[i] = higher[i + 1] + counts[i][1]
+    return scores, higher
+
+
+def _load_rank(metric, user_id):
+    model, field = METRICS[metric]
+    lookup = {'id': user_id} if model is User else {'user_id': user_id}
+    score = model.objects.filter(**lookup).values_list(field, flat=True).first()
+    if not score:
+        return False
+    scores, higher = _cached(f'histogram:{metric}', _load_histogram, metric)
+    return {'rank': higher[bisect_right(scores, score)] + 1, 'score': score}
+
+
+def _cached(name, loader, *args):
+    key = f'rewards:rankings:{name}'
+    value = cache_get(key)
+    if value is None:
+        value = loader(*args)
+        cache.set(key, value, settings.RANKINGS_CACHE_TIMEOUT)
+    return value
+
+
+async def _acached(name, loader, *args):
+    key = f'rewards:rankings:{name}'
+    value = await off_loop(cache_get)(key)
+    if value is None:
+        value = await sync_to_async(loader)(*args)
+        await off_loop(cache.set)(key, value, settings.RANKINGS_CACHE_TIMEOUT)
+    return value
+
+
+def top(metric=DEFAULT_METRIC, limit=10):
+    """The ``limit`` highest-scoring users as dicts with rank, user and score."""
+    return _cached(f'top:{metric}:{limit}', _load_top, metric, limit)
+
+
+def rank_of(user_id, metric=DEFAULT_METRIC):
+    """``{'rank', 'score'}`` for one user, or None if they haven't scored yet."""
+    # Cache "no rank" as False so it isn't recomputed on every request.
+    return _cached(f'rank:{metric}:{user_id}', _load_rank, metric, user_id) or None
+
+
+async def atop(metric=DEFAULT_METRIC, limit=10):
+    return await _acached(f'top:{metric}:{limit}', _load_top, metric, limit)
+
+
+async def arank_of(user_id, metric=DEFAULT_METRIC):
+    return await _acached(f'rank:{metric}:{user_id}', _load_rank, metric, user_id) or None
@@ -0,0 +1,65 @@
+"""
+Token-bucket rate limiting backed by Django's cache.
+
+A bucket holds ``burst`` tokens and refills at ``rate`` tokens per second.
+It is stored as one cache entry, the time at which it will be full again
+(the generic cell rate algorithm), so taking a token is a get and a set.
+With locmem each process limits on its own, exactly; with a shared backend
+(Redis, Memcached) all processes share the buckets, and requests racing on
+one key at the same instant can each take the last token, so a limit is
+exceeded by at most the number of concurrent requests.
+"""
+
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .instrumentation import off_loop
+
+_lock = threading.Lock()
+
+
+def hit(key, rate, burst, now=None):
+    """
+    Take a token from the bucket at ``key``.
+
+    Returns 0.0 if one was available, otherwise the seconds until one will
+    be. A ``rate`` of 0 disables the limit.
+    """
+    if rate <= 0:
+        return 0.0
+    interval = 1 / rate
+    with _lock:
+        now = time.time() if now is None else now
+        full_at = max(cache.get(key) or 0.0, now) + interval
+        wait = full_at - now - burst * interval
+        if wait > 0:
+            return wait
+        cache.set(key, full_at, math.ceil(full_at - now) + 1)
+    return 0.0
+
+
+def client_ip(request):
+    """
+    The address the request came from.
+
+    ``REMOTE_ADDR`` only: behind a reverse proxy, have the server set it from
+    the proxy's header (e.g. ``uvicorn --proxy-headers``) rather than trust a
+    header any client can send.
+    """
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def redeem_retry_after(user_id, ip):
+    """Seconds the caller must wait before redeeming again, or 0.0 if they may go ahead."""
+    wait = hit(f'rewards:ratelimit:redeem:user:{user_id}', settings.REDEEM_RATE, settings.REDEEM_BURST)
+    if not wait and ip:
+        wait = hit(f'rewards:ratelimit:redeem:ip:{ip}', settings.REDEEM_IP_RATE, settings.REDEEM_IP_BURST)
+    return wait
+
+
+async def aredeem_retry_after(user_id, ip):
+    return await off_loop(redeem_retry_after)(user_id, ip)
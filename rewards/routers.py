@@ -0,0 +1,90 @@
+"""
+Database router that serves catalog reads from read replicas.
+
+Reads of the models in REPLICATED_MODELS go to a random healthy alias in
+DB_REPLICA_ALIASES; everything else, and every write, uses ``default``.
+Reads stay on the primary when replication lag could show stale data:
+
+* inside a transaction on the primary, and for the whole of a POST (or
+  other unsafe) request, so write paths never act on a stale copy;
+* for DB_REPLICA_PIN_SECONDS after any write to a replicated model, in every
+  process (a shared cache key records the write), so a catalog cache refill
+  right after an admin edit can't cache the old rows;
+* for DB_REPLICA_PIN_SECONDS after the current visitor wrote anything, via
+  the cookie set by ``ReplicaPinMiddleware``.
+
+A replica that can't be connected to is skipped for DB_REPLICA_RETRY_SECONDS
+and its reads fall back to the primary.
+"""
+
+import contextvars
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+REPLICATED_MODELS = {'rewards.category', 'rewards.reward', 'rewards.leaderboardentry'}
+
+# Per-request routing state, set by ReplicaPinMiddleware: {'pinned': bool, 'wrote': bool}.
+request_state = contextvars.ContextVar('replica_request_state', default=None)
+
+# alias -> time.monotonic() before which the replica is not tried again.
+_down_until = {}
+
+
+def _written_key(label):
+    return f'rewards:replica:written:{label}'
+
+
+def _recently_written(label):
+    written_at = cache.get(_written_key(label))
+    return written_at is not None and time.time() - written_at < settings.DB_REPLICA_PIN_SECONDS
+
+
+def _available(alias):
+    if _down_until.get(alias, 0) > time.monotonic():
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError as e:
+        _down_until[alias] = time.monotonic() + settings.DB_REPLICA_RETRY_SECONDS
+        logger.warning('Replica %s unavailable, reading from the primary: %s', alias, e)
+        return False
+    return True
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DB_REPLICA_ALIASES
+        label = model._meta.label_lower
+        if not replicas or label not in REPLICATED_MODELS:
+            return None
+        state = request_state.get()
+        if (state and state['pinned']) or connections[DEFAULT_DB_ALIAS].in_atomic_block or _recently_written(label):
+            return DEFAULT_DB_ALIAS
+        for alias in random.sample(replicas, len(replicas)):
+            if _available(alias):
+                return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = request_state.get()
+        if state is not None:
+            state['wrote'] = True
+        label = model._meta.label_lower
+        if settings.DB_REPLICA_ALIASES and label in REPLICATED_MODELS:
+            cache.set(_written_key(label), time.time(), settings.DB_REPLICA_PIN_SECONDS)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication.
+        return db not in settings.DB_REPLICA_ALIASES
@@ -0,0 +1,149 @@
+"""Redemption engine for the rewards app."""
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import codes, events, ledger, stock
+from .db import retry_when_locked
+from .models import KeyTransaction, User, Reward, RedemptionLog, UserStats
+from .users import invalidate_user
+from .utils import send_redemption_notification_to_admin
+
+
+class RedemptionError(Exception):
+    """Base class for redemption failures that map to a JSON error response."""
+    status = 400
+    # The rewards_redemptions_total outcome label.
+    outcome = 'rejected'
+
+
+class RewardNotFound(RedemptionError):
+    status = 404
+    outcome = 'reward_not_found'
+
+
+class UserNotFound(RedemptionError):
+    status = 404
+    outcome = 'user_not_found'
+
+
+class AlreadyRedeemed(RedemptionError):
+    outcome = 'already_redeemed'
+
+
+class InsufficientKeys(RedemptionError):
+    outcome = 'insufficient_keys'
+
+
+class OutOfStock(RedemptionError):
+    status = 409
+    outcome = 'out_of_stock'
+
+
+class DropNotOpen(RedemptionError):
+    status = 403
+    outcome = 'drop_not_open'
+
+
+def record_redemption_stats(user_id, keys_spent):
+    """Add one redemption to the user's UserStats counters (inside a transaction)."""
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        redemption_count=F('redemption_count') + 1,
+        keys_spent=F('keys_spent') + keys_spent,
+    )
+    if not updated:
+        try:
+            with transaction.atomic():
+                UserStats.objects.create(user_id=user_id, redemption_count=1, keys_spent=keys_spent)
+        except IntegrityError:
+            # A concurrent first redemption created the row.
+            record_redemption_stats(user_id, keys_spent)
+
+
+def redeem(user_id, reward_id):
+    """
+    Redeem a reward for a user in a single short transaction.
+
+    The balance check and debit is one conditional UPDATE, so concurrent
+    redemptions can never overdraw a balance, and duplicate redemptions are
+    rejected by the ``unique_together`` constraint on ``RedemptionLog``
+    rather than by a racy pre-check query. The ledger row, leaderboard
+    counters, stock of a limited reward, fulfilment code and admin
+    notification are written in the same transaction.
+
+    Args:
+        user_id: Primary key of the redeeming User.
+        reward_id: Primary key of the Reward to redeem.
+
+    Returns:
+        A ``(user, reward, code)`` tuple; ``user.key_balance`` is the new
+        balance and ``code`` the fulfilment code, or None for rewards that
+        don't deliver codes.
+
+    Raises:
+        RedemptionError: One of its subclasses describing why it failed.
+    """
+    try:
+        reward = Reward.objects.only('id', 'name', 'key_cost', 'stock_limit', 'delivers_codes', 'available_from').get(
+            id=reward_id, is_active=True,
+        )
+    except Reward.DoesNotExist:
+        raise RewardNotFound('Reward not found')
+    if reward.available_from and reward.available_from > timezone.now():
+        raise DropNotOpen('This drop has not opened yet.')
+    if (reward.stock_limit is not None or reward.delivers_codes) and stock.is_sold_out(reward.id):
+        raise OutOfStock('This reward is out of stock.')
+
+    try:
+        # On SQLite, a redemption that waited out the busy timeout runs again.
+        user, code = retry_when_locked(_redeem_in_transaction, user_id, reward)
+    except AlreadyRedeemed:
+        # Backends that check foreign keys immediately fail the insert for a missing user too.
+        if not User.objects.filter(id=user_id).exists():
+            raise UserNotFound('User not found')
+        raise
+
+    return user, reward, code
+
+
+def _redeem_in_transaction(user_id, reward):
+    with transaction.atomic():
+        # Insert first: a duplicate fails here without touching the user row.
+        try:
+            log = RedemptionLog.objects.create(user_id=user_id, reward_id=reward.id, key_cost=reward.key_cost)
+        except IntegrityError as e:
+            # Only this insert means a duplicate; raising rolls the transaction back.
+            raise AlreadyRedeemed(
+                'You have already redeemed this reward. Each reward can only be redeemed once.'
+            ) from e
+
+        debited = User.objects.filter(
+            id=user_id,
+            key_balance__gte=reward.key_cost,
+        ).update(key_balance=F('key_balance') - reward.key_cost)
+
+        if not debited:
+            # Rolls back the log row; only the failure path pays this read.
+            balance = User.objects.filter(id=user_id).values_list('key_balance', flat=True).first()
+            if balance is None:
+                raise UserNotFound('User not found')
+            raise InsufficientKeys(
+                f'Insufficient keys. You need {reward.key_cost} keys but have {balance}.'
+            )
+
+        ledger.record(user_id, KeyTransaction.KIND_REDEMPTION, -reward.key_cost, f'redemption {log.id}')
+        record_redemption_stats(user_id, reward.key_cost)
+        # Last, so the shard's and code's row locks are held for as short a time as possible.
+        if reward.stock_limit is not None and not stock.take(reward.id):
+            raise OutOfStock('This reward is out of stock.')
+        code = codes.claim(reward.id, log.id) if reward.delivers_codes else None
+        if reward.delivers_codes and code is None:
+            stock.mark_sold_out(reward.id)
+            raise OutOfStock('This reward is out of stock.')
+        # The debit bypasses post_save, so drop the cached user explicitly.
+        transaction.on_commit(lambda: invalidate_user(user_id))
+        events.redeemed(user_id, reward.id, code)
+        user = User.objects.only('id', 'discord_id', 'username', 'key_balance').get(id=user_id)
+        send_redemption_notification_to_admin(user=user, reward=reward, code=code)
+        return user, code
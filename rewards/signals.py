@@ -0,0 +1,31 @@
+"""Signal handlers that keep the rewards caches in step with the database."""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import events
+from .catalog import bump_catalog_version
+from .leaderboard import bump_leaderboard_version
+from .models import Category, LeaderboardEntry, Reward, User
+from .users import invalidate_user
+
+
+@receiver([post_save, post_delete], sender=Reward)
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_catalog(sender, **kwargs):
+    # After commit: a reader that saw the new version before then would cache the old rows under it.
+    transaction.on_commit(bump_catalog_version)
+    events.catalog_changed()
+
+
+@receiver([post_save, post_delete], sender=LeaderboardEntry)
+def invalidate_leaderboard(sender, **kwargs):
+    transaction.on_commit(bump_leaderboard_version)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_id = instance.pk
+    transaction.on_commit(lambda: invalidate_user(user_id))
+    events.balance_changed([user_id])
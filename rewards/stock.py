@@ -0,0 +1,131 @@
+"""
+Limited-stock rewards.
+
+A reward with ``stock_limit`` has its remaining units split over up to
+REWARD_STOCK_SHARDS ``RewardStockShard`` rows. ``take()`` runs inside the
+redemption transaction and decrements one shard with a conditional UPDATE
+(``remaining > 0``), so stock can never go negative however many
+redemptions race; picking a shard at random spreads concurrent redemptions
+over several rows instead of queueing them all on one row lock. A rolled
+back redemption puts its unit back with it.
+
+Remaining stock for display is the sum of the shards, cached per reward for
+REWARD_STOCK_CACHE_TIMEOUT seconds. A reward found sold out is cached as 0
+straight away, and redemptions of a cached sold-out reward are refused
+before opening a transaction. Selling out and restocking are pushed to open
+dashboards as ``stock`` events.
+"""
+
+import random
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+
+from . import events
+from .instrumentation import off_loop
+from .models import RedemptionLog, RewardStockShard
+
+
+def _key(reward_id):
+    return f'rewards:stock:{reward_id}'
+
+
+def restock(reward):
+    """
+    Re-split the stock of ``reward`` after its ``stock_limit`` changed.
+
+    Remaining stock is ``stock_limit`` minus the redemptions so far. The
+    shards are locked first, so redemptions in flight finish (and are
+    counted) before the new split is written.
+    """
+    with transaction.atomic():
+        list(RewardStockShard.objects.select_for_update().filter(reward=reward))
+        RewardStockShard.objects.filter(reward=reward).delete()
+        remaining = None
+        if reward.stock_limit is not None:
+            sold = RedemptionLog.objects.filter(reward=reward).count()
+            remaining = max(reward.stock_limit - sold, 0)
+            shards = min(settings.REWARD_STOCK_SHARDS, remaining)
+            RewardStockShard.objects.bulk_create(
+                RewardStockShard(reward=reward, shard=shard, remaining=remaining // shards + (shard < remaining % shards))
+                for shard in range(shards)
+            )
+        transaction.on_commit(lambda: invalidate(reward.id, remaining))
+
+
+def take(reward_id):
+    """
+    Take one unit of a limited reward; False if it is sold out.
+
+    Call inside the redemption transaction: the unit is only gone if that
+    transaction commits. Tries a random shard first, then every shard that
+    still had stock when asked.
+    """
+    shards = RewardStockShard.objects.filter(reward_id=reward_id, remaining__gt=0)
+    if shards.filter(shard=random.randrange(settings.REWARD_STOCK_SHARDS)).update(remaining=F('remaining') - 1):
+        return True
+    candidates = list(shards.values_list('id', flat=True))
+    random.shuffle(candidates)
+    for shard_id in candidates:
+        # Re-checked by the UPDATE: another redemption may have emptied it.
+        if RewardStockShard.objects.filter(id=shard_id, remaining__gt=0).update(remaining=F('remaining') - 1):
+            return True
+    mark_sold_out(reward_id)
+    return False
+
+
+def is_sold_out(reward_id):
+    """True if the cached stock says so; cheap enough to check before a transaction."""
+    return cache.get(_key(reward_id)) == 0
+
+
+def mark_sold_out(reward_id):
+    """Refuse redemptions of ``reward_id`` up front until the cached stock expires."""
+    if cache.get(_key(reward_id)) != 0:
+        events.stock_changed(reward_id, 0)
+    cache.set(_key(reward_id), 0, settings.REWARD_STOCK_CACHE_TIMEOUT)
+
+
+def invalidate(reward_id, remaining=None):
+    """Drop the cached stock after a restock; ``remaining`` is the new stock if known."""
+    cache.delete(_key(reward_id))
+    events.stock_changed(reward_id, remaining)
+
+
+def _load_remaining(reward_ids):
+    remaining = dict.fromkeys(reward_ids, 0)
+    remaining.update(
+        RewardStockShard.objects.filter(reward_id__in=reward_ids)
+        .values_list('reward_id')
+        .annotate(left=Sum('remaining'))
+        .order_by()
+    )
+    cache.set_many({_key(reward_id): left for reward_id, left in remaining.items()}, settings.REWARD_STOCK_CACHE_TIMEOUT)
+    return remaining
+
+
+def _cached(rewards):
+    limited = [reward.id for reward in rewards if reward.stock_limit is not None]
+    if not limited:
+        return {}, []
+    cached = cache.get_many([_key(reward_id) for reward_id in limited])
+    found = {reward_id: cached[_key(reward_id)] for reward_id in limited if _key(reward_id) in cached}
+    return found, [reward_id for reward_id in limited if reward_id not in found]
+
+
+def get_remaining(rewards):
+    """``{reward id: units left}`` for the limited rewards among ``rewards``."""
+    found, missing = _cached(rewards)
+    if missing:
+        found.update(_load_remaining(missing))
+    return found
+
+
+async def aget_remaining(rewards):
+    found, missing = await off_loop(_cached)(rewards)
+    if missing:
+        found.update(await sync_to_async(_load_remaining)(missing))
+    return found
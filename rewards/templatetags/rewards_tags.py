@@ -0,0 +1,9 @@
+from django import template
+
+register = template.Library()
+
+
+@register.filter
+def lookup(mapping, key):
+    """``mapping[key]`` in a template, or None if it is missing."""
+    return mapping.get(key)
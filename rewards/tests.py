@@ -0,0 +1,32 @@
+from django.test import TransactionTestCase, override_settings
+
+from rewards import activity
+from rewards.management.commands import check_query_budgets
+from rewards.management.commands._utils import fake_discord_server
+
+
+class QueryBudgetTests(TransactionTestCase):
+    """
+    The ``check_query_budgets`` scenarios, one subtest per request.
+
+    A TransactionTestCase, so on_commit cache invalidation runs as it does
+    in production and the warm requests see it.
+    """
+
+    def test_every_view_has_a_budgeted_scenario(self):
+        command = check_query_budgets.Command()
+        self.assertEqual(check_query_budgets.coverage_failures(list(command.scenarios(command.seed()))), [])
+
+    def test_views_stay_within_budget(self):
+        command = check_query_budgets.Command()
+        with fake_discord_server() as discord_url, override_settings(
+            **check_query_budgets.budget_settings(discord_url)
+        ):
+            scenarios = list(command.scenarios(command.seed()))
+            try:
+                for label, state, budget, response, status in check_query_budgets.measure(scenarios):
+                    with self.subTest(f'{label} ({state})'):
+                        self.assertEqual(response.status_code, status)
+                        self.assertLessEqual(response.wsgi_request.metrics.queries, budget)
+            finally:
+                activity.get_aggregator().stop(timeout=10)
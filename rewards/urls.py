@@ -8,4 +8,14 @@ urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard'),
     path('logout/', views.logout, name='logout'),
     path('api/redeem/<int:reward_id>/', views.redeem_reward, name='redeem_reward'),
+    path('api/drops/<int:reward_id>/queue/', views.drop_queue, name='drop_queue'),
+    path('api/events/', views.event_stream, name='event_stream'),
+    path('api/catalog/categories/', views.catalog_categories_api, name='catalog_categories_api'),
+    path('api/catalog/rewards/', views.catalog_rewards_api, name='catalog_rewards_api'),
+    path('api/keys/history/', views.key_history_api, name='key_history_api'),
+    path('api/keys/grant/', views.grant_keys_api, name='grant_keys_api'),
+    path('api/activity/', views.activity_api, name='activity_api'),
+    path('api/webhooks/awards/', views.award_webhook, name='award_webhook'),
+    path('api/leaderboard/', views.leaderboard_api, name='leaderboard_api'),
+    path('metrics', views.prometheus_metrics, name='metrics'),
 ]
@@ -0,0 +1,92 @@
+"""
+Resolve and cache the logged-in Discord ``User``.
+
+Users are cached per id under a per-user version number. ``invalidate_user()``
+bumps the version once an update commits (from ``post_save`` and after
+set-based balance updates, always via ``transaction.on_commit``). A reader
+reads the version before the row, so one that raced an update and loaded
+the old row can only ever write it to a key nobody will read again.
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .instrumentation import cache_get, off_loop
+from .models import User
+
+SESSION_USER_KEY = 'user_id'
+
+
+def _version_key(user_id):
+    return f'rewards:user:{user_id}:version'
+
+
+def _user_key(user_id, version):
+    return f'rewards:user:{user_id}:{version}'
+
+
+def _version(user_id):
+    return cache.get(_version_key(user_id)) or 0
+
+
+def invalidate_user(user_id):
+    """Drop the cached copy of a user after their row changed."""
+    key = _version_key(user_id)
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def _lookup(user_id):
+    # The version first: see the module docstring.
+    key = _user_key(user_id, _version(user_id))
+    return key, cache_get(key)
+
+
+def get_user(user_id):
+    """The User with this id, from the cache when possible, or None."""
+    key, user = _lookup(user_id)
+    if user is None:
+        user = User.objects.filter(id=user_id).first()
+        if user is not None:
+            cache.set(key, user, settings.USER_CACHE_TIMEOUT)
+    return user
+
+
+async def aget_user(user_id):
+    key, user = await off_loop(_lookup)(user_id)
+    if user is None:
+        user = await User.objects.filter(id=user_id).afirst()
+        if user is not None:
+            await off_loop(cache.set)(key, user, settings.USER_CACHE_TIMEOUT)
+    return user
+
+
+async def load_session(request):
+    """
+    Load the session without blocking the event loop.
+
+    Session backends are sync-only in Django 4.2; once loaded, reads and
+    writes on ``request.session`` are in memory and safe in async views.
+    """
+    await sync_to_async(request.session.keys)()
+    return request.session
+
+
+def get_request_user(request):
+    """The logged-in User for this request, resolved at most once."""
+    if not hasattr(request, '_discord_user'):
+        user_id = request.session.get(SESSION_USER_KEY)
+        request._discord_user = get_user(user_id) if user_id else None
+    return request._discord_user
+
+
+async def aget_request_user(request):
+    if not hasattr(request, '_discord_user'):
+        session = await load_session(request)
+        user_id = session.get(SESSION_USER_KEY)
+        request._discord_user = await aget_user(user_id) if user_id else None
+    return request._discord_user
@@ -1,20 +1,43 @@
 """Utility functions for the rewards app."""
 
 import logging
+import random
+from datetime import timedelta
+
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, Max, Min, Sum
+from django.utils import timezone
+
+from . import metrics
+from .models import NotificationOutbox, RedemptionDigest, RedemptionLog
 
 logger = logging.getLogger(__name__)
 
+# Redemptions younger than this are left for the next digest, so a slow
+# transaction that commits a lower id late is not skipped by the watermark.
+DIGEST_SETTLE_SECONDS = 5
+
 
-def send_redemption_notification_to_admin(user, reward):
+def send_redemption_notification_to_admin(user, reward, code=None):
     """
-    Send an email notification to the admin when a user redeems a product.
+    Queue an email notification to the admin when a user redeems a product.
+
+    The email is written to the NotificationOutbox, so calling this inside the
+    redemption transaction makes the notification commit (or roll back) with
+    the RedemptionLog row. Delivery happens later in the dispatch_notifications
+    management command, keeping SMTP off the request path.
 
     Args:
         user: The User model instance who redeemed.
         reward: The Reward model instance that was redeemed.
+        code: The fulfilment code handed out, if the reward delivers codes.
     """
+    if settings.REDEMPTION_NOTIFICATION_MODE == 'digest':
+        # The RedemptionLog row is the queue; queue_redemption_digest summarises it.
+        return
+
     admin_email = getattr(settings, 'ADMIN_EMAIL', None)
     if not admin_email:
         logger.warning('ADMIN_EMAIL not configured. Skipping redemption notification email.')
@@ -28,14 +51,189 @@ def send_redemption_notification_to_admin(user, reward):
         f'Key Cost: {reward.key_cost} keys\n'
         f'Remaining Balance: {user.key_balance} keys\n'
     )
+    if code is not None:
+        message += f'Code: {code} (delivered to the user)\n'
+
+    NotificationOutbox.objects.create(recipient=admin_email, subject=subject, body=message)
+
+
+def queue_redemption_digest(force=False):
+    """
+    Queue one summary email for redemptions not yet covered by a digest.
+
+    A digest is due once the oldest pending redemption is older than
+    REDEMPTION_DIGEST_WINDOW, or REDEMPTION_DIGEST_MAX_REDEMPTIONS are
+    pending, so email volume stays flat however fast redemptions arrive.
+    The first digest ever only looks back one window, and is due as soon as
+    there is anything in it. Keys are what each redemption debited, not
+    the rewards' current prices.
+
+    Args:
+        force: Queue a digest for whatever is pending, ignoring the triggers.
+
+    Returns:
+        The RedemptionDigest created, or None if nothing was due.
+    """
+    admin_email = getattr(settings, 'ADMIN_EMAIL', None)
+    if not admin_email:
+        logger.warning('ADMIN_EMAIL not configured. Skipping redemption digest.')
+        return None
+
+    now = timezone.now()
+    window = timedelta(seconds=settings.REDEMPTION_DIGEST_WINDOW)
+    watermark = RedemptionDigest.objects.aggregate(last=Max('last_redemption_id'))['last']
+    pending = RedemptionLog.objects.filter(timestamp__lte=now - timedelta(seconds=DIGEST_SETTLE_SECONDS))
+    if watermark is None:
+        pending = pending.filter(timestamp__gt=now - window)
+    else:
+        pending = pending.filter(id__gt=watermark)
+
+    stats = pending.aggregate(count=Count('id'), first=Min('id'), last=Max('id'), oldest=Min('timestamp'))
+    if not stats['count']:
+        return None
+    threshold = settings.REDEMPTION_DIGEST_MAX_REDEMPTIONS
+    # With no watermark yet the window is already over: pending rows are all inside it.
+    due = watermark is None or stats['oldest'] <= now - window or (threshold and stats['count'] >= threshold)
+    if not (force or due):
+        return None
+
+    groups = list(
+        pending.filter(id__lte=stats['last'])
+        .values('reward__category__name', 'reward__name')
+        .annotate(redemptions=Count('id'), keys_spent=Sum('key_cost'))
+        .order_by('reward__category__name', 'reward__name')
+    )
+    keys_spent = sum(group['keys_spent'] for group in groups)
+
+    lines = [f'{stats["count"]} redemptions, {keys_spent} keys spent.']
+    current_category = object()
+    for group in groups:
+        category = group['reward__category__name'] or 'Uncategorized'
+        if category != current_category:
+            current_category = category
+            lines.extend(['', f'{category}:'])
+        lines.append(
+            f'  {group["reward__name"]}: {group["redemptions"]} redeemed, {group["keys_spent"]} keys'
+        )
 
     try:
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[admin_email],
-            fail_silently=True,  # Don't break redemption if email fails
+        with transaction.atomic():
+            digest = RedemptionDigest.objects.create(
+                first_redemption_id=stats['first'],
+                last_redemption_id=stats['last'],
+                redemption_count=stats['count'],
+                keys_spent=keys_spent,
+            )
+            NotificationOutbox.objects.create(
+                recipient=admin_email,
+                subject=f'[Discord Rewards] Redemption digest: {stats["count"]} redemptions, {keys_spent} keys',
+                body='\n'.join(lines) + '\n',
+            )
+    except IntegrityError:
+        # Another scheduler run already covered this range.
+        return None
+    return digest
+
+
+def dispatch_notification_outbox(batch_size=None, max_attempts=None):
+    """
+    Send one batch of due outbox emails over a single SMTP connection.
+
+    Rows are claimed by pushing ``next_attempt_at`` forward by a lease before
+    sending, with an UPDATE that only matches rows still due, so several
+    dispatchers can run side by side (even without SELECT ... SKIP LOCKED)
+    and a crashed one only delays its batch. Failures are retried with exponential backoff and
+    jitter until ``max_attempts``, then marked failed.
+
+    Returns:
+        A ``(sent, failed)`` tuple of counts for this batch.
+    """
+    batch_size = batch_size or settings.NOTIFICATION_BATCH_SIZE
+    max_attempts = max_attempts or settings.NOTIFICATION_MAX_ATTEMPTS
+    now = timezone.now()
+
+    with transaction.atomic():
+        due = NotificationOutbox.objects.filter(
+            status=NotificationOutbox.STATUS_PENDING,
+            next_attempt_at__lte=now,
+        ).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        batch = list(due[:batch_size])
+        if not batch:
+            return 0, 0
+        # The random microseconds make the lease this run's own, to tell its rows apart.
+        lease_until = now + timedelta(
+            seconds=settings.NOTIFICATION_LEASE_SECONDS, microseconds=random.randrange(10 ** 6),
         )
+        ids = [item.id for item in batch]
+        claimed = NotificationOutbox.objects.filter(
+            id__in=ids,
+            status=NotificationOutbox.STATUS_PENDING,
+            next_attempt_at__lte=now,
+        ).update(next_attempt_at=lease_until)
+        if claimed < len(batch):
+            # Another dispatcher leased some of them since we read them: send only ours.
+            ours = set(
+                NotificationOutbox.objects.filter(id__in=ids, next_attempt_at=lease_until).values_list('id', flat=True)
+            )
+            batch = [item for item in batch if item.id in ours]
+            if not batch:
+                return 0, 0
+
+    sent, failed = [], []
+    mail_connection = get_connection(fail_silently=False)
+    try:
+        mail_connection.open()
+        for item in batch:
+            message = EmailMessage(
+                subject=item.subject,
+                body=item.body,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[item.recipient],
+                connection=mail_connection,
+            )
+            try:
+                with metrics.EMAIL_SEND_SECONDS.time():
+                    mail_connection.send_messages([message])
+                sent.append(item)
+            except Exception as e:
+                failed.append((item, e))
     except Exception as e:
-        logger.exception('Failed to send redemption notification email: %s', e)
+        # Could not connect at all: the whole remaining batch is retried.
+        done = {item.id for item in sent} | {item.id for item, _ in failed}
+        failed.extend((item, e) for item in batch if item.id not in done)
+    finally:
+        try:
+            mail_connection.close()
+        except Exception:
+            logger.exception('Error closing mail connection')
+
+    metrics.EMAILS.labels('sent').inc(len(sent))
+    metrics.EMAILS.labels('failed').inc(len(failed))
+    finished_at = timezone.now()
+    if sent:
+        for item in sent:
+            item.status = NotificationOutbox.STATUS_SENT
+            item.attempts += 1
+            item.sent_at = finished_at
+            item.last_error = ''
+        NotificationOutbox.objects.bulk_update(sent, ['status', 'attempts', 'sent_at', 'last_error'])
+
+    if failed:
+        for item, error in failed:
+            item.attempts += 1
+            item.last_error = str(error)
+            if item.attempts >= max_attempts:
+                item.status = NotificationOutbox.STATUS_FAILED
+                logger.error('Giving up on notification %s after %s attempts: %s', item.id, item.attempts, error)
+            else:
+                delay = settings.NOTIFICATION_RETRY_BACKOFF * 2 ** (item.attempts - 1)
+                item.next_attempt_at = finished_at + timedelta(seconds=delay * random.uniform(1, 1.5))
+                logger.warning('Notification %s failed (attempt %s), retrying: %s', item.id, item.attempts, error)
+        NotificationOutbox.objects.bulk_update(
+            [item for item, _ in failed],
+            ['status', 'attempts', 'last_error', 'next_attempt_at'],
+        )
+
+    return len(sent), len(failed)
@@ -1,22 +1,57 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
-from django.http import JsonResponse
-from django.views.decorators.http import require_http_methods
-from django.db import transaction
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
 from django.conf import settings
-import requests
+from asgiref.sync import sync_to_async
+import codecs
+import json
+import math
 import secrets
-from .models import User, Category, Reward, LeaderboardEntry, RedemptionLog
-from .utils import send_redemption_notification_to_admin
+import time
+from .models import User, RedemptionLog
+from . import (
+    activity, asgi, catalog, events, grants, leaderboard, ledger, metrics, ratelimit, rankings, services, stock, waitingroom,
+    webhooks,
+)
+from .coalesce import InFlight
+from .decorators import condition, csrf_exempt, discord_login_required, require_http_methods
+from .discord_api import DiscordAPIError, get_async_client
+from .users import load_session
 
 
-def landing_page(request):
+def _landing_is_cacheable(request):
+    # Flash messages (e.g. after logout) make the page per-visitor.
+    return CookieStorage.cookie_name not in request.COOKIES
+
+
+def _landing_etag(request):
+    if _landing_is_cacheable(request):
+        return f'landing-{leaderboard.get_leaderboard_version()}'
+
+
+def _landing_last_modified(request):
+    if _landing_is_cacheable(request):
+        return leaderboard.get_leaderboard_last_modified()
+
+
+@condition(etag_func=_landing_etag, last_modified_func=_landing_last_modified)
+async def landing_page(request):
     """Landing page with Discord login"""
-    leaderboard = LeaderboardEntry.objects.filter(is_active=True)[:10]
-    return render(request, 'rewards/landing.html', {'leaderboard': leaderboard})
+    # Rendered off the event loop: the leaderboard fragment comes from the cache.
+    response = await sync_to_async(render)(request, 'rewards/landing.html', {
+        'leaderboard': await leaderboard.aget_leaderboard(),
+        'leaderboard_version': await leaderboard.aget_leaderboard_version(),
+        'leaderboard_cache_timeout': settings.LEADERBOARD_CACHE_TIMEOUT,
+    })
+    # Let browsers and CDNs keep the page but revalidate it every time.
+    patch_cache_control(response, no_cache=True)
+    return response
 
 
-def discord_oauth_login(request):
+async def discord_oauth_login(request):
     """Initiate Discord OAuth flow"""
     if not settings.DISCORD_CLIENT_ID:
         messages.error(request, 'Discord OAuth not configured. Please set DISCORD_CLIENT_ID and DISCORD_CLIENT_SECRET.')
@@ -24,7 +59,8 @@ def discord_oauth_login(request):
     
     # Generate state for CSRF protection
     state = secrets.token_urlsafe(32)
-    request.session['oauth_state'] = state
+    session = await load_session(request)
+    session['oauth_state'] = state
     
     # Build Discord OAuth URL
     redirect_uri = settings.DISCORD_REDIRECT_URI
@@ -41,61 +77,41 @@ def discord_oauth_login(request):
     return redirect(discord_oauth_url)
 
 
-def discord_oauth_callback(request):
+async def discord_oauth_callback(request):
     """Handle Discord OAuth callback"""
     code = request.GET.get('code')
     state = request.GET.get('state')
-    stored_state = request.session.get('oauth_state')
+    session = await load_session(request)
+    stored_state = session.get('oauth_state')
     
     # Verify state
     if not state or state != stored_state:
+        metrics.LOGINS.labels('invalid_state').inc()
         messages.error(request, 'Invalid OAuth state. Please try again.')
         return redirect('landing')
     
     # Clear state from session
-    request.session.pop('oauth_state', None)
+    session.pop('oauth_state', None)
     
     if not code:
+        metrics.LOGINS.labels('denied').inc()
         messages.error(request, 'Authorization failed. Please try again.')
         return redirect('landing')
     
-    # Exchange code for access token
-    token_data = {
-        'client_id': settings.DISCORD_CLIENT_ID,
-        'client_secret': settings.DISCORD_CLIENT_SECRET,
-        'grant_type': 'authorization_code',
-        'code': code,
-        'redirect_uri': settings.DISCORD_REDIRECT_URI,
-    }
-    
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }
-    
+    # A pooled httpx client when served by ASGI; under WSGI each async view
+    # gets a throwaway event loop, so use the process-wide blocking pool.
+    client = get_async_client(native=isinstance(request, ASGIRequest))
     try:
-        token_response = requests.post(
-            f"{settings.DISCORD_API_BASE_URL}/oauth2/token",
-            data=token_data,
-            headers=headers
-        )
-        token_response.raise_for_status()
-        token_json = token_response.json()
+        token_json = await client.exchange_code(code)
         access_token = token_json.get('access_token')
         
         if not access_token:
+            metrics.LOGINS.labels('no_token').inc()
             messages.error(request, 'Failed to get access token.')
             return redirect('landing')
         
         # Get user info from Discord
-        user_headers = {
-            'Authorization': f'Bearer {access_token}'
-        }
-        user_response = requests.get(
-            f"{settings.DISCORD_API_BASE_URL}/users/@me",
-            headers=user_headers
-        )
-        user_response.raise_for_status()
-        discord_user = user_response.json()
+        discord_user = await client.get_current_user(access_token)
         
         # Get or create user
         discord_id = str(discord_user.get('id'))
@@ -108,7 +124,7 @@ def discord_oauth_callback(request):
         else:
             avatar_url = None
         
-        user, created = User.objects.get_or_create(
+        user, created = await User.objects.aget_or_create(
             discord_id=discord_id,
             defaults={
                 'username': username,
@@ -121,135 +137,442 @@ def discord_oauth_callback(request):
         if not created:
             user.username = username
             user.avatar = avatar_url
-            user.save()
+            await user.asave(update_fields=['username', 'avatar', 'updated_at'])
         
         # Store user ID in session
-        request.session['user_id'] = user.id
-        request.session['discord_id'] = user.discord_id
+        session['user_id'] = user.id
+        session['discord_id'] = user.discord_id
         
+        metrics.LOGINS.labels('created' if created else 'returning').inc()
         return redirect('dashboard')
         
-    except requests.RequestException as e:
+    except DiscordAPIError as e:
+        metrics.LOGINS.labels('discord_error').inc()
         messages.error(request, f'Discord authentication failed: {str(e)}')
         return redirect('landing')
 
 
-def dashboard(request):
+@discord_login_required
+async def dashboard(request):
     """User dashboard"""
-    user_id = request.session.get('user_id')
+    user = await request.adiscord_user()
     
-    if not user_id:
-        return redirect('landing')
-    
-    try:
-        user = User.objects.get(id=user_id)
-    except User.DoesNotExist:
-        request.session.flush()
-        return redirect('landing')
-    
-    # Get categories that have active rewards
-    categories = Category.objects.filter(
-        rewards__is_active=True
-    ).distinct().order_by('order', 'name')
-    
-    # Get active rewards (optionally filter by category)
-    rewards = Reward.objects.filter(is_active=True).select_related('category')
+    # Catalog comes from the cache; admin edits invalidate it
+    categories = await catalog.aget_categories()
     
+    # Support filter by id or slug
     category_filter = request.GET.get('category')
     selected_category = None
     if category_filter:
-        try:
-            # Support filter by id or slug
-            if category_filter.isdigit():
-                selected_category = Category.objects.get(id=category_filter)
-            else:
-                selected_category = Category.objects.get(slug=category_filter)
-            rewards = rewards.filter(category=selected_category)
-        except Category.DoesNotExist:
-            pass
-    
-    # Get list of reward IDs that user has already redeemed
-    redeemed_reward_ids = set(
-        RedemptionLog.objects.filter(user=user)
-        .values_list('reward_id', flat=True)
-    )
+        selected_category = await catalog.afind_category(category_filter)
+    # The first page; the page loads the rest from the catalog API as it scrolls.
+    rewards, next_cursor = await catalog.aget_reward_page(selected_category)
     
-    # Get leaderboard winners
-    leaderboard = LeaderboardEntry.objects.filter(is_active=True)[:10]
+    # Rewards the user has already redeemed, with the code they were given (if any)
+    redeemed = {
+        reward_id: code async for reward_id, code in
+        RedemptionLog.objects.filter(user=user).order_by().values_list('reward_id', 'code__code')
+    }
+    # Units left of every limited reward, cached for a few seconds, so later pages show them too.
+    remaining = await stock.aget_remaining(await catalog.aget_limited())
     
     context = {
         'user': user,
         'categories': categories,
         'selected_category': selected_category,
         'rewards': rewards,
-        'redeemed_reward_ids': redeemed_reward_ids,
-        'leaderboard': leaderboard,
+        'stock': remaining,
+        'redeemed': redeemed,
+        # What the script needs to render the pages after this one.
+        'reward_state': {
+            'next_cursor': next_cursor,
+            'category': selected_category.id if selected_category else None,
+            'redeemed': redeemed,
+            'stock': remaining,
+        },
+        'leaderboard': await leaderboard.aget_leaderboard(),
+        'leaderboard_version': await leaderboard.aget_leaderboard_version(),
+        'leaderboard_cache_timeout': settings.LEADERBOARD_CACHE_TIMEOUT,
+        'rank': await rankings.arank_of(user.id),
     }
     
-    return render(request, 'rewards/dashboard.html', context)
+    return await sync_to_async(render)(request, 'rewards/dashboard.html', context)
 
 
-def logout(request):
+async def logout(request):
     """Logout user"""
-    request.session.flush()
+    await sync_to_async(request.session.flush)()
     messages.success(request, 'You have been logged out.')
     return redirect('landing')
 
 
+# Redemptions running in this process, by (user id, reward id).
+_redemptions_in_flight = InFlight(joined=metrics.REDEEM_COALESCED)
+
+
 @require_http_methods(["POST"])
-def redeem_reward(request, reward_id):
+@discord_login_required
+async def redeem_reward(request, reward_id):
     """Redeem a reward"""
-    user_id = request.session.get('user_id')
+    user = await request.adiscord_user()
     
-    if not user_id:
-        return JsonResponse({'success': False, 'error': 'Not authenticated'}, status=401)
+    # Spammed clicks and scripts stop here, before touching the database.
+    retry_after = await ratelimit.aredeem_retry_after(user.id, ratelimit.client_ip(request))
+    if retry_after:
+        metrics.REDEMPTIONS.labels('rate_limited').inc()
+        response = JsonResponse({
+            'success': False,
+            'error': 'Too many redemption attempts. Please wait a moment and try again.'
+        }, status=429)
+        response['Retry-After'] = str(math.ceil(retry_after))
+        return response
     
+    # Scheduled drops are only redeemable with a token from their waiting room.
+    # check_token only verifies a signature (no cache), so it stays on the loop.
+    if reward_id in await catalog.aget_drops() and not waitingroom.check_token(
+        request.headers.get('X-Admission-Token'), user.id, reward_id,
+    ):
+        metrics.REDEMPTIONS.labels('not_admitted').inc()
+        return JsonResponse({
+            'success': False,
+            'error': 'This is a scheduled drop. Join its queue and redeem once you are admitted.'
+        }, status=403)
+    
+    start = time.perf_counter()
     try:
-        user = User.objects.get(id=user_id)
-        reward = Reward.objects.get(id=reward_id, is_active=True)
-    except User.DoesNotExist:
-        return JsonResponse({'success': False, 'error': 'User not found'}, status=404)
-    except Reward.DoesNotExist:
-        return JsonResponse({'success': False, 'error': 'Reward not found'}, status=404)
-    
-    # Check if user has already redeemed this reward
-    if RedemptionLog.objects.filter(user=user, reward=reward).exists():
+        # The redemption transaction must run on one sync connection.
+        redeem = sync_to_async(services.redeem)
+        if settings.REDEEM_COALESCE:
+            # Identical requests already in flight share one transaction and its result.
+            user, reward, code = await _redemptions_in_flight.run((user.id, reward_id), redeem, user.id, reward_id)
+        else:
+            user, reward, code = await redeem(user.id, reward_id)
+    except services.RedemptionError as e:
+        metrics.REDEMPTIONS.labels(e.outcome).inc()
+        return JsonResponse({'success': False, 'error': str(e)}, status=e.status)
+    except Exception as e:
+        metrics.REDEMPTIONS.labels('error').inc()
         return JsonResponse({
             'success': False,
-            'error': 'You have already redeemed this reward. Each reward can only be redeemed once.'
-        }, status=400)
+            'error': f'Redemption failed: {str(e)}'
+        }, status=500)
+    finally:
+        metrics.REDEEM_SECONDS.observe(time.perf_counter() - start)
+    
+    metrics.REDEMPTIONS.labels('redeemed').inc()
+    return JsonResponse({
+        'success': True,
+        'message': f'Successfully redeemed {reward.name}!',
+        'new_balance': user.key_balance,
+        'code': code,
+    })
+
+
+@require_http_methods(["POST"])
+@discord_login_required
+async def drop_queue(request, reward_id):
+    """
+    Join, or poll, the waiting room of a scheduled drop.
+
+    Returns the member's position and, once admitted, the token to send as
+    ``X-Admission-Token`` when redeeming. Until then ``retry_after`` (also
+    the Retry-After header) says when to poll again, posting back the
+    returned ``ticket`` to keep the place. No database work once the drop
+    schedule is cached.
+    """
+    user = await request.adiscord_user()
+    available_from = (await catalog.aget_drops()).get(reward_id)
+    if available_from is None:
+        return JsonResponse({'success': False, 'error': 'This reward is not a scheduled drop.'}, status=404)
+    
+    place = await waitingroom.ajoin(reward_id, available_from, user.id, request.POST.get('ticket'))
+    response = JsonResponse({
+        'success': True,
+        'ticket': place.ticket_token,
+        'opens_at': available_from.isoformat(),
+        'position': place.position,
+        'admitted': place.token is not None,
+        'admission_token': place.token,
+        'retry_after': round(place.retry_after, 3),
+    })
+    if place.token is None:
+        response['Retry-After'] = str(max(math.ceil(place.retry_after), 1))
+    return response
+
+
+@require_http_methods(["GET"])
+@discord_login_required
+async def event_stream(request):
+    """
+    Live dashboard updates, as Server-Sent Events.
+
+    Streams ``balance``, ``redeemed``, ``stock`` and ``catalog`` events
+    (see rewards.events) until the browser goes away. Open streams hold no
+    thread or connection under discord_rewards.asgi; under WSGI each one
+    holds a worker.
+    """
+    user = await request.adiscord_user()
+    response = StreamingHttpResponse(
+        events.stream(user.id, asgi.client_disconnected(request)), content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Stops nginx from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _catalog_etag(request):
+    # Every catalog API response is a function of the URL and the catalog version.
+    return f'catalog-{catalog.get_catalog_version()}'
+
+
+def _catalog_response(data, status=200):
+    response = JsonResponse(data, status=status)
+    # The same for everyone, so CDNs can share it; revalidated on every use.
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+REWARD_FIELDS = {
+    'id': lambda reward: reward.id,
+    'name': lambda reward: reward.name,
+    'key_cost': lambda reward: reward.key_cost,
+    'category': lambda reward: reward.category and {
+        'id': reward.category.id, 'slug': reward.category.slug, 'name': reward.category.name,
+    },
+    'image': lambda reward: reward.image.url if reward.image else None,
+    'stock_limit': lambda reward: reward.stock_limit,
+    'available_from': lambda reward: reward.available_from and reward.available_from.isoformat(),
+}
+
+
+@require_http_methods(["GET"])
+@condition(etag_func=_catalog_etag)
+async def catalog_categories_api(request):
+    """Categories with active rewards, in display order"""
+    return _catalog_response({
+        'success': True,
+        'categories': [
+            {'id': category.id, 'slug': category.slug, 'name': category.name}
+            for category in await catalog.aget_categories()
+        ],
+    })
+
+
+@require_http_methods(["GET"])
+@condition(etag_func=_catalog_etag)
+async def catalog_rewards_api(request):
+    """
+    Active rewards, a page at a time, in (key_cost, name, id) order.
+
+    ``?category=`` (id or slug) filters, ``?fields=name,key_cost`` picks the
+    fields (``id`` is always included), ``?limit=`` sets the page size and
+    ``?cursor=`` is the previous page's ``next_cursor``. Answers 304 to a
+    matching If-None-Match without touching the database or the session.
+    Stock is live, so it isn't here: the dashboard gets it over the event stream.
+    """
+    try:
+        limit = min(max(int(request.GET.get('limit', catalog.PAGE_SIZE)), 1), catalog.MAX_PAGE_SIZE)
+    except ValueError:
+        return _catalog_response({'success': False, 'error': 'limit must be an integer.'}, status=400)
+    
+    fields = list(REWARD_FIELDS)
+    if request.GET.get('fields'):
+        fields = ['id'] + [field for field in request.GET['fields'].split(',') if field != 'id']
+        unknown = [field for field in fields if field not in REWARD_FIELDS]
+        if unknown:
+            return _catalog_response({
+                'success': False,
+                'error': f'Unknown fields: {", ".join(unknown)}. Choose from: {", ".join(REWARD_FIELDS)}.'
+            }, status=400)
+    
+    category = None
+    if request.GET.get('category'):
+        category = await catalog.afind_category(request.GET['category'])
+        if category is None:
+            return _catalog_response({'success': False, 'error': 'Unknown category.'}, status=404)
+    
+    try:
+        rewards, next_cursor = await catalog.aget_reward_page(category, request.GET.get('cursor'), limit)
+    except ValueError:
+        return _catalog_response({'success': False, 'error': 'Invalid cursor.'}, status=400)
     
-    # Check if user has enough keys
-    if user.key_balance < reward.key_cost:
+    return _catalog_response({
+        'success': True,
+        'rewards': [{field: REWARD_FIELDS[field](reward) for field in fields} for reward in rewards],
+        # Pass back as ?cursor= for the next page; null on the last one.
+        'next_cursor': next_cursor,
+    })
+
+
+async def leaderboard_api(request):
+    """Top users by a computed metric, plus the caller's own rank"""
+    metric = request.GET.get('metric', rankings.DEFAULT_METRIC)
+    if metric not in rankings.METRICS:
         return JsonResponse({
             'success': False,
-            'error': f'Insufficient keys. You need {reward.key_cost} keys but have {user.key_balance}.'
+            'error': f'Unknown metric. Choose one of: {", ".join(rankings.METRICS)}.'
         }, status=400)
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 100)
+    except ValueError:
+        limit = 10
+    
+    user = await request.adiscord_user()
     
-    # Atomic transaction to deduct keys and log redemption
+    return JsonResponse({
+        'success': True,
+        'metric': metric,
+        'top': await rankings.atop(metric, limit),
+        'me': await rankings.arank_of(user.id, metric) if user else None,
+    })
+
+
+@discord_login_required
+async def key_history_api(request):
+    """The logged-in user's key transactions, newest first, a page at a time"""
+    user = await request.adiscord_user()
     try:
-        with transaction.atomic():
-            # Deduct keys
-            user.key_balance -= reward.key_cost
-            user.save()
-            
-            # Log redemption
-            RedemptionLog.objects.create(
-                user=user,
-                reward=reward
-            )
-        
-        # Send email notification to admin
-        send_redemption_notification_to_admin(user=user, reward=reward)
-        
-        return JsonResponse({
-            'success': True,
-            'message': f'Successfully redeemed {reward.name}!',
-            'new_balance': user.key_balance
-        })
+        before = int(request.GET['before']) if request.GET.get('before') else None
+        limit = min(max(int(request.GET.get('limit', ledger.HISTORY_PAGE_SIZE)), 1), 100)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'before and limit must be integers.'}, status=400)
     
-    except Exception as e:
+    transactions = [
+        {'id': tx.id, 'kind': tx.kind, 'amount': tx.amount, 'created_at': tx.created_at.isoformat()}
+        async for tx in ledger.history(user.id, before, limit).only('id', 'kind', 'amount', 'created_at')
+    ]
+    
+    return JsonResponse({
+        'success': True,
+        'balance': user.key_balance,
+        'transactions': transactions,
+        # Pass back as ?before= for the next page.
+        'next_before': transactions[-1]['id'] if len(transactions) == limit else None,
+    })
+
+
+def _bearer_token_ok(request, token):
+    scheme, _, supplied = request.headers.get('Authorization', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and secrets.compare_digest(supplied.strip(), token)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def grant_keys_api(request):
+    """
+    Bulk-grant keys from a CSV or JSON Lines request body.
+
+    Authenticated with ``Authorization: Bearer <KEY_GRANT_API_TOKEN>``;
+    ``?batch_id=`` makes retries safe, ``?format=csv|jsonl`` (or the
+    Content-Type) picks the parser. The body is read line by line rather
+    than loaded whole, so this is a sync view: grants run as one
+    transaction per chunk on the request thread.
+    """
+    if not _bearer_token_ok(request, settings.KEY_GRANT_API_TOKEN):
+        return JsonResponse({'success': False, 'error': 'Not authenticated'}, status=401)
+
+    batch_id = request.GET.get('batch_id', '').strip()
+    if not batch_id or len(batch_id) > 100:
+        return JsonResponse({'success': False, 'error': 'batch_id is required (max 100 characters).'}, status=400)
+    fmt = request.GET.get('format') or ('jsonl' if 'json' in request.content_type else 'csv')
+    if fmt not in grants.FORMATS:
+        return JsonResponse({'success': False, 'error': f'Unknown format. Choose one of: {", ".join(grants.FORMATS)}.'}, status=400)
+
+    rows = grants.parse(codecs.iterdecode(request, request.encoding or 'utf-8'), fmt)
+    try:
+        result = grants.apply_grants(rows, batch_id)
+    except (grants.GrantFormatError, UnicodeDecodeError) as e:
         return JsonResponse({
             'success': False,
-            'error': f'Redemption failed: {str(e)}'
-        }, status=500)
+            'error': f'Invalid grant file, {e}. Rows before it were applied; re-send with the same batch_id to resume.',
+        }, status=400)
+
+    return JsonResponse({
+        'success': True,
+        'batch_id': batch_id,
+        'already_applied': result.already_applied,
+        'rows': result.rows,
+        'keys': result.keys,
+        'total_rows': result.batch.rows_applied,
+        'total_keys': result.batch.keys_granted,
+        'seconds': round(result.seconds, 3),
+        'rows_per_second': round(result.rows_per_second),
+    })
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def activity_api(request):
+    """
+    Accept a batch of activity events from the bot.
+
+    The body is a JSON list of ``{"discord_id", "type", "count"}`` objects
+    (or ``{"events": [...]}``), authenticated like the grant API with
+    ``Authorization: Bearer <ACTIVITY_API_TOKEN>``. Keys are credited in
+    bulk when the current window flushes; a full queue answers 503.
+    """
+    if not _bearer_token_ok(request, settings.ACTIVITY_API_TOKEN):
+        return JsonResponse({'success': False, 'error': 'Not authenticated'}, status=401)
+    
+    try:
+        payload = json.loads(request.body)
+        items = payload.get('events') if isinstance(payload, dict) else payload
+        awards = activity.parse_events(items)
+    except (ValueError, activity.ActivityError) as e:
+        return JsonResponse({'success': False, 'error': f'Invalid activity batch: {e}'}, status=400)
+    
+    if awards and not activity.get_aggregator().submit(awards):
+        response = JsonResponse({'success': False, 'error': 'Busy, retry later.'}, status=503)
+        response['Retry-After'] = '1'
+        return response
+    
+    return JsonResponse({'success': True, 'events': len(items), 'awards': len(awards)}, status=202)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def award_webhook(request):
+    """
+    Apply a signed batch of key awards from the bot.
+
+    See ``rewards.webhooks`` for the signature scheme. Events whose id was
+    already applied are skipped, so the bot can safely retry a whole batch.
+    """
+    if not webhooks.verify(
+        settings.AWARD_WEBHOOK_SECRET,
+        request.headers.get('X-Award-Timestamp'),
+        request.body,
+        request.headers.get('X-Award-Signature'),
+    ):
+        return JsonResponse({'success': False, 'error': 'Invalid signature'}, status=401)
+    
+    try:
+        payload = json.loads(request.body)
+        awards = webhooks.parse_awards(payload.get('events') if isinstance(payload, dict) else payload)
+    except (ValueError, webhooks.WebhookError) as e:
+        return JsonResponse({'success': False, 'error': f'Invalid award batch: {e}'}, status=400)
+    
+    # The batch must run in one transaction on one sync connection.
+    applied, keys = await sync_to_async(webhooks.apply_awards)(awards)
+    
+    return JsonResponse({
+        'success': True,
+        'received': len(awards),
+        'applied': applied,
+        'duplicates': len(awards) - applied,
+        'keys': keys,
+    })
+
+
+@require_http_methods(["GET"])
+def prometheus_metrics(request):
+    """
+    Counters and histograms from ``rewards.metrics`` for Prometheus to scrape.
+
+    Authenticated with ``Authorization: Bearer <METRICS_API_TOKEN>`` (the
+    scrape config's ``authorization`` block); disabled unless it is set.
+    """
+    if not _bearer_token_ok(request, settings.METRICS_API_TOKEN):
+        return JsonResponse({'success': False, 'error': 'Not authenticated'}, status=401)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
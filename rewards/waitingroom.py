@@ -0,0 +1,127 @@
+"""
+Waiting room for scheduled reward drops.
+
+A reward with ``available_from`` is a drop. Members join its queue through
+the queue API and get a ticket: a number taken from a counter in the cache,
+handed back signed so that polls carry their own place in the queue and
+need no per-member state. Nothing runs in the background: admission is
+arithmetic on the clock, DROP_ADMISSION_BURST tickets when the drop opens
+and DROP_ADMISSION_RATE more per second after that, so joining costs one
+cache increment and polling none. An admitted member gets a signed
+admission token, and the redeem API refuses drop redemptions without a
+valid one, so redemptions reach the database at the admission rate however
+many people arrive at once.
+
+The counter is keyed by the drop's opening time, so rescheduling a drop
+starts a fresh queue. With locmem every process counts on its own; use a
+shared cache backend when running several.
+"""
+
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+
+from .instrumentation import off_loop
+
+TICKET_SALT = 'rewards.waitingroom.ticket'
+TOKEN_SALT = 'rewards.waitingroom'
+
+
+@dataclass
+class Place:
+    ticket: int
+    # Signed ticket to send back when polling, so the place is kept.
+    ticket_token: str
+    # Tickets still waiting up to and including this one; 0 once admitted.
+    position: int
+    token: str | None
+    # Seconds until the next poll is worth making.
+    retry_after: float
+
+
+def _counter_key(reward_id, opens):
+    return f'rewards:drop:{reward_id}:{int(opens)}:tickets'
+
+
+def admitted(opens, now):
+    """How many tickets are admitted at ``now`` to a drop opening at ``opens`` (timestamps)."""
+    if now < opens:
+        return 0
+    rate = settings.DROP_ADMISSION_RATE
+    if rate <= 0:
+        return float('inf')
+    return settings.DROP_ADMISSION_BURST + int((now - opens) * rate)
+
+
+def _admitted_at(opens, ticket):
+    rate = settings.DROP_ADMISSION_RATE
+    if rate <= 0:
+        return opens
+    return opens + max(ticket - settings.DROP_ADMISSION_BURST, 0) / rate
+
+
+def _read_ticket(ticket_token, user_id, reward_id, opens):
+    try:
+        payload = signing.loads(ticket_token, salt=TICKET_SALT, max_age=settings.DROP_QUEUE_TIMEOUT)
+    except signing.BadSignature:
+        return None
+    member, drop, drop_opens, ticket = payload
+    return ticket if [member, drop, drop_opens] == [user_id, reward_id, int(opens)] else None
+
+
+def _take_ticket(reward_id, user_id, opens):
+    counter = _counter_key(reward_id, opens)
+    cache.add(counter, 0, settings.DROP_QUEUE_TIMEOUT)
+    ticket = cache.incr(counter)
+    return ticket, signing.dumps([user_id, reward_id, int(opens), ticket], salt=TICKET_SALT)
+
+
+def _place(reward_id, user_id, opens, ticket, ticket_token, now):
+    allowed = admitted(opens, now)
+    if ticket <= allowed:
+        return Place(ticket, ticket_token, 0, issue_token(user_id, reward_id), 0.0)
+    wait = _admitted_at(opens, ticket) - now
+    return Place(ticket, ticket_token, ticket - allowed, None, min(wait, settings.DROP_POLL_SECONDS))
+
+
+def join(reward_id, available_from, user_id, ticket_token=None, now=None):
+    """
+    The member's Place in the queue for the drop.
+
+    Pass the ``ticket_token`` of an earlier Place to poll it; without a valid
+    one the member joins at the back.
+    """
+    now = time.time() if now is None else now
+    opens = available_from.timestamp()
+    ticket = _read_ticket(ticket_token, user_id, reward_id, opens) if ticket_token else None
+    if ticket is None:
+        ticket, ticket_token = _take_ticket(reward_id, user_id, opens)
+    return _place(reward_id, user_id, opens, ticket, ticket_token, now)
+
+
+async def ajoin(reward_id, available_from, user_id, ticket_token=None, now=None):
+    # Only joining touches the cache, so polls never leave the event loop.
+    now = time.time() if now is None else now
+    opens = available_from.timestamp()
+    ticket = _read_ticket(ticket_token, user_id, reward_id, opens) if ticket_token else None
+    if ticket is None:
+        ticket, ticket_token = await off_loop(_take_ticket)(reward_id, user_id, opens)
+    return _place(reward_id, user_id, opens, ticket, ticket_token, now)
+
+
+def issue_token(user_id, reward_id):
+    return signing.dumps([user_id, reward_id], salt=TOKEN_SALT)
+
+
+def check_token(token, user_id, reward_id):
+    """True if ``token`` admits this user to this drop and has not expired."""
+    if not token:
+        return False
+    try:
+        payload = signing.loads(token, salt=TOKEN_SALT, max_age=settings.DROP_ADMISSION_TTL)
+    except signing.BadSignature:
+        return False
+    return payload == [user_id, reward_id]
@@ -0,0 +1,128 @@
+"""
+Signed webhook for key awards pushed by the Discord bot.
+
+The bot POSTs a JSON array of ``{"id", "discord_id", "amount"}`` award
+events to /api/webhooks/awards/, so one call can carry hundreds of awards.
+Requests are signed with HMAC-SHA256 over ``"<timestamp>.<body>"`` using
+AWARD_WEBHOOK_SECRET and sent with ``X-Award-Timestamp`` and
+``X-Award-Signature: sha256=<hex>`` headers; stale timestamps are refused so
+a captured request can't be replayed later.
+
+Redelivered events are dropped by id. Each applied id is stored as a 64-bit
+hash in ``ProcessedAwardEvent`` for AWARD_WEBHOOK_DEDUPE_WINDOW seconds;
+a batch costs one indexed lookup for all its ids, one INSERT of the new
+ones and one ``grants.credit`` for the lot, in a single transaction.
+"""
+
+import hashlib
+import hmac
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import grants
+from .models import KeyTransaction, ProcessedAwardEvent
+
+SIGNATURE_PREFIX = 'sha256='
+# Expired ids are pruned at most this often per process.
+PRUNE_INTERVAL = 60
+
+_last_prune = 0.0
+
+
+class WebhookError(ValueError):
+    """The webhook request was malformed."""
+
+
+def sign(secret, timestamp, body):
+    """The ``X-Award-Signature`` value for a request body sent at ``timestamp``."""
+    message = f'{timestamp}.'.encode() + body
+    return SIGNATURE_PREFIX + hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def verify(secret, timestamp, body, signature, now=None):
+    """True if the signature matches and the timestamp is within AWARD_WEBHOOK_TOLERANCE."""
+    if not secret or not timestamp or not signature:
+        return False
+    try:
+        age = abs((now or time.time()) - int(timestamp))
+    except ValueError:
+        return False
+    if age > settings.AWARD_WEBHOOK_TOLERANCE:
+        return False
+    return hmac.compare_digest(sign(secret, timestamp, body), signature)
+
+
+def event_key(event_id):
+    """A signed 64-bit hash of a sender's event id, as stored in ProcessedAwardEvent."""
+    digest = hashlib.blake2b(event_id.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def parse_awards(events):
+    """Validate a batch; returns ``(event_id, discord_id, amount)`` tuples."""
+    if not isinstance(events, list):
+        raise WebhookError('expected a list of award events')
+    if len(events) > settings.AWARD_WEBHOOK_MAX_EVENTS:
+        raise WebhookError(f'at most {settings.AWARD_WEBHOOK_MAX_EVENTS} events per request')
+    awards = []
+    for index, event in enumerate(events):
+        try:
+            event_id, discord_id, amount = str(event['id']), str(event['discord_id']).strip(), event['amount']
+        except (KeyError, TypeError):
+            raise WebhookError(f'event {index}: expected id, discord_id and amount')
+        if not event_id or not discord_id or len(discord_id) > 20:
+            raise WebhookError(f'event {index}: invalid id or discord_id')
+        if not isinstance(amount, int) or isinstance(amount, bool) or amount <= 0:
+            raise WebhookError(f'event {index}: amount must be a positive integer')
+        if amount > grants.MAX_AMOUNT:
+            raise WebhookError(f'event {index}: amount must be at most {grants.MAX_AMOUNT}')
+        awards.append((event_id, discord_id, amount))
+    return awards
+
+
+def _prune():
+    global _last_prune
+    now = time.monotonic()
+    if now - _last_prune < PRUNE_INTERVAL:
+        return
+    _last_prune = now
+    cutoff = timezone.now() - timedelta(seconds=settings.AWARD_WEBHOOK_DEDUPE_WINDOW)
+    ProcessedAwardEvent.objects.filter(received_at__lt=cutoff).delete()
+
+
+def _apply(awards):
+    keyed = {}
+    for event_id, discord_id, amount in awards:
+        # A repeated id within the batch counts once, like a redelivery.
+        keyed.setdefault(event_key(event_id), (discord_id, amount))
+
+    with transaction.atomic():
+        seen = set(ProcessedAwardEvent.objects.filter(id__in=list(keyed)).values_list('id', flat=True))
+        new = {key: award for key, award in keyed.items() if key not in seen}
+        if not new:
+            return 0, 0
+        ProcessedAwardEvent.objects.bulk_create([ProcessedAwardEvent(id=key) for key in new])
+        totals = {}
+        for discord_id, amount in new.values():
+            totals[discord_id] = totals.get(discord_id, 0) + amount
+        grants.credit(totals, KeyTransaction.KIND_GRANT, 'award webhook')
+    return len(new), sum(totals.values())
+
+
+def apply_awards(awards):
+    """
+    Apply a batch of awards, skipping ids already applied.
+
+    Returns ``(applied, keys)``. If a concurrent delivery of the same events
+    commits first, the INSERT conflicts, the whole batch rolls back and is
+    retried once against the now-visible ids.
+    """
+    _prune()
+    try:
+        return _apply(awards)
+    except IntegrityError:
+        return _apply(awards)